@@ -1,71 +1,337 @@
+import asyncio
+import concurrent.futures
+import contextvars
 import time
 import json
 import paho.mqtt.client as mqtt
 from queue import Queue
+from utils import log, metrics, tracing
+
+logger = log.get_logger("DataCollectionAgent")
+# Share of messages logged at INFO (LOG_SAMPLE=mqtt.message=0.01); payloads are only logged at DEBUG
+log_message = log.sampler("mqtt.message")
+
+MESSAGES_RECEIVED = metrics.counter(
+    "mqtt_messages_received_total", "MQTT messages received by DataCollectionAgent", ["topic"])
+DECODE_FAILURES = metrics.counter(
+    "mqtt_decode_failures_total", "MQTT payloads that were not valid UTF-8 JSON", ["topic"])
+LISTENER_ERRORS = metrics.counter(
+    "mqtt_listener_errors_total", "Exceptions raised by DataCollectionAgent listeners")
+MESSAGE_SECONDS = metrics.histogram(
+    "mqtt_message_handling_seconds", "Time to decode a message and run all listeners")
+MESSAGES_IN_FLIGHT = metrics.gauge(
+    "mqtt_messages_in_flight", "Messages being handled by asyncio-mode listeners")
+
+# Topics per SUBSCRIBE packet when subscribing to many topics
+SUBSCRIBE_BATCH = 500
+
+
+class _TpoolExecutor(concurrent.futures.Executor):
+    """
+    Executor for eventlet-patched processes. Threads are green there, so the
+    loop's default executor would run blocking listeners on the event loop's own
+    OS thread; eventlet.tpool runs them on real OS threads instead.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        import eventlet
+        from eventlet import tpool
+
+        future = concurrent.futures.Future()
+
+        def run():
+            try:
+                future.set_result(tpool.execute(fn, *args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+        eventlet.spawn_n(run)
+        return future
+
+
+def _default_executor():
+    """
+    The executor for blocking listeners: eventlet's OS thread pool if threads are
+    monkey-patched, otherwise None (the loop's default ThreadPoolExecutor).
+    """
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return None
+    if patcher.is_monkey_patched("thread"):
+        return _TpoolExecutor()
+    return None
+
+
+class _AsyncioMQTT:
+    """
+    Drives a paho client from an asyncio event loop through paho's external-loop
+    socket hooks: the loop watches the socket and calls loop_read / loop_write
+    when it is ready, and loop_misc (keepalive, retries) runs once a second.
+    """
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.sock = None
+        self.misc = None
+        self.paused = False
+        self.closed = asyncio.Event()
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock):
+        self.sock = sock
+        self.paused = False
+        self.closed.clear()
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        self.sock = None
+        self.closed.set()
+        if self.misc is not None:
+            self.misc.cancel()
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    def pause_reading(self):
+        """Stop reading from the broker (backpressure: TCP flow control slows it down)."""
+        if self.sock is not None and not self.paused:
+            self.loop.remove_reader(self.sock)
+            self.paused = True
+
+    def resume_reading(self):
+        if self.sock is not None and self.paused:
+            self.loop.add_reader(self.sock, self.client.loop_read)
+            self.paused = False
+
+    async def misc_loop(self):
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
 
 class DataCollectionAgent:
-    def __init__(self, broker_host, broker_port, topic, data_queue: Queue):
+    """
+    Receives sensor data over MQTT and hands it to the listeners.
+
+    run() blocks in paho's network loop and calls the listeners one message at a
+    time. run_async() drives the client from an asyncio event loop instead:
+    every message is handled in its own task, coroutine listeners are awaited,
+    listeners registered with ``blocking=True`` (CPU-heavy ones like forecasting)
+    run in an executor, and the other listeners are called directly on the loop.
+    """
+
+    def __init__(self, broker_host, broker_port, topic, data_queue: Queue, executor=None, max_in_flight=1000):
         """
         :param broker_host: MQTT broker host address
         :param broker_port: MQTT broker port
-        :param topic: MQTT topic on which sensor data is published
+        :param topic: MQTT topic on which sensor data is published, or a list of topics
         :param data_queue: A multiprocessing or threading Queue for sending data to other agents
+        :param executor: Executor for blocking listeners in asyncio mode (default: the loop's default
+                         executor, or eventlet.tpool when the process is monkey-patched)
+        :param max_in_flight: In asyncio mode, stop reading from the broker while this many
+                              messages are still being handled
         """
         self.broker_host = broker_host
         self.broker_port = broker_port
         self.topic = topic
+        self.topics = [topic] if isinstance(topic, str) else list(topic)
         self.data_queue = data_queue
+        self.executor = executor
+        self.max_in_flight = max_in_flight
 
         # List to hold additional listeners (callbacks)
         self.listeners = []
+        # Listeners run in the executor in asyncio mode
+        self.blocking_listeners = set()
+        # listener -> topics it receives (listeners without an entry receive every topic)
+        self.listener_topics = {}
+
+        # asyncio mode state (see run_async)
+        self.loop = None
+        self.mqtt_loop = None
+        self.in_flight = set()
+        self.stopped = None
+        MESSAGES_IN_FLIGHT.set_function(lambda: len(self.in_flight))
 
         # Set up MQTT client
         self.client = mqtt.Client()
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
 
-    def add_listener(self, callback):
+    def add_listener(self, callback, blocking=False, topics=None):
         """
         Register a listener callback that will be executed when a message is received.
-        
-        :param callback: A function that accepts a single argument (the data dictionary).
+
+        :param callback: A function or coroutine function that accepts a single argument (the data dictionary).
+        :param blocking: The callback is CPU-heavy or blocks; in asyncio mode it runs in the executor.
+        :param topics: Optional topic or list of topics the callback receives (default: all of them).
         """
         self.listeners.append(callback)
-        print(f"[DataCollectionAgent] Listener {callback.__name__} added.")
+        if blocking:
+            self.blocking_listeners.add(callback)
+        if topics is not None:
+            self.listener_topics[callback] = {topics} if isinstance(topics, str) else set(topics)
+        logger.info("Listener %s added.", callback.__name__)
 
     def on_connect(self, client, userdata, flags, rc):
         """Callback when the client connects to the broker."""
         if rc == 0:
-            print("[DataCollectionAgent] Connected to MQTT Broker!")
-            client.subscribe(self.topic)
-            print(f"[DataCollectionAgent] Subscribed to topic: {self.topic}")
+            logger.info("Connected to MQTT Broker!")
+            for i in range(0, len(self.topics), SUBSCRIBE_BATCH):
+                client.subscribe([(topic, 0) for topic in self.topics[i:i + SUBSCRIBE_BATCH]])
+            if len(self.topics) == 1:
+                logger.info("Subscribed to topic: %s", self.topics[0])
+            else:
+                logger.info("Subscribed to %d topics", len(self.topics))
         else:
-            print(f"[DataCollectionAgent] Connection failed with code {rc}")
+            logger.error("Connection failed with code %s", rc)
 
-    def on_message(self, client, userdata, msg):
-        """Callback when a message is received on the subscribed topic."""
+    def _decode(self, msg):
+        """:return: The decoded message, or None if it is not valid UTF-8 JSON."""
         try:
-            payload_str = msg.payload.decode("utf-8")
-            data = json.loads(payload_str)
-            # Publish to the shared queue so other agents can consume
-            self.data_queue.put(data)
-            print(f"[DataCollectionAgent] Received MQTT data: {data}")
-
-            # Execute any additional listener callbacks
-            for listener in self.listeners:
-                try:
-                    listener(data)
-                except Exception as e:
-                    print(f"[DataCollectionAgent] Error executing listener {listener.__name__}: {e}")
+            with tracing.span("json.decode"):
+                payload_str = msg.payload.decode("utf-8")
+                data = json.loads(payload_str)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            DECODE_FAILURES.labels(msg.topic).inc()
+            logger.warning("JSON Decode Error: %s", e, extra={"topic": msg.topic})
+            return None
+        # Publish to the shared queue so other agents can consume
+        self.data_queue.put(data)
+        if log_message():
+            logger.info("Received MQTT data", extra={"topic": msg.topic, "bytes": len(msg.payload)})
+        logger.debug("Payload: %s", data)
+        return data
 
-        except json.JSONDecodeError as e:
-            print(f"[DataCollectionAgent] JSON Decode Error: {e}")
+    def _listeners_for(self, topic):
+        return [listener for listener in self.listeners
+                if topic in self.listener_topics.get(listener, (topic,))]
+
+    def on_message(self, client, userdata, msg):
+        """Callback when a message is received on the subscribed topic."""
+        MESSAGES_RECEIVED.labels(msg.topic).inc()
+        if self.loop is not None:
+            self._start_task(msg)
+            return
+        start = time.perf_counter()
+        # Opt-in trace of this message through the listeners (see utils.tracing)
+        with tracing.trace("mqtt.message", topic=msg.topic, payload_bytes=len(msg.payload)):
+            data = self._decode(msg)
+            if data is not None:
+                # Execute any additional listener callbacks
+                for listener in self._listeners_for(msg.topic):
+                    try:
+                        with tracing.span("listener", listener=listener.__name__):
+                            if asyncio.iscoroutinefunction(listener):
+                                asyncio.run(listener(data))
+                            else:
+                                listener(data)
+                    except Exception as e:
+                        LISTENER_ERRORS.inc()
+                        logger.exception("Error executing listener %s: %s", listener.__name__, e)
+        MESSAGE_SECONDS.observe(time.perf_counter() - start)
 
     def run(self):
         """
         Connect to MQTT broker and keep listening for incoming messages.
         This will block (loop_forever) until the process is killed.
+        Coroutine listeners are run to completion one at a time; use run_async() to run them concurrently.
         """
         self.client.connect(self.broker_host, self.broker_port, keepalive=60)
-        print(f"[DataCollectionAgent] Connecting to MQTT broker at {self.broker_host}:{self.broker_port}")
+        logger.info("Connecting to MQTT broker at %s:%s", self.broker_host, self.broker_port)
         self.client.loop_forever()
+
+    # ---------- asyncio mode ----------
+
+    def _start_task(self, msg):
+        task = self.loop.create_task(self._handle_async(msg))
+        self.in_flight.add(task)
+        task.add_done_callback(self._task_done)
+        if len(self.in_flight) >= self.max_in_flight:
+            self.mqtt_loop.pause_reading()
+
+    def _task_done(self, task):
+        self.in_flight.discard(task)
+        if len(self.in_flight) < self.max_in_flight // 2 or not self.in_flight:
+            self.mqtt_loop.resume_reading()
+
+    async def _handle_async(self, msg):
+        start = time.perf_counter()
+        with tracing.trace("mqtt.message", topic=msg.topic, payload_bytes=len(msg.payload)):
+            data = self._decode(msg)
+            if data is not None:
+                await asyncio.gather(*(self._call_listener(listener, data) for listener in self._listeners_for(msg.topic)))
+        MESSAGE_SECONDS.observe(time.perf_counter() - start)
+
+    async def _call_listener(self, listener, data):
+        try:
+            with tracing.span("listener", listener=listener.__name__):
+                if asyncio.iscoroutinefunction(listener):
+                    await listener(data)
+                elif listener in self.blocking_listeners:
+                    # The worker thread gets a copy of the context, so the listener's spans join this trace
+                    ctx = contextvars.copy_context()
+                    await self.loop.run_in_executor(self.executor, ctx.run, listener, data)
+                else:
+                    listener(data)
+        except Exception as e:
+            LISTENER_ERRORS.inc()
+            logger.exception("Error executing listener %s: %s", listener.__name__, e)
+
+    async def run_async(self, reconnect_delay=1.0, max_reconnect_delay=60.0):
+        """
+        Connect to the MQTT broker and handle messages on the running event loop until stop() is called.
+        Reconnects with exponential backoff when the connection drops.
+        :param reconnect_delay: First delay in seconds before reconnecting.
+        :param max_reconnect_delay: Upper bound of the reconnect delay.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        if self.executor is None:
+            # Checked here rather than in __init__: the monkey patch may come after construction
+            self.executor = _default_executor()
+        self.mqtt_loop = _AsyncioMQTT(self.loop, self.client)
+        delay = reconnect_delay
+        try:
+            while not self.stopped.is_set():
+                logger.info("Connecting to MQTT broker at %s:%s", self.broker_host, self.broker_port)
+                try:
+                    # Opens the socket, which registers it with the loop through the socket hooks
+                    self.client.connect(self.broker_host, self.broker_port, keepalive=60)
+                except OSError as e:
+                    logger.error("Connection failed: %s", e)
+                else:
+                    delay = reconnect_delay
+                    stop = asyncio.ensure_future(self.stopped.wait())
+                    await asyncio.wait([stop, self.mqtt_loop.misc], return_when=asyncio.FIRST_COMPLETED)
+                    stop.cancel()
+                    if self.stopped.is_set():
+                        break
+                    logger.warning("Connection to MQTT broker lost")
+                await asyncio.wait([asyncio.ensure_future(self.stopped.wait())], timeout=delay)
+                delay = min(delay * 2, max_reconnect_delay)
+        finally:
+            if self.client.socket() is not None:
+                # The DISCONNECT packet is written by the loop, which then closes the socket
+                self.client.disconnect()
+                try:
+                    await asyncio.wait_for(self.mqtt_loop.closed.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    logger.warning("MQTT connection did not close cleanly")
+            if self.in_flight:
+                await asyncio.gather(*self.in_flight, return_exceptions=True)
+            self.loop = None
+
+    def stop(self):
+        """Stop run_async() (call from the event loop's thread)."""
+        if self.stopped is not None:
+            self.stopped.set()
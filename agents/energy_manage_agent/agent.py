@@ -1,5 +1,119 @@
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from sklearn.cluster import KMeans
+from utils import metrics
+
+KMEANS_FIT_SECONDS = metrics.histogram(
+    "ems_kmeans_fit_seconds", "Duration of a per-home KMeans priority fit")
+
+PRIORITY_LABELS = {1: 'High', 2: 'Medium', 3: 'Low'}
+
+
+def _dense_rank(values, present, descending=False):
+    """
+    Dense rank along the last axis, ignoring entries where present is False.
+    Equivalent to pandas rank(method='dense') over the present values.
+    """
+    k = values.shape[-1]
+    same = values[..., :, None] == values[..., None, :]
+    # Keep only the first occurrence of each distinct present value
+    earlier = np.tril(np.ones((k, k), dtype=bool), -1)
+    duplicate = (same & earlier & present[..., None, :]).any(axis=-1)
+    distinct = present & ~duplicate
+    if descending:
+        ahead = values[..., None, :] > values[..., :, None]
+    else:
+        ahead = values[..., None, :] < values[..., :, None]
+    return 1 + (ahead & distinct[..., None, :]).sum(axis=-1)
+
+
+def _lloyd(points, mask, centers, max_iter):
+    n_clusters = centers.shape[1]
+    labels = None
+    for _ in range(max_iter):
+        dist = ((points[:, :, None, :] - centers[:, None, :, :]) ** 2).sum(axis=-1)
+        new_labels = dist.argmin(axis=-1)
+        if labels is not None and np.array_equal(new_labels[mask], labels[mask]):
+            break
+        labels = new_labels
+        onehot = (labels[..., None] == np.arange(n_clusters)) & mask[..., None]
+        sizes = onehot.sum(axis=1)
+        sums = np.einsum('hak,haf->hkf', onehot.astype(points.dtype), points)
+        # Empty clusters keep their previous center
+        centers = np.where(sizes[..., None] > 0, sums / np.maximum(sizes, 1)[..., None], centers)
+    dist = ((points[:, :, None, :] - centers[:, None, :, :]) ** 2).sum(axis=-1)
+    labels = dist.argmin(axis=-1)
+    inertia = np.where(mask, dist.min(axis=-1), 0).sum(axis=1)
+    return labels, centers, inertia
+
+
+def batch_kmeans(points, mask, n_clusters=3, n_init=4, max_iter=100, random_state=42):
+    """
+    Run Lloyd's k-means independently for every home in one vectorized pass.
+
+    The first initialisation spreads the centers over each home's points ordered by
+    their summed min-max scaled features; the others pick random distinct points.
+    Per home, the run with the lowest inertia is kept.
+
+    :param points: Array (homes, appliances, features), padded where mask is False.
+    :param mask: Bool array (homes, appliances) marking real appliances.
+    :param n_clusters: Number of clusters per home.
+    :param n_init: Number of initialisations.
+    :param max_iter: Maximum Lloyd iterations per initialisation.
+    :param random_state: Seed for the random initialisations.
+    :return: (labels (homes, appliances), centers (homes, n_clusters, features)).
+    """
+    rng = np.random.default_rng(random_state)
+    lo = np.where(mask[..., None], points, np.inf).min(axis=1, keepdims=True)
+    hi = np.where(mask[..., None], points, -np.inf).max(axis=1, keepdims=True)
+    scaled = (points - lo) / np.where(hi > lo, hi - lo, 1.0)
+    counts = np.maximum(mask.sum(axis=1), 1)
+
+    best = None
+    for run in range(n_init):
+        if run == 0:
+            score = np.where(mask, np.nan_to_num(scaled).sum(axis=-1), np.inf)
+            positions = np.linspace(0, 1, n_clusters)[None, :] * (counts - 1)[:, None]
+        else:
+            # Random keys put the real appliances first in a random order
+            score = np.where(mask, rng.random(mask.shape), np.inf)
+            positions = np.arange(n_clusters)[None, :] % counts[:, None]
+        order = np.argsort(score, axis=1, kind='stable')
+        init_idx = np.take_along_axis(order, np.round(positions).astype(int), axis=1)
+        centers = np.take_along_axis(points, init_idx[..., None], axis=1)
+
+        labels, centers, inertia = _lloyd(points, mask, centers, max_iter)
+        if best is None:
+            best = [labels, centers, inertia]
+            continue
+        better = inertia < best[2] - 1e-12
+        best[0] = np.where(better[:, None], labels, best[0])
+        best[1] = np.where(better[:, None, None], centers, best[1])
+        best[2] = np.where(better, inertia, best[2])
+    return best[0], best[1]
+
+
+def _prioritize_padded(points, mask, n_clusters=3):
+    """
+    Cluster a padded (homes, appliances, 2) array and map clusters to priority levels
+    exactly like prioritize_appliances does for a single home.
+    :return: Int array (homes, appliances) with 1=High, 2=Medium, 3=Low.
+    """
+    labels, _ = batch_kmeans(points, mask, n_clusters)
+    onehot = (labels[..., None] == np.arange(n_clusters)) & mask[..., None]
+    sizes = onehot.sum(axis=1)
+    present = sizes > 0
+    means = np.einsum('hak,haf->hkf', onehot.astype(points.dtype), points) / np.maximum(sizes, 1)[..., None]
+
+    # Rank each feature's cluster means (highest -> 1), average the ranks,
+    # then dense-rank the averages into priority levels.
+    feature_ranks = np.stack(
+        [_dense_rank(means[..., f], present, descending=True) for f in range(points.shape[-1])], axis=-1
+    )
+    priority_rank = feature_ranks.mean(axis=-1)
+    levels = _dense_rank(priority_rank, present)
+    return np.take_along_axis(levels, labels, axis=1)
 
 class BehavioralSegmentationAgent:
     def __init__(self, data_path=None):
@@ -14,6 +128,10 @@ class BehavioralSegmentationAgent:
             self.data = pd.DataFrame(columns=['appliance', 'usage', 'usage_count'])
 
         self.appliance_priority = {}
+        # Version of the usage data the current priorities were computed from
+        self.data_version = None
+        # Centroids of the last fit, reused to warm-start the next one
+        self.cluster_centers = None
 
     def update_data(self, new_data):
         """
@@ -33,9 +151,18 @@ class BehavioralSegmentationAgent:
         if 'usage' not in self.data.columns or 'usage_count' not in self.data.columns:
             raise ValueError("The dataset must contain 'usage' and 'usage_count' columns.")
 
-        # Perform KMeans clustering
-        kmeans = KMeans(n_clusters=3, random_state=42)
-        self.data['cluster'] = kmeans.fit_predict(self.data[['usage', 'usage_count']])
+        # Homes with fewer than 3 appliances get one cluster per appliance (like prioritize_batch)
+        n_clusters = min(3, len(self.data))
+        # Perform KMeans clustering, warm-started from the previous centroids when
+        # they are still distinct (usage only changes a little between refits)
+        if self.cluster_centers is not None and len(self.cluster_centers) == n_clusters \
+                and len(np.unique(self.cluster_centers, axis=0)) == n_clusters:
+            kmeans = KMeans(n_clusters=n_clusters, init=self.cluster_centers, n_init=1)
+        else:
+            kmeans = KMeans(n_clusters=n_clusters, random_state=42)
+        with KMEANS_FIT_SECONDS.time():
+            self.data['cluster'] = kmeans.fit_predict(self.data[['usage', 'usage_count']].to_numpy())
+        self.cluster_centers = kmeans.cluster_centers_
 
         # Map clusters to priorities
         # Cluster with the highest average usage and usage_count -> High Priority
@@ -52,6 +179,58 @@ class BehavioralSegmentationAgent:
         # Save the priority result in a dictionary for easier access
         self.appliance_priority = dict(zip(self.data['appliance'], self.data['priority']))
 
+    def refresh_priorities(self, new_data, version):
+        """
+        Recompute priorities only if the usage data changed since the last fit.
+        :param new_data: List of dictionaries with 'appliance', 'usage', and 'usage_count'.
+        :param version: Version counter of new_data, bumped by the caller on every change.
+        :return: True if KMeans was refitted, False if the cached priorities were kept.
+        """
+        if version == self.data_version and self.appliance_priority:
+            return False
+        self.update_data(new_data)
+        self.prioritize_appliances()
+        self.data_version = version
+        return True
+
+    def prioritize_batch(self, home_data, n_jobs=1, chunk_size=2048):
+        """
+        Assign priorities for many homes in one call, e.g. for a nightly fleet recomputation.
+        Usage data of all homes is packed into a padded (homes x appliances x 2) array and
+        clustered with a vectorized k-means instead of one sklearn fit per home.
+        :param home_data: Dict home_id -> list of dictionaries with 'appliance', 'usage', and 'usage_count'.
+        :param n_jobs: Number of worker processes; chunks of homes are spread across them.
+        :param chunk_size: Number of homes clustered per vectorized pass.
+        :return: Dict home_id -> {appliance: priority}.
+        """
+        home_ids = list(home_data)
+        if not home_ids:
+            return {}
+        width = max(len(records) for records in home_data.values())
+        points = np.zeros((len(home_ids), width, 2))
+        mask = np.zeros((len(home_ids), width), dtype=bool)
+        names = []
+        for h, home_id in enumerate(home_ids):
+            records = home_data[home_id]
+            names.append([r['appliance'] for r in records])
+            for a, r in enumerate(records):
+                points[h, a] = (r['usage'], r['usage_count'])
+                mask[h, a] = True
+
+        chunks = [(points[lo:lo + chunk_size], mask[lo:lo + chunk_size])
+                  for lo in range(0, len(home_ids), chunk_size)]
+        if n_jobs > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                levels = list(pool.map(_prioritize_padded, *zip(*chunks)))
+        else:
+            levels = [_prioritize_padded(p, m) for p, m in chunks]
+        levels = np.concatenate(levels, axis=0)
+
+        return {
+            home_id: {name: PRIORITY_LABELS[int(levels[h, a])] for a, name in enumerate(names[h])}
+            for h, home_id in enumerate(home_ids)
+        }
+
     def get_priorities(self):
         """
         Return the appliance priorities as a dictionary.
@@ -1,21 +1,177 @@
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, Response, jsonify, render_template, request, stream_with_context
 from agents.energy_manage_agent.agent import BehavioralSegmentationAgent
+from agents.energy_manage_agent.scheduler import FORECAST_COLUMNS, JOB_KEYS, LoadShiftScheduler
+from agents.energy_manage_agent.state_store import ApplianceStateStore
+from agents.energy_manage_agent.status_stream import StatusBroadcaster, UsageThresholdWatcher, format_sse
+import os
+import threading
 import time
+import pandas as pd
+from utils.event_log import EventLog
+from utils import metrics
 
 app = Flask(__name__,template_folder="templates")
 
-# 模拟设备数据（包含使用次数和总使用时长）
-appliance_data = {
-    "Washing Machine": {"start_time": None, "usage": 0, "current_usage": 0, "usage_count": 0},
-    "Refrigerator": {"start_time": None, "usage": 0, "current_usage": 0, "usage_count": 0},
-    "Oven": {"start_time": None, "usage": 0, "current_usage": 0, "usage_count": 0},
-    "Air Conditioner": {"start_time": None, "usage": 0, "current_usage": 0, "usage_count": 0},
-    "Heater": {"start_time": None, "usage": 0, "current_usage": 0, "usage_count": 0},
-    "Dishwasher": {"start_time": None, "usage": 0, "current_usage": 0, "usage_count": 0},
-}
+# 模拟设备（每个家庭默认的设备列表）
+DEFAULT_APPLIANCES = [
+    "Washing Machine",
+    "Refrigerator",
+    "Oven",
+    "Air Conditioner",
+    "Heater",
+    "Dishwasher",
+]
+# 未指定 home_id 时使用的家庭
+DEFAULT_HOME = "default"
+# 设备启动/停止事件日志目录（设为空字符串可关闭持久化）
+EVENT_LOG_DIR = os.environ.get("EMS_EVENT_LOG_DIR", "./static/ems_events")
+# 设备连续运行超过该时长（分钟）时推送提醒
+USAGE_ALERT_MINUTES = 60
 
-# 初始化行为分割算法实例
-agent = BehavioralSegmentationAgent()
+# 所有家庭的设备状态（开始时间、总使用时长、使用次数），每个家庭有独立的版本号,
+# /start 和 /stop 时递增, 优先级只在版本变化时重新计算
+store = ApplianceStateStore()
+store.register_home(DEFAULT_HOME, DEFAULT_APPLIANCES)
+# 由 init_event_log() 在启动时打开 (导入本模块不会读写磁盘)
+event_log = None
+
+
+def init_event_log(log_dir=EVENT_LOG_DIR):
+    """
+    Restore the appliance state from the event log in ``log_dir`` and log every later change.
+    Called by run_ems_app(); an empty ``log_dir`` keeps the state in memory only.
+    """
+    global event_log
+    if not log_dir or event_log is not None:
+        return
+    # 重启时从快照 + 日志尾部恢复设备状态，之后的变化批量写入日志
+    event_log = EventLog(log_dir, snapshot_provider=store.export_state)
+    replayed, elapsed = event_log.recover(store.apply_event, store.load_state)
+    print(f"[EMS] Restored appliance state, replayed {replayed} events in {elapsed:.3f}s")
+    store.event_log = event_log
+    store.register_home(DEFAULT_HOME, DEFAULT_APPLIANCES)
+
+# 每个家庭的行为分割算法实例和缓存的优先级结果 (按版本号)
+home_agents = {}
+priority_cache = {}
+priority_locks = {}
+
+
+# /get-priority 是否命中按版本号缓存的优先级
+PRIORITY_REQUESTS = metrics.counter(
+    "ems_priority_requests_total", "Priority lookups by cache result", ["result"])
+PRIORITY_SECONDS = metrics.histogram(
+    "ems_priority_seconds", "Duration of /get-priority, including any KMeans refit")
+
+
+# 根据 7 天预测安排设备运行时间
+scheduler = LoadShiftScheduler()
+
+
+
+def get_home_id():
+    """Read the home id from the JSON body or query string, falling back to the default home."""
+    if request.is_json and request.json.get("home_id"):
+        return request.json["home_id"]
+    return request.args.get("home_id", DEFAULT_HOME)
+
+
+def validate_records(records, keys, name):
+    """
+    Check that a request field is a list of objects carrying the given keys.
+
+    :param records: Value taken from the request body.
+    :param keys: Keys every record must have.
+    :param name: Field name used in the error message.
+    :return: An error message, or None if the records are usable.
+    """
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        return f"{name} must be a list of objects"
+    for i, record in enumerate(records):
+        missing = [k for k in keys if k not in record]
+        if missing:
+            return f"{name}[{i}] is missing {', '.join(missing)}"
+    return None
+
+
+def home_priorities(home_id):
+    """
+    Return the priority list of a home, refitting KMeans only if its usage data changed.
+    """
+    version = store.version(home_id)
+    cached = priority_cache.get(home_id)
+    if cached and cached["version"] == version:
+        PRIORITY_REQUESTS.labels("hit").inc()
+        return cached["priorities"]
+    PRIORITY_REQUESTS.labels("miss").inc()
+
+    # 只让一个线程重新计算, 其他线程等待后直接使用缓存
+    with priority_locks.setdefault(home_id, threading.Lock()):
+        cached = priority_cache.get(home_id)
+        if not cached or cached["version"] != version:
+            version, new_data = store.home_usage(home_id)
+            agent = home_agents.setdefault(home_id, BehavioralSegmentationAgent())
+            agent.refresh_priorities(new_data, version)
+            cached = {
+                "version": version,
+                "priorities": [{"appliance": k, "priority": v} for k, v in agent.appliance_priority.items()],
+            }
+            priority_cache[home_id] = cached
+    return cached["priorities"]
+
+
+# 最近一次推送给各家庭页面的优先级
+published_priorities = {}
+
+
+def priority_delta(home_id):
+    """
+    Refit the priorities of a changed home (on the broadcaster thread, not in /start or /stop)
+    and return a delta with them if they differ from the last ones pushed.
+    """
+    priorities = home_priorities(home_id)
+    if priorities == published_priorities.get(home_id):
+        return None
+    published_priorities[home_id] = priorities
+    return {"server_time": time.time(), "priorities": priorities}
+
+
+# 状态变化通过 SSE 推送给打开的页面（只推送变化的部分）, 优先级在后台线程中重新计算
+broadcaster = StatusBroadcaster(refresh=priority_delta)
+
+
+def publish_change(home_id, appliance, alert=None):
+    """
+    Push the changed appliance to subscribed dashboards. The delta carries the home's
+    version so dashboards can drop deltas that arrive out of order; changed priorities
+    follow in a separate delta from the broadcaster thread.
+    """
+    if not broadcaster.has_subscribers(home_id):
+        return
+    version, status = store.versioned_status(home_id, appliance)
+    delta = {
+        "server_time": time.time(),
+        "version": version,
+        "appliances": {appliance: status},
+    }
+    if alert:
+        delta["alerts"] = [alert]
+    broadcaster.publish(home_id, "delta", delta)
+    if not alert:
+        broadcaster.request_refresh(home_id)
+
+
+def on_usage_threshold(home_id, appliance, start_time):
+    status = store.appliance_status(home_id, appliance)
+    # 只在设备仍处于同一次运行时提醒
+    if status and status["start_time"] == start_time:
+        publish_change(home_id, appliance, alert={
+            "appliance": appliance,
+            "msg": f"{appliance} has been running for over {USAGE_ALERT_MINUTES} minutes",
+        })
+
+
+threshold_watcher = UsageThresholdWatcher(on_usage_threshold)
 
 
 @app.route("/")
@@ -23,60 +179,146 @@ def home():
     return render_template("index.html")
 
 
+@app.route("/register-home", methods=["POST"])
+def register_home():
+    home_id = request.json.get("home_id")
+    if not home_id:
+        return jsonify({"message": "home_id is required"}), 400
+    appliances = request.json.get("appliances") or DEFAULT_APPLIANCES
+    store.register_home(home_id, appliances)
+    return jsonify({"message": f"{home_id} registered", "appliances": list(store.home_slots[home_id])})
+
+
 @app.route("/start", methods=["POST"])
 def start_appliance():
+    home_id = get_home_id()
     appliance = request.json.get("appliance")
-    if appliance in appliance_data and appliance_data[appliance]["start_time"] is None:
-        appliance_data[appliance]["start_time"] = time.time()
-        appliance_data[appliance]["usage_count"] += 1  # 增加使用次数
-    return jsonify({"message": f"{appliance} started", "appliance_data": appliance_data})
+    if store.start(home_id, appliance):  # 同时增加使用次数
+        start_time = store.appliance_status(home_id, appliance)["start_time"]
+        threshold_watcher.schedule(start_time + USAGE_ALERT_MINUTES * 60, home_id, appliance, start_time)
+        publish_change(home_id, appliance)
+    return jsonify({"message": f"{appliance} started", "appliance_data": store.home_status(home_id)})
 
 
 @app.route("/stop", methods=["POST"])
 def stop_appliance():
+    home_id = get_home_id()
     appliance = request.json.get("appliance")
-    if appliance in appliance_data and appliance_data[appliance]["start_time"] is not None:
-        elapsed_time = time.time() - appliance_data[appliance]["start_time"]
-        appliance_data[appliance]["usage"] += elapsed_time / 60  # 转换为分钟
-        appliance_data[appliance]["start_time"] = None
-    return jsonify({"message": f"{appliance} stopped", "appliance_data": appliance_data})
+    if store.stop(home_id, appliance):  # 累加使用时长（分钟）
+        publish_change(home_id, appliance)
+    return jsonify({"message": f"{appliance} stopped", "appliance_data": store.home_status(home_id)})
 
 
 @app.route("/get-priority", methods=["GET"])
 def get_priority():
     """
-    Use usage and usage_count from appliance_data to update agent and calculate priority.
+    Use usage and usage_count of the home's appliances to update agent and calculate priority.
+    Priorities are cached per data version, so KMeans only refits after /start or /stop.
     """
-    new_data = [
-        {
-            "appliance": key,
-            "usage": value["usage"],
-            "usage_count": value["usage_count"],
-        }
-        for key, value in appliance_data.items()
-    ]
-    agent.update_data(new_data)
-    agent.prioritize_appliances()
-
+    home_id = get_home_id()
+    if not store.has_home(home_id):
+        return jsonify([])
     # 返回优先级结果
-    priorities = [{"appliance": k, "priority": v} for k, v in agent.appliance_priority.items()]
+    with PRIORITY_SECONDS.time():
+        priorities = home_priorities(home_id)
     return jsonify(priorities)
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus metrics of every agent in this process."""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route("/recompute-priorities", methods=["POST"])
+def recompute_priorities():
+    """
+    Recompute priorities of every home in one batched clustering pass (e.g. nightly),
+    refreshing the per-home priority cache.
+    """
+    try:
+        n_jobs = int(request.args.get("n_jobs", 1))
+    except ValueError:
+        return jsonify({"message": "n_jobs must be an integer"}), 400
+    # 进程数由请求指定, 限制在本机 CPU 数以内
+    n_jobs = max(1, min(n_jobs, os.cpu_count() or 1))
+    versions, home_data = {}, {}
+    for home_id in list(store.home_slots):
+        versions[home_id], home_data[home_id] = store.home_usage(home_id)
+    results = BehavioralSegmentationAgent().prioritize_batch(home_data, n_jobs=n_jobs)
+    for home_id, priorities in results.items():
+        priority_cache[home_id] = {
+            "version": versions[home_id],
+            "priorities": [{"appliance": k, "priority": v} for k, v in priorities.items()],
+        }
+    return jsonify({"message": "Priorities recomputed", "homes": len(results)})
+
+
+@app.route("/schedule", methods=["POST"])
+def schedule_appliances():
+    """
+    Plan appliance runs against a 7-day forecast (records from predict_7days),
+    favouring solar self-consumption and cheap hours, High priority appliances first.
+    """
+    home_id = get_home_id()
+    forecast = request.json.get("forecast")
+    if not forecast:
+        return jsonify({"message": "forecast is required"}), 400
+    error = validate_records(forecast, FORECAST_COLUMNS, "forecast")
+    jobs = request.json.get("jobs")
+    if error is None and jobs is not None:
+        error = validate_records(jobs, JOB_KEYS, "jobs")
+    if error is not None:
+        return jsonify({"message": error}), 400
+    priorities = {}
+    if store.has_home(home_id):
+        priorities = {p["appliance"]: p["priority"] for p in home_priorities(home_id)}
+    runs = scheduler.schedule(pd.DataFrame(forecast), jobs, priorities)
+    return jsonify(runs)
+
+
 @app.route("/get-status", methods=["GET"])
 def get_status():
     """
-    Return the real-time status of all appliances, including usage time and count.
+    Return the real-time status of all appliances of a home, including usage time and count.
+    """
+    status = store.home_status(get_home_id())
+    if status is None:
+        return jsonify({"message": "Unknown home"}), 404
+    return jsonify(status)
+
+@app.route("/stream", methods=["GET"])
+def stream():
     """
-    for appliance, data in appliance_data.items():
-        if data["start_time"] is not None:
-            elapsed_time = time.time() - data["start_time"]
-            appliance_data[appliance]["current_usage"] = elapsed_time / 60  # 当前使用时间（分钟）
-        else:
-            appliance_data[appliance]["current_usage"] = 0
-    return jsonify(appliance_data)
+    Server-Sent Events stream of a home: a full snapshot on connect, then only deltas
+    caused by /start, /stop or usage threshold alerts.
+    """
+    home_id = get_home_id()
+    if not store.has_home(home_id):
+        return jsonify({"message": "Unknown home"}), 404
+    q = broadcaster.subscribe(home_id)
+    # 版本号先于状态读取, 快照之后的变化都带有更大的版本号
+    version = store.version(home_id)
+    priorities = home_priorities(home_id)
+    published_priorities[home_id] = priorities
+    snapshot = format_sse("snapshot", {
+        "server_time": time.time(),
+        "version": version,
+        "appliances": store.home_status(home_id),
+        "priorities": priorities,
+    })
+
+    def generate():
+        try:
+            yield from broadcaster.stream(q, snapshot)
+        finally:
+            broadcaster.unsubscribe(home_id, q)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 def run_ems_app():
+    init_event_log()
     # Enable threaded mode to allow multiple concurrent requests if needed.
     app.run(threaded=True, port=5000)
 
@@ -0,0 +1,236 @@
+import threading
+import numpy as np
+import pandas as pd
+from utils.billing import Tariff, calendar_from_times
+
+
+class BatteryDispatchOptimizer:
+    """
+    Optimal hourly charge/discharge plan for home batteries.
+
+    The state of charge is discretised into ``n_levels`` steps and the plan is
+    found by backward dynamic programming over the forecast horizon, priced with
+    the tariff's import price and feed-in credit. Every step is evaluated for all
+    homes (or scenarios) and all level transitions at once as a
+    (batch x levels x levels) array, so thousands of batteries are solved in a
+    single call.
+    """
+
+    def __init__(self, capacity_kWh=10.0, max_charge_kW=5.0, max_discharge_kW=5.0,
+                 charge_efficiency=0.95, discharge_efficiency=0.95, min_soc=0.1,
+                 initial_soc=0.5, n_levels=21, tariff=None):
+        """
+        Battery parameters are scalars or arrays with one value per home/scenario.
+
+        :param capacity_kWh: Usable capacity.
+        :param max_charge_kW: Maximum energy drawn per hour for charging.
+        :param max_discharge_kW: Maximum energy delivered per hour when discharging.
+        :param charge_efficiency: Fraction of charging energy stored.
+        :param discharge_efficiency: Fraction of stored energy delivered.
+        :param min_soc: Lowest allowed state of charge as a fraction of capacity.
+        :param initial_soc: State of charge at the start, as a fraction of capacity.
+        :param n_levels: Number of state-of-charge levels in the grid.
+        :param tariff: Tariff used for import prices and the feed-in credit.
+        """
+        self.capacity_kWh = capacity_kWh
+        self.max_charge_kW = max_charge_kW
+        self.max_discharge_kW = max_discharge_kW
+        self.charge_efficiency = charge_efficiency
+        self.discharge_efficiency = discharge_efficiency
+        self.min_soc = min_soc
+        self.initial_soc = initial_soc
+        self.n_levels = n_levels
+        self.tariff = tariff or Tariff()
+
+    def _param(self, value, batch):
+        return np.broadcast_to(np.asarray(value, dtype='float64'), (batch,))
+
+    def optimize(self, consumption, generation, hour_of_day=None, day_of_week=None):
+        """
+        Solve the dispatch problem for a batch of homes or scenarios.
+
+        :param consumption: (batch, hours) forecast consumption in kWh.
+        :param generation: (batch, hours) forecast generation in kWh.
+        :param hour_of_day: Optional hour of every column, used for time-of-use prices.
+        :param day_of_week: Optional weekday of every column.
+        :return: Dict of arrays: 'soc' (batch, hours+1), 'charge', 'discharge',
+                 'grid_import', 'grid_export' (batch, hours), and 'cost' and
+                 'baseline_cost' (batch,) with and without the battery.
+        """
+        cons = np.atleast_2d(np.asarray(consumption, dtype='float64'))
+        gen = np.atleast_2d(np.asarray(generation, dtype='float64'))
+        batch, n_hours = cons.shape
+        if hour_of_day is None:
+            hour_of_day = np.arange(n_hours) % 24
+        if day_of_week is None:
+            day_of_week = (np.arange(n_hours) // 24) % 7
+        prices = self.tariff.import_prices(hour_of_day, day_of_week)
+        feed_in = self.tariff.feed_in_rate
+
+        cap = self._param(self.capacity_kWh, batch)
+        eta_c = self._param(self.charge_efficiency, batch)
+        eta_d = self._param(self.discharge_efficiency, batch)
+        max_c = self._param(self.max_charge_kW, batch)
+        max_d = self._param(self.max_discharge_kW, batch)
+        low = cap * self._param(self.min_soc, batch)
+
+        # (batch, levels) state-of-charge grid and (batch, from, to) transitions
+        frac = np.linspace(0.0, 1.0, self.n_levels)
+        levels = low[:, None] + (cap - low)[:, None] * frac[None, :]
+        delta = levels[:, None, :] - levels[:, :, None]
+        flow = np.where(delta > 0, delta / eta_c[:, None, None], delta * eta_d[:, None, None])
+        allowed = (flow <= max_c[:, None, None] + 1e-9) & (-flow <= max_d[:, None, None] + 1e-9)
+
+        net = cons - gen
+        value = np.zeros((batch, self.n_levels))
+        policy = np.empty((n_hours, batch, self.n_levels), dtype=np.int16)
+        for t in range(n_hours - 1, -1, -1):
+            grid = net[:, t, None, None] + flow
+            step = np.where(grid > 0, grid * prices[t], grid * feed_in)
+            total = np.where(allowed, step + value[:, None, :], np.inf)
+            policy[t] = total.argmin(axis=2)
+            value = np.take_along_axis(total, policy[t][..., None].astype(np.intp), axis=2)[..., 0]
+
+        # Roll the policy forward from the level closest to the initial state of charge
+        start_soc = cap * self._param(self.initial_soc, batch)
+        idx = np.abs(levels - start_soc[:, None]).argmin(axis=1)
+        rows = np.arange(batch)
+        soc = np.empty((batch, n_hours + 1))
+        soc[:, 0] = levels[rows, idx]
+        bus = np.empty((batch, n_hours))
+        for t in range(n_hours):
+            nxt = policy[t][rows, idx]
+            bus[:, t] = flow[rows, idx, nxt]
+            idx = nxt
+            soc[:, t + 1] = levels[rows, idx]
+
+        grid = net + bus
+        grid_import = np.maximum(grid, 0)
+        grid_export = np.maximum(-grid, 0)
+        base_import = np.maximum(net, 0)
+        base_export = np.maximum(-net, 0)
+        return {
+            'soc': soc,
+            'charge': np.maximum(bus, 0),
+            'discharge': np.maximum(-bus, 0),
+            'grid_import': grid_import,
+            'grid_export': grid_export,
+            'cost': grid_import @ prices - feed_in * grid_export.sum(axis=1),
+            'baseline_cost': base_import @ prices - feed_in * base_export.sum(axis=1),
+        }
+
+    def dispatch(self, forecast_df):
+        """
+        Plan one battery against the output of run_prediction_agent.
+
+        :param forecast_df: DataFrame with time, consumption_pred and generation_pred.
+        :return: Copy of forecast_df with charge_kWh, discharge_kWh, soc_kWh,
+                 grid_import_kWh and grid_export_kWh columns.
+        """
+        hour_of_day, day_of_week = calendar_from_times(forecast_df['time'])
+        plan = self.optimize(
+            forecast_df['consumption_pred'].to_numpy()[None, :],
+            forecast_df['generation_pred'].to_numpy()[None, :],
+            hour_of_day, day_of_week,
+        )
+        out = forecast_df.copy()
+        out['charge_kWh'] = plan['charge'][0]
+        out['discharge_kWh'] = plan['discharge'][0]
+        out['soc_kWh'] = plan['soc'][0, 1:]
+        out['grid_import_kWh'] = plan['grid_import'][0]
+        out['grid_export_kWh'] = plan['grid_export'][0]
+        return out
+
+
+def delivery_days(plan_df):
+    """:return: Delivery day ('YYYY-MM-DD') of every hour of a plan, as a Series."""
+    return pd.to_datetime(plan_df['time']).dt.strftime('%Y-%m-%d')
+
+
+def surplus_offers(plan_df, min_quantity=1.0, price=None):
+    """
+    Turn the exported surplus of a dispatch plan into P2P auction offers, one per day.
+
+    :param plan_df: Output of BatteryDispatchOptimizer.dispatch.
+    :param min_quantity: Days exporting less than this (kWh) are not offered.
+    :param price: Reserve price per kWh, used as both start price and grid fallback
+                  price of the auction (e.g. the tariff's feed-in rate).
+    :return: List of dicts with 'date' and the AuctionManager.create_auction arguments
+             'quantity', 'start_price' and 'grid_price'.
+    """
+    days = delivery_days(plan_df)
+    daily = plan_df['grid_export_kWh'].groupby(days).sum()
+    offers = []
+    for date, quantity in daily.items():
+        if quantity < min_quantity:
+            continue
+        offer = {'date': date, 'quantity': round(float(quantity), 3)}
+        if price is not None:
+            offer['start_price'] = price
+            offer['grid_price'] = price
+        offers.append(offer)
+    return offers
+
+
+class SurplusAuctions:
+    """
+    One P2P auction per (seller, delivery day) for the surplus of successive dispatch plans.
+
+    Every new forecast offers the same days again. A day whose live auction has
+    no bids yet gets it replaced when the offer changed (and withdrawn when the
+    day no longer has surplus); a day whose auction has bids or has ended is
+    left alone, so the same energy is never put up twice.
+    """
+
+    def __init__(self, manager, seller_id):
+        """
+        :param manager: AuctionManager the offers are posted to.
+        :param seller_id: Seller the auctions are created for.
+        """
+        self.manager = manager
+        self.seller_id = seller_id
+        # (seller_id, date) -> (auction_id, offer)
+        self.posted = {}
+        self.lock = threading.Lock()
+
+    def _replaceable(self, auction_id):
+        auc = self.manager.get_auction(auction_id)
+        # Archived (None), ended, canceled or already bid on: the day is settled
+        return auc is not None and not auc.auction_ended and auc.highest_bidder is None
+
+    def post(self, offers, days=None):
+        """
+        Bring the auctions in line with the offers of the latest plan.
+
+        :param offers: Output of surplus_offers.
+        :param days: Delivery days ('YYYY-MM-DD') the plan covers; defaults to the offered days.
+                     Earlier days are forgotten.
+        :return: Ids of the auctions created.
+        """
+        by_day = {offer['date']: offer for offer in offers}
+        days = sorted(set(days) if days is not None else by_day)
+        created = []
+        with self.lock:
+            if days:
+                for key in [k for k in self.posted if k[1] < days[0]]:
+                    del self.posted[key]
+            for day in days:
+                key = (self.seller_id, day)
+                offer = by_day.get(day)
+                current = self.posted.get(key)
+                if current is not None:
+                    auction_id, previous = current
+                    if previous == offer or not self._replaceable(auction_id):
+                        continue
+                    self.manager.cancel_auction(auction_id, self.seller_id)
+                    del self.posted[key]
+                if offer is None:
+                    continue
+                auction_id = self.manager.create_auction(
+                    seller_id=self.seller_id,
+                    quantity=offer['quantity'],
+                    **{k: offer[k] for k in ('start_price', 'grid_price') if k in offer}
+                )
+                self.posted[key] = (auction_id, offer)
+                created.append(auction_id)
+        return created
@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+from utils.billing import Tariff, calendar_from_times
+
+PRIORITY_LEVELS = {'High': 1, 'Medium': 2, 'Low': 3}
+
+# Keys every job and columns every forecast record must carry
+JOB_KEYS = ('appliance', 'duration', 'power')
+FORECAST_COLUMNS = ('time', 'consumption_pred', 'generation_pred')
+
+# Typical shiftable runs (duration in hours, power in kW). Always-on appliances
+# such as the refrigerator are not shiftable and are left out.
+DEFAULT_APPLIANCE_JOBS = [
+    {'appliance': 'Washing Machine', 'duration': 2, 'power': 0.5},
+    {'appliance': 'Dishwasher', 'duration': 2, 'power': 1.2},
+    {'appliance': 'Oven', 'duration': 1, 'power': 2.0},
+    {'appliance': 'Air Conditioner', 'duration': 3, 'power': 1.5},
+    {'appliance': 'Heater', 'duration': 3, 'power': 1.5},
+]
+
+
+class LoadShiftScheduler:
+    """
+    Plans appliance runs against the 7-day consumption/generation forecast.
+
+    Jobs are placed greedily in priority order (High first, then larger runs).
+    For each job, the extra cost of every feasible start slot is evaluated at
+    once from prefix sums over the remaining solar surplus, so placing a job is
+    O(slots) and a whole fleet is scheduled with array operations over
+    (homes x 168) matrices.
+    """
+
+    def __init__(self, tariff=None):
+        """
+        :param tariff: Tariff used to price extra imports and lost feed-in credit.
+        """
+        self.tariff = tariff or Tariff()
+
+    def _slot_costs(self, surplus, power, prices):
+        """
+        Cost of adding ``power`` kWh in every slot given the remaining surplus.
+        :param surplus: (homes, slots) generation minus already planned consumption.
+        :param power: (homes,) energy the job draws per slot.
+        :param prices: (slots,) import price.
+        """
+        p = power[:, None]
+        extra_import = np.maximum(p - surplus, 0) - np.maximum(-surplus, 0)
+        lost_export = np.minimum(p, np.maximum(surplus, 0))
+        return extra_import * prices + lost_export * self.tariff.feed_in_rate
+
+    def schedule_fleet(self, consumption, generation, jobs, priorities=None,
+                       hour_of_day=None, day_of_week=None):
+        """
+        Schedule the same set of jobs for many homes at once.
+
+        :param consumption: (homes, slots) forecast consumption in kWh.
+        :param generation: (homes, slots) forecast generation in kWh.
+        :param jobs: List of dicts with 'appliance', 'duration' (slots), 'power' (kW) and
+                     optional 'earliest' (first allowed start slot) and 'latest' (slot by
+                     which the run must have finished).
+        :param priorities: Optional (homes, jobs) int levels (1=High, 2=Medium, 3=Low);
+                           higher priority jobs get the best slots first.
+        :param hour_of_day: Optional hour of every slot, used for time-of-use prices.
+        :param day_of_week: Optional weekday of every slot.
+        :return: Dict with 'start' (homes, jobs) start slots (-1 if the job does not fit),
+                 'cost' (homes, jobs) extra cost of every run, 'solar_kWh' (homes, jobs)
+                 solar energy each run consumes, and 'surplus' (homes, slots) left over.
+        """
+        cons = np.atleast_2d(np.asarray(consumption, dtype='float64'))
+        gen = np.atleast_2d(np.asarray(generation, dtype='float64'))
+        n_homes, n_slots = cons.shape
+        n_jobs = len(jobs)
+        if hour_of_day is None:
+            hour_of_day = np.arange(n_slots) % 24
+        if day_of_week is None:
+            day_of_week = (np.arange(n_slots) // 24) % 7
+        prices = self.tariff.import_prices(hour_of_day, day_of_week)
+
+        duration = np.array([int(j['duration']) for j in jobs])
+        power = np.array([float(j['power']) for j in jobs])
+        earliest = np.array([int(j.get('earliest', 0)) for j in jobs])
+        latest = np.array([int(j.get('latest') if j.get('latest') is not None else n_slots) for j in jobs])
+        latest = np.minimum(latest, n_slots)
+
+        if priorities is None:
+            priorities = np.full((n_homes, n_jobs), 2)
+        priorities = np.broadcast_to(np.asarray(priorities), (n_homes, n_jobs))
+        # Order per home: priority level, then energy of the run (largest first)
+        energy = duration * power
+        order = np.lexsort((np.broadcast_to(-energy, (n_homes, n_jobs)), priorities), axis=-1)
+
+        surplus = gen - cons
+        start = np.full((n_homes, n_jobs), -1)
+        cost = np.zeros((n_homes, n_jobs))
+        solar = np.zeros((n_homes, n_jobs))
+        rows = np.arange(n_homes)
+        starts = np.arange(n_slots)
+
+        for step in range(n_jobs):
+            job = order[:, step]
+            d = duration[job]
+            p = power[job]
+            costs = self._slot_costs(surplus, p, prices)
+            prefix = np.concatenate([np.zeros((n_homes, 1)), np.cumsum(costs, axis=1)], axis=1)
+            ends = np.minimum(starts[None, :] + d[:, None], n_slots)
+            window_cost = np.take_along_axis(prefix, ends, axis=1) - prefix[:, :n_slots]
+            feasible = (starts[None, :] >= earliest[job][:, None]) & \
+                       (starts[None, :] + d[:, None] <= latest[job][:, None])
+            window_cost = np.where(feasible, window_cost, np.inf)
+            best = window_cost.argmin(axis=1)
+            ok = np.isfinite(window_cost[rows, best])
+
+            # Commit the chosen runs: the job now draws power from those slots
+            run = (starts[None, :] >= best[:, None]) & (starts[None, :] < (best + d)[:, None]) & ok[:, None]
+            drawn = run * p[:, None]
+            solar[rows, job] = np.where(ok, np.minimum(drawn, np.maximum(surplus, 0)).sum(axis=1), 0)
+            surplus = surplus - drawn
+            start[rows, job] = np.where(ok, best, -1)
+            cost[rows, job] = np.where(ok, window_cost[rows, best], 0)
+
+        return {'start': start, 'cost': cost, 'solar_kWh': solar, 'surplus': surplus}
+
+    def schedule(self, forecast_df, jobs=None, priorities=None):
+        """
+        Schedule appliance runs for one home.
+
+        :param forecast_df: Output of predict_7days (time, consumption_pred, generation_pred).
+        :param jobs: Job dicts as in schedule_fleet; defaults to DEFAULT_APPLIANCE_JOBS.
+        :param priorities: Optional dict appliance -> 'High'/'Medium'/'Low', e.g. from
+                           BehavioralSegmentationAgent.get_priorities().
+        :return: List of planned runs sorted by start time.
+        """
+        jobs = jobs or DEFAULT_APPLIANCE_JOBS
+        priorities = priorities or {}
+        levels = np.array([[PRIORITY_LEVELS.get(priorities.get(j['appliance']), 2) for j in jobs]])
+        hour_of_day, day_of_week = calendar_from_times(forecast_df['time'])
+        plan = self.schedule_fleet(
+            forecast_df['consumption_pred'].to_numpy()[None, :],
+            forecast_df['generation_pred'].to_numpy()[None, :],
+            jobs, levels, hour_of_day, day_of_week,
+        )
+
+        times = pd.to_datetime(forecast_df['time']).reset_index(drop=True)
+        runs = []
+        for i, job in enumerate(jobs):
+            slot = int(plan['start'][0, i])
+            if slot < 0:
+                continue
+            runs.append({
+                'appliance': job['appliance'],
+                'priority': priorities.get(job['appliance'], 'Medium'),
+                'start_slot': slot,
+                'start_time': times[slot].strftime('%Y-%m-%d %H:%M'),
+                'end_time': (times[slot] + pd.Timedelta(hours=int(job['duration']))).strftime('%Y-%m-%d %H:%M'),
+                'cost': float(plan['cost'][0, i]),
+                'solar_kWh': float(plan['solar_kWh'][0, i]),
+            })
+        return sorted(runs, key=lambda r: r['start_slot'])
@@ -0,0 +1,258 @@
+import math
+import threading
+import time
+import numpy as np
+
+
+class ApplianceStateStore:
+    """
+    Appliance state for many homes, kept in compact numpy arrays.
+
+    Every (home_id, appliance) pair owns one slot in fixed-size blocks of
+    start times, cumulative usage (minutes) and usage counts. Blocks are only
+    ever appended, never reallocated, so writers never race with a resize.
+    Each home is guarded by one of a fixed pool of striped locks, so handlers
+    for different homes do not contend, and reading one home's status only
+    touches that home's slots.
+    """
+
+    def __init__(self, block_size=4096, lock_stripes=256):
+        """
+        :param block_size: Number of slots allocated per block.
+        :param lock_stripes: Number of locks homes are spread over.
+        """
+        self.block_size = block_size
+        self.start_blocks = []
+        self.usage_blocks = []
+        self.count_blocks = []
+        self.size = 0
+
+        # home_id -> {appliance: slot}, insertion ordered
+        self.home_slots = {}
+        # home_id -> version, bumped on every start/stop of one of its appliances
+        self.home_versions = {}
+
+        self._register_lock = threading.Lock()
+        self._locks = [threading.Lock() for _ in range(lock_stripes)]
+
+        # Optional utils.event_log.EventLog; every change is appended while its lock is
+        # held, so a snapshot taken under all locks matches the log sequence exactly.
+        self.event_log = None
+
+    def _log(self, record):
+        if self.event_log is not None:
+            self.event_log.append(record)
+
+    def _lock_for(self, home_id):
+        return self._locks[hash(home_id) % len(self._locks)]
+
+    def _locate(self, slot):
+        return slot // self.block_size, slot % self.block_size
+
+    def _allocate(self):
+        # Caller holds _register_lock
+        if self.size == len(self.start_blocks) * self.block_size:
+            self.start_blocks.append(np.full(self.block_size, np.nan))
+            self.usage_blocks.append(np.zeros(self.block_size))
+            self.count_blocks.append(np.zeros(self.block_size, dtype="int64"))
+        slot = self.size
+        self.size += 1
+        return slot
+
+    def register_home(self, home_id, appliances):
+        """
+        Register a home and its appliances. Already known appliances are kept as they are.
+        :param home_id: Home identifier.
+        :param appliances: Iterable of appliance names.
+        """
+        with self._register_lock:
+            slots = dict(self.home_slots.get(home_id, {}))
+            added = [name for name in appliances if name not in slots]
+            for name in added:
+                slots[name] = self._allocate()
+            # Publish a new dict so readers never see one being mutated
+            self.home_slots[home_id] = slots
+            self.home_versions.setdefault(home_id, 0)
+            if added:
+                self._log({"type": "register", "home_id": home_id, "appliances": added})
+
+    def has_home(self, home_id):
+        return home_id in self.home_slots
+
+    def has_appliance(self, home_id, appliance):
+        return appliance in self.home_slots.get(home_id, {})
+
+    def version(self, home_id):
+        """Return the data version of a home (changes whenever usage data changes)."""
+        return self.home_versions.get(home_id)
+
+    def start(self, home_id, appliance, now=None):
+        """
+        Mark an appliance as running.
+        :return: True if the state changed, False if unknown or already running.
+        """
+        slot = self.home_slots.get(home_id, {}).get(appliance)
+        if slot is None:
+            return False
+        block, offset = self._locate(slot)
+        with self._lock_for(home_id):
+            if not math.isnan(self.start_blocks[block][offset]):
+                return False
+            now = time.time() if now is None else now
+            self.start_blocks[block][offset] = now
+            self.count_blocks[block][offset] += 1
+            self.home_versions[home_id] += 1
+            self._log({"type": "start", "home_id": home_id, "appliance": appliance, "time": now})
+        return True
+
+    def stop(self, home_id, appliance, now=None):
+        """
+        Mark an appliance as stopped and add the elapsed minutes to its usage.
+        :return: True if the state changed, False if unknown or not running.
+        """
+        slot = self.home_slots.get(home_id, {}).get(appliance)
+        if slot is None:
+            return False
+        block, offset = self._locate(slot)
+        now = time.time() if now is None else now
+        with self._lock_for(home_id):
+            started = self.start_blocks[block][offset]
+            if math.isnan(started):
+                return False
+            self.usage_blocks[block][offset] += (now - started) / 60
+            self.start_blocks[block][offset] = np.nan
+            self.home_versions[home_id] += 1
+            self._log({"type": "stop", "home_id": home_id, "appliance": appliance, "time": now})
+        return True
+
+    def appliance_status(self, home_id, appliance, now=None):
+        """
+        Return the status of a single appliance, or None if unknown.
+        """
+        return self.versioned_status(home_id, appliance, now)[1]
+
+    def versioned_status(self, home_id, appliance, now=None):
+        """
+        Read the status of a single appliance together with the version of its home.
+        :return: (version, status); status is None if the appliance is unknown.
+        """
+        slot = self.home_slots.get(home_id, {}).get(appliance)
+        if slot is None:
+            return self.home_versions.get(home_id), None
+        now = time.time() if now is None else now
+        block, offset = self._locate(slot)
+        with self._lock_for(home_id):
+            version = self.home_versions[home_id]
+            started = float(self.start_blocks[block][offset])
+            usage = float(self.usage_blocks[block][offset])
+            count = int(self.count_blocks[block][offset])
+        running = not math.isnan(started)
+        return version, {
+            "start_time": started if running else None,
+            "usage": usage,
+            "current_usage": (now - started) / 60 if running else 0,
+            "usage_count": count,
+        }
+
+    def home_status(self, home_id, now=None):
+        """
+        Return the status of every appliance of a home, including current usage (minutes).
+        Current usage is derived on read; nothing is written back.
+        :return: Dict appliance -> {start_time, usage, current_usage, usage_count}, or None.
+        """
+        slots = self.home_slots.get(home_id)
+        if slots is None:
+            return None
+        now = time.time() if now is None else now
+        status = {}
+        with self._lock_for(home_id):
+            for name, slot in slots.items():
+                block, offset = self._locate(slot)
+                started = float(self.start_blocks[block][offset])
+                running = not math.isnan(started)
+                status[name] = {
+                    "start_time": started if running else None,
+                    "usage": float(self.usage_blocks[block][offset]),
+                    "current_usage": (now - started) / 60 if running else 0,
+                    "usage_count": int(self.count_blocks[block][offset]),
+                }
+        return status
+
+    def home_usage(self, home_id):
+        """
+        Return usage records of a home in the format used by BehavioralSegmentationAgent.
+        :return: (version, list of {'appliance', 'usage', 'usage_count'}).
+        """
+        slots = self.home_slots.get(home_id, {})
+        records = []
+        with self._lock_for(home_id):
+            version = self.home_versions.get(home_id)
+            for name, slot in slots.items():
+                block, offset = self._locate(slot)
+                records.append({
+                    "appliance": name,
+                    "usage": float(self.usage_blocks[block][offset]),
+                    "usage_count": int(self.count_blocks[block][offset]),
+                })
+        return version, records
+
+    def apply_event(self, record):
+        """
+        Re-apply a logged event (used when replaying the event log on restart).
+        """
+        if record["type"] == "register":
+            self.register_home(record["home_id"], record["appliances"])
+        elif record["type"] == "start":
+            self.start(record["home_id"], record["appliance"], now=record["time"])
+        elif record["type"] == "stop":
+            self.stop(record["home_id"], record["appliance"], now=record["time"])
+
+    def export_state(self):
+        """
+        Capture a consistent copy of the whole store.
+        :return: (event log sequence number the copy corresponds to, JSON-serialisable state).
+        """
+        with self._register_lock:
+            for lock in self._locks:
+                lock.acquire()
+            try:
+                # Appends are blocked by the locks, so after sync() the copy matches the disk
+                seq = self.event_log.sync() if self.event_log is not None else 0
+                size = self.size
+                starts = np.concatenate(self.start_blocks)[:size] if size else np.empty(0)
+                usage = np.concatenate(self.usage_blocks)[:size] if size else np.empty(0)
+                counts = np.concatenate(self.count_blocks)[:size] if size else np.empty(0, dtype="int64")
+                homes = dict(self.home_slots)
+                versions = dict(self.home_versions)
+            finally:
+                for lock in self._locks:
+                    lock.release()
+        state = {
+            "homes": homes,
+            "versions": versions,
+            # NaN (not running) is stored as None to keep the snapshot valid JSON
+            "start_time": [None if np.isnan(x) else x for x in starts.tolist()],
+            "usage": usage.tolist(),
+            "usage_count": counts.tolist(),
+        }
+        return seq, state
+
+    def load_state(self, state):
+        """
+        Replace the store content with a state produced by export_state().
+        """
+        size = len(state["usage"])
+        n_blocks = max(1, -(-size // self.block_size))
+        starts = np.full(n_blocks * self.block_size, np.nan)
+        usage = np.zeros(n_blocks * self.block_size)
+        counts = np.zeros(n_blocks * self.block_size, dtype="int64")
+        starts[:size] = [np.nan if x is None else x for x in state["start_time"]]
+        usage[:size] = state["usage"]
+        counts[:size] = state["usage_count"]
+        with self._register_lock:
+            self.start_blocks = np.split(starts, n_blocks)
+            self.usage_blocks = np.split(usage, n_blocks)
+            self.count_blocks = np.split(counts, n_blocks)
+            self.size = size
+            self.home_slots = {home: dict(slots) for home, slots in state["homes"].items()}
+            self.home_versions = dict(state["versions"])
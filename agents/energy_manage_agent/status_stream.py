@@ -0,0 +1,154 @@
+import heapq
+import json
+import queue
+import threading
+import time
+
+
+class StatusBroadcaster:
+    """
+    Fan-out of appliance status deltas to Server-Sent Events subscribers.
+
+    Every open dashboard subscribes to one home and gets its own bounded queue.
+    Publishing to a home without subscribers costs one dict lookup, so idle
+    homes generate no traffic at all.
+
+    Slow follow-up work for a change (e.g. refitting priorities) is handed to
+    request_refresh() and runs on the broadcaster's own thread; requests for a
+    home that is already waiting are merged into one.
+    """
+
+    def __init__(self, max_queue_size=100, refresh=None):
+        """
+        :param max_queue_size: Events buffered per subscriber before it is considered stalled.
+        :param refresh: Optional callable(home_id) run by request_refresh() on the broadcaster
+                        thread; a non-None return value is published as a "delta" event.
+        """
+        self.max_queue_size = max_queue_size
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+        self.refresh = refresh
+        # home_id -> None, used as an insertion-ordered set of homes waiting for a refresh
+        self.pending = {}
+        self.cond = threading.Condition()
+        if refresh is not None:
+            self.thread = threading.Thread(target=self._refresh_loop, daemon=True)
+            self.thread.start()
+
+    def subscribe(self, home_id):
+        q = queue.Queue(maxsize=self.max_queue_size)
+        with self.lock:
+            self.subscribers.setdefault(home_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, home_id, q):
+        with self.lock:
+            subs = self.subscribers.get(home_id)
+            if subs is not None:
+                subs.discard(q)
+                if not subs:
+                    del self.subscribers[home_id]
+
+    def has_subscribers(self, home_id):
+        return home_id in self.subscribers
+
+    def publish(self, home_id, event, data):
+        """
+        Send an event to every subscriber of a home.
+        :param home_id: Home the event belongs to.
+        :param event: SSE event name, e.g. "delta".
+        :param data: JSON-serialisable payload.
+        """
+        subs = self.subscribers.get(home_id)
+        if not subs:
+            return
+        message = format_sse(event, data)
+        with self.lock:
+            subs = list(self.subscribers.get(home_id, ()))
+        for q in subs:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # Stalled client: drop it, the browser reconnects and gets a fresh snapshot
+                self.unsubscribe(home_id, q)
+
+    def request_refresh(self, home_id):
+        """Run the refresh callback for a home on the broadcaster thread, if anyone is listening."""
+        if self.refresh is None or not self.has_subscribers(home_id):
+            return
+        with self.cond:
+            self.pending[home_id] = None
+            self.cond.notify()
+
+    def _refresh_loop(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                home_id = next(iter(self.pending))
+                del self.pending[home_id]
+            if not self.has_subscribers(home_id):
+                continue
+            try:
+                data = self.refresh(home_id)
+            except Exception as e:
+                print(f"[EMS] Error refreshing home {home_id}: {e}")
+                continue
+            if data is not None:
+                self.publish(home_id, "delta", data)
+
+    def stream(self, q, snapshot, keepalive=15.0):
+        """
+        Generator for a Flask streaming response: the snapshot first, then deltas.
+        :param q: Queue returned by subscribe().
+        :param snapshot: SSE message with the full state of the home.
+        :param keepalive: Seconds between keep-alive comments when nothing happens.
+        """
+        yield snapshot
+        while True:
+            try:
+                yield q.get(timeout=keepalive)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class UsageThresholdWatcher:
+    """
+    Fires a callback when a running appliance crosses a usage threshold.
+
+    Deadlines live in a min-heap served by one thread that sleeps until the
+    earliest one, so thousands of running appliances need no polling.
+    """
+
+    def __init__(self, callback):
+        """
+        :param callback: Called as callback(home_id, appliance, start_time) when a deadline passes.
+        """
+        self.callback = callback
+        self.heap = []
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def schedule(self, deadline, home_id, appliance, start_time):
+        with self.cond:
+            heapq.heappush(self.heap, (deadline, home_id, appliance, start_time))
+            if self.heap[0][0] == deadline:
+                self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.heap or self.heap[0][0] > time.time():
+                    timeout = self.heap[0][0] - time.time() if self.heap else None
+                    self.cond.wait(timeout)
+                _, home_id, appliance, start_time = heapq.heappop(self.heap)
+            try:
+                self.callback(home_id, appliance, start_time)
+            except Exception as e:
+                print(f"[EMS] Error in usage threshold callback: {e}")
@@ -0,0 +1,114 @@
+"""
+HTTP forecast service: POST a weather horizon and the current consumption and
+generation, get the hourly forecast back (same records as predict_7days).
+
+Concurrent requests are gathered by a DynamicBatcher and run through the LSTM
+together, one model call per forecast hour for the whole batch.
+
+    curl -X POST localhost:5002/forecast -H 'Content-Type: application/json' \
+         -d '{"weather": [{"time": "2025-01-01 00:00", "day_of_week": 2, "weather": "Night"}],
+              "start_consumption": 1.0, "start_generation": 0.3}'
+"""
+import os
+
+import pandas as pd
+from flask import Flask, Response, jsonify, request
+
+from agents.forecast_service.batcher import DynamicBatcher, QueueFull
+from utils import metrics
+from utils.data_loader import dataframe_to_json, json_to_dataframe
+
+app = Flask(__name__)
+
+# 一个批次最多合并的请求数
+MAX_BATCH = int(os.environ.get("FORECAST_MAX_BATCH", "64"))
+# 第一个请求最多等待其他请求加入批次的时间（毫秒）
+MAX_WAIT_MS = float(os.environ.get("FORECAST_MAX_WAIT_MS", "5"))
+# 单个请求最多预测的小时数
+MAX_HOURS = int(os.environ.get("FORECAST_MAX_HOURS", "168"))
+# 请求等待结果的超时（秒）
+REQUEST_TIMEOUT = float(os.environ.get("FORECAST_TIMEOUT", "30"))
+# 排队等待批次的请求上限, 超过时直接返回 503
+MAX_QUEUE = int(os.environ.get("FORECAST_MAX_QUEUE", "1024"))
+
+WEATHER_COLUMNS = ("time", "day_of_week", "weather")
+
+
+def predict_batch(items):
+    """
+    :param items: List of (weather DataFrame, start consumption, start generation).
+    :return: One forecast DataFrame per item.
+    """
+    # 第一次请求时才加载模型 (TensorFlow); run.py 中已经加载过
+    from agents.prediction_agent import agent
+    weather, consumptions, generations = zip(*items)
+    return agent.predict_horizons_batch(list(weather), consumptions, generations)
+
+
+batcher = DynamicBatcher(predict_batch, max_batch=MAX_BATCH, max_wait=MAX_WAIT_MS / 1000.0, max_queue=MAX_QUEUE)
+
+
+def parse_request(body):
+    """:return: (weather DataFrame, start consumption, start generation) or an error message."""
+    if not isinstance(body, dict) or not isinstance(body.get("weather"), list):
+        return "weather (a list of hourly records) is required"
+    weather = body["weather"]
+    if not 0 < len(weather) <= MAX_HOURS:
+        return f"weather must contain 1 to {MAX_HOURS} hours"
+    if not all(isinstance(record, dict) for record in weather):
+        return "weather records must be objects"
+    df = json_to_dataframe(weather)
+    missing = [c for c in WEATHER_COLUMNS if c not in df.columns]
+    if missing:
+        return f"weather records need {', '.join(missing)}"
+    if not df["weather"].map(lambda v: isinstance(v, str)).all():
+        return "weather values must be strings"
+    # Bad values would only fail inside the model batch, so they are rejected here
+    try:
+        times = pd.to_datetime(df["time"], errors="raise")
+    except (TypeError, ValueError):
+        return "weather time values must be timestamps"
+    if times.isna().any():
+        return "weather time values must be timestamps"
+    dow = pd.to_numeric(df["day_of_week"], errors="coerce")
+    if dow.isna().any() or not ((dow % 1 == 0) & dow.between(0, 6)).all():
+        return "weather day_of_week values must be integers from 0 to 6"
+    df["day_of_week"] = dow.astype("int64")
+    df["hour_of_day"] = times.dt.hour
+    try:
+        start_consumption = float(body.get("start_consumption", 1.0))
+        start_generation = float(body.get("start_generation", 0.3))
+    except (TypeError, ValueError):
+        return "start_consumption and start_generation must be numbers"
+    return df, start_consumption, start_generation
+
+
+@app.route("/forecast", methods=["POST"])
+def forecast():
+    """Hourly consumption and generation forecast for the posted weather horizon."""
+    item = parse_request(request.get_json(silent=True))
+    if isinstance(item, str):
+        return jsonify({"message": item}), 400
+    try:
+        df = batcher.submit(item, timeout=REQUEST_TIMEOUT)
+    except TimeoutError:
+        return jsonify({"message": "Forecast timed out"}), 503
+    except QueueFull:
+        return jsonify({"message": "Forecast service is busy, try again later"}), 503
+    return Response(dataframe_to_json(df, indent=None), mimetype="application/json")
+
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    """Batching statistics: batches run, mean batch size and mean queueing delay."""
+    return jsonify(batcher.stats())
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus metrics of every agent in this process."""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
+def run_forecast_app():
+    app.run(threaded=True, port=5002)
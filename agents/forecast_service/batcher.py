@@ -0,0 +1,197 @@
+import queue
+import threading
+import time
+
+from utils import metrics
+
+BATCH_SIZE = metrics.histogram("forecast_batch_size", "Requests per model batch",
+                               buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+QUEUE_SECONDS = metrics.histogram("forecast_queue_seconds", "Time a request waited before its batch started",
+                                  buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+BATCH_SECONDS = metrics.histogram("forecast_batch_seconds", "Duration of one batched model run")
+REQUESTS = metrics.counter("forecast_requests_total", "Forecast requests by result", ["result"])
+FALLBACKS = metrics.counter("forecast_batch_fallbacks_total", "Failed batches retried one request at a time")
+
+
+class QueueFull(Exception):
+    """Raised by DynamicBatcher.submit when ``max_queue`` requests are already waiting."""
+
+
+class _Request:
+    __slots__ = ("item", "enqueued", "done", "result", "error", "cancelled")
+
+    def __init__(self, item):
+        self.item = item
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # Set when the caller gave up waiting; the worker then skips the request
+        self.cancelled = False
+
+
+class DynamicBatcher:
+    """
+    Gathers concurrent requests into batches for one batch function.
+
+    ``submit`` queues a request and waits for its result. A single worker thread
+    takes the oldest request, waits until ``max_wait`` seconds after its arrival
+    (or until ``max_batch`` requests are queued) for more, and runs them through
+    ``batch_fn`` in one call. While a batch runs, new requests queue up, so under
+    load the next batch starts at once and is as large as the backlog allows;
+    a lone request only waits ``max_wait``. When a batch raises, its requests
+    are retried one at a time, so a bad request only fails itself.
+
+    At most ``max_queue`` requests wait at once; beyond that ``submit`` fails
+    fast with QueueFull. Requests whose caller timed out are dropped from the
+    queue instead of being run for nobody.
+    """
+
+    def __init__(self, batch_fn, max_batch=64, max_wait=0.005, max_queue=1024):
+        """
+        :param batch_fn: Callable taking a list of items and returning one result per item.
+        :param max_batch: Largest number of requests run together.
+        :param max_wait: Seconds the oldest request waits for others to join its batch.
+        :param max_queue: Most requests waiting for a batch; 0 means unbounded.
+        """
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue(max_queue)
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.batched_requests = 0
+        self.fallbacks = 0
+        self.cancelled = 0
+        self.queue_seconds = 0.0
+        self.worker = threading.Thread(target=self._run, name="forecast-batcher", daemon=True)
+        self.worker.start()
+
+    def submit(self, item, timeout=None):
+        """
+        Run ``item`` in the next batch and wait for its result.
+        :raise: The exception raised by batch_fn for this item, TimeoutError or QueueFull.
+        """
+        req = _Request(item)
+        try:
+            self.requests.put_nowait(req)
+        except queue.Full:
+            REQUESTS.labels("rejected").inc()
+            raise QueueFull("Too many forecast requests queued") from None
+        if not req.done.wait(timeout):
+            req.cancelled = True
+            REQUESTS.labels("timeout").inc()
+            raise TimeoutError("Forecast request timed out")
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def _skip(self, req):
+        """:return: True if the caller of ``req`` has given up on it."""
+        if req.cancelled:
+            with self.lock:
+                self.cancelled += 1
+            return True
+        return False
+
+    def _collect(self):
+        first = self.requests.get()
+        while first is not None and self._skip(first):
+            first = self.requests.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = first.enqueued + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                req = self.requests.get(timeout=remaining) if remaining > 0 else self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if req is None:
+                # close(): run what was collected, then stop
+                self.requests.put(None)
+                break
+            if not self._skip(req):
+                batch.append(req)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            start = time.perf_counter()
+            waited = 0.0
+            for req in batch:
+                QUEUE_SECONDS.observe(start - req.enqueued)
+                waited += start - req.enqueued
+            BATCH_SIZE.observe(len(batch))
+            fallback = False
+            try:
+                results = self._call([req.item for req in batch])
+            except Exception as e:
+                if len(batch) == 1:
+                    self._fail(batch[0], e)
+                else:
+                    # Retry one by one so that only the requests that fail on their own get an error
+                    fallback = True
+                    FALLBACKS.inc()
+                    for req in batch:
+                        try:
+                            self._succeed(req, self._call([req.item])[0])
+                        except Exception as item_error:
+                            self._fail(req, item_error)
+            else:
+                for req, result in zip(batch, results):
+                    self._succeed(req, result)
+            BATCH_SECONDS.observe(time.perf_counter() - start)
+            with self.lock:
+                self.batches += 1
+                self.batched_requests += len(batch)
+                self.queue_seconds += waited
+                self.fallbacks += fallback
+
+    def _call(self, items):
+        results = self.batch_fn(items)
+        if results is None or len(results) != len(items):
+            raise RuntimeError("Forecast batch returned no results")
+        return results
+
+    @staticmethod
+    def _succeed(req, result):
+        REQUESTS.labels("ok").inc()
+        req.result = result
+        req.done.set()
+
+    @staticmethod
+    def _fail(req, error):
+        REQUESTS.labels("error").inc()
+        req.error = error
+        req.done.set()
+
+    def stats(self):
+        """
+        :return: Dict with the number of batches and requests, mean batch size, mean queueing
+                 delay, the number of failed batches retried one request at a time and the
+                 number of timed-out requests dropped from the queue.
+        """
+        with self.lock:
+            batches, n, waited, fallbacks = self.batches, self.batched_requests, self.queue_seconds, self.fallbacks
+            cancelled = self.cancelled
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": batches,
+            "requests": n,
+            "queued": self.requests.qsize(),
+            "mean_batch_size": n / batches if batches else 0.0,
+            "mean_queue_ms": waited / n * 1000.0 if n else 0.0,
+            "fallbacks": fallbacks,
+            "cancelled": cancelled,
+        }
+
+    def close(self):
+        """Run the queued requests, then stop the worker."""
+        self.requests.put(None)
+        self.worker.join()
@@ -1,217 +1,229 @@
+import os
+import json
 import time
-import uuid
 import eventlet
 eventlet.monkey_patch()
 
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for
 from flask_socketio import SocketIO, emit, join_room, leave_room
-from werkzeug.security import generate_password_hash, check_password_hash
 
 # ========== 1. 核心类定义 ==========
 
-class Grid:
-    """固定价格收购，数量无限。"""
-    def __init__(self, grid_price=0.3):
-        self.grid_price = grid_price
-
-    def buy_energy(self, quantity):
-        total = quantity * self.grid_price
-        print(f"[Grid] Buy {quantity} kWh at {self.grid_price} => total={total:.2f}")
-        return total
-
-class EnglishAuction:
-    def __init__(self, auction_id, quantity, grid_price=0.3,
-                 start_price=0.0,
-                 total_duration=3600, extension_duration=300):
-        self.auction_id = auction_id
-        self.quantity = quantity
-        self.grid = Grid(grid_price)
-
-        # 拍卖起始价
-        self.start_price = start_price
-        self.highest_bid = start_price  # <--- 初始化最高价=起始价
-
-        self.total_duration = total_duration
-        self.extension_duration = extension_duration
-        self.start_time = time.time()
-
-        self.highest_bidder = None
-        self.last_bid_time = None
-
-        self.auction_ended = False
-        self.canceled = False
-
-    def place_bid(self, bidder_name, bid_price):
-        if self.auction_ended:
-            return {"status": "fail", "msg": "Auction ended already"}
-        if self.canceled:
-            return {"status": "fail", "msg": "Auction canceled by seller"}
-        if bid_price <= self.highest_bid:
-            return {
-                "status": "fail",
-                "msg": f"Bid {bid_price} not higher than current {self.highest_bid}"
-            }
-
-        self.highest_bid = bid_price
-        self.highest_bidder = bidder_name
-        self.last_bid_time = time.time()
-        return {"status": "success", "msg": f"New highest bid={bid_price} by {bidder_name}"}
-
-    def get_remaining_time(self):
-        if self.auction_ended or self.canceled:
-            return 0
-
-        total_remaining = (self.start_time + self.total_duration) - time.time()
-
-        # 若无人出价 => extension_remaining = total_remaining
-        if self.last_bid_time is None:
-            extension_remaining = total_remaining
-        else:
-            extension_remaining = (self.last_bid_time + self.extension_duration) - time.time()
-
-        return max(0, max(total_remaining, extension_remaining))
-
-    def check_if_ended(self):
-        if self.auction_ended or self.canceled:
-            return
-
-        now = time.time()
-        # 若超总时长
-        if now > self.start_time + self.total_duration:
-            self.auction_ended = True
-            self._finalize_auction()
-            return
-
-        # 若有人出价过 且超了延长时长
-        if self.last_bid_time and (now > self.last_bid_time + self.extension_duration):
-            self.auction_ended = True
-            self._finalize_auction()
-
-    def _finalize_auction(self):
-        if self.highest_bid >= self.grid.grid_price and self.highest_bidder:
-            print(f"[P2PTradeAgent {self.auction_id}] Ended. Winner={self.highest_bidder}, Price={self.highest_bid}")
-        else:
-            cost = self.grid.buy_energy(self.quantity)
-            print(f"[P2PTradeAgent {self.auction_id}] Ended. Sold to Grid => cost={cost:.2f}")
-
-    def get_status(self):
-        st = "ended" if self.auction_ended or self.canceled else "ongoing"
-        time_left = self.get_remaining_time()
-        status_dict = {
-            "auction_id": self.auction_id,
-            "quantity": self.quantity,
-            "total_duration": self.total_duration,
-            "extension_duration": self.extension_duration,
-            "start_time": self.start_time,
-            "highest_bid": self.highest_bid,
-            "highest_bidder": self.highest_bidder,
-            "time_left": time_left,
-            "status": st
-        }
-
-        if self.canceled:
-            status_dict["winner"] = "Canceled"
-        elif self.auction_ended:
-            if self.highest_bid >= self.grid.grid_price and self.highest_bidder:
-                status_dict["winner"] = self.highest_bidder
-                status_dict["price"] = self.highest_bid
-            else:
-                status_dict["winner"] = "Grid"
-                status_dict["price"] = self.grid.grid_price
-
-        return status_dict
-
-class AuctionManager:
-    def __init__(self):
-        self.auctions = {}
-        self.auction_seller_map = {}
-
-    def create_auction(self, seller_id, quantity, grid_price=0.3,
-                       start_price=0.0,
-                       total_duration=3600, extension_duration=300):
-        auction_id = str(uuid.uuid4())[:8]
-        auc = EnglishAuction(
-            auction_id=auction_id,
-            quantity=quantity,
-            grid_price=grid_price,
-            start_price=start_price,   # <-- 关键：传给EnglishAuction
-            total_duration=total_duration,
-            extension_duration=extension_duration
-        )
-        self.auctions[auction_id] = auc
-        self.auction_seller_map[auction_id] = seller_id
-        print(f"[P2PTradeAgent] Created Auction {auction_id} by Seller {seller_id}, start_price={start_price}")
-        return auction_id
-
-    def get_auction(self, auction_id):
-        return self.auctions.get(auction_id)
-
-    def cancel_auction(self, auction_id, seller_id):
-        auc = self.auctions.get(auction_id)
-        if not auc:
-            return {"status": "fail", "msg": "Auction not found"}
-        if self.auction_seller_map.get(auction_id) != seller_id:
-            return {"status": "fail", "msg": "Not your auction"}
-        if auc.auction_ended or auc.canceled:
-            return {"status": "fail", "msg": "Auction ended/canceled already."}
-
-        auc.canceled = True
-        auc.auction_ended = True
-        return {"status": "success", "msg": f"Auction {auction_id} canceled."}
-
-    def list_all_auctions(self):
-        return [auc.get_status() for auc in self.auctions.values()]
-
-    def list_seller_auctions(self, seller_id):
-        return [
-            self.auctions[aid].get_status()
-            for aid, sid in self.auction_seller_map.items()
-            if sid == seller_id
-        ]
-
-    def check_all_auctions(self):
-        for aid, auc in self.auctions.items():
-            if not auc.auction_ended and not auc.canceled:
-                auc.check_if_ended()
-                if auc.auction_ended or auc.canceled:
-                    # 拍卖刚结束 => 广播
-                    socketio.emit("auction_status", auc.get_status(), room=aid)
+from agents.p2p_trading_agent.auction import Grid, EnglishAuction, AuctionManager, AuctionArchive
+from agents.p2p_trading_agent.list_broadcast import AuctionListBroadcaster
+from agents.p2p_trading_agent.order_book import OrderBookManager
+from agents.p2p_trading_agent.bidding import BidProcessor, RateLimiter
+from agents.p2p_trading_agent.auth import PasswordHasher, AuthCache, UserManager
+from agents.p2p_trading_agent.bus import IPCBus, BusClientManager
+from agents.p2p_trading_agent.cluster import ShardRouter
+from utils.event_log import EventLog
+from utils import metrics
 
 
 # ========== 2. 全局实例和初始化 ==========
 
-manager = AuctionManager()
+# 拍卖和用户的预写日志目录（设为空字符串可关闭持久化）
+EVENT_LOG_DIR = os.environ.get("P2P_EVENT_LOG_DIR", "./static/p2p_events")
+# fsync 会阻塞 eventlet 的事件循环; 默认只 write+flush (进程崩溃不丢数据, 断电可能丢最后一批)
+EVENT_LOG_FSYNC = os.environ.get("P2P_EVENT_LOG_FSYNC", "0") == "1"
+
+# 多进程模式 (python -m agents.p2p_trading_agent.cluster): 拍卖按 id 分片到各个 worker,
+# Socket.IO 消息和跨分片的请求通过消息总线转发
+WORKERS = int(os.environ.get("P2P_WORKERS", "1"))
+WORKER_INDEX = int(os.environ.get("P2P_WORKER_INDEX", "0"))
+bus = IPCBus(os.environ["P2P_BUS_ADDRESS"]) if WORKERS > 1 else None
+ARCHIVE_PATH = "./static/auction_archive.jsonl"
+if bus is not None:
+    EVENT_LOG_DIR = EVENT_LOG_DIR and os.path.join(EVENT_LOG_DIR, f"worker-{WORKER_INDEX}")
+    ARCHIVE_PATH = f"./static/auction_archive-{WORKER_INDEX}.jsonl"
+
+TICK_SECONDS = metrics.histogram("p2p_tick_seconds", "Duration of one pass of a background task", ["task"])
+EMIT_BYTES = metrics.histogram("p2p_socketio_emit_bytes", "Encoded size of outgoing Socket.IO events",
+                               ["event"], buckets=metrics.SIZE_BUCKETS)
+
+
+class MeasuredJSON:
+    """
+    JSON module for Socket.IO packets that records the size of every encoded event.
+    Each emit is encoded once whatever the number of recipients, so this costs one
+    len() per emit and no extra serialisation.
+    """
+    loads = staticmethod(json.loads)
+
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        text = json.dumps(obj, *args, **kwargs)
+        # 事件包的数据是 [event, *args]
+        if isinstance(obj, list) and obj and isinstance(obj[0], str):
+            EMIT_BYTES.labels(obj[0]).observe(len(text))
+        return text
+
+
 app = Flask(__name__,template_folder="templates")
 app.config["SECRET_KEY"] = "secret!123"
-socketio = SocketIO(app, async_mode="eventlet")
+socketio = SocketIO(app, async_mode="eventlet", json=MeasuredJSON,
+                    client_manager=BusClientManager(bus) if bus is not None else None)
+router = None
+if bus is not None:
+    router = ShardRouter(bus, WORKER_INDEX, WORKERS, spawn=socketio.start_background_task)
+# 页面里 Socket.IO 客户端的参数; 多进程时连续的 HTTP 请求可能落到不同 worker, 只能用 websocket
+app.jinja_env.globals["socketio_options"] = {"transports": ["websocket"]} if bus is not None else {}
+
+# 结束一小时后的拍卖移入归档文件, 内存中只保留最近结果的缓存
+manager = AuctionManager(archive=AuctionArchive(ARCHIVE_PATH), archive_after=3600,
+                         id_factory=router.new_key if router is not None else None)
+# 连续双向拍卖: 每个交割小时一个订单簿
+order_books = OrderBookManager()
+# 拍卖列表只推送变化的部分, 按订阅条件分组
+list_broadcaster = AuctionListBroadcaster(
+    manager, lambda event, data, room: socketio.emit(event, data, room=room)
+)
+def reply_bid(client, res):
+    # 客户端可以带 req_id, 回复时原样带回, 用于匹配出价和响应
+    sid, req_id = client
+    if req_id is not None:
+        res = dict(res, req_id=req_id)
+    socketio.emit("bid_response", res, to=sid)
+
+# 出价按拍卖排队, 每个拍卖由一个任务按顺序分批处理; 每批只向房间广播一次最高价
+bid_processor = BidProcessor(
+    manager,
+    reply=reply_bid,
+    broadcast=lambda auc: socketio.emit("auction_status", auc.get_status(), room=auc.auction_id),
+    spawn=socketio.start_background_task,
+    sleep=socketio.sleep,
+    batch_window=0.01,
+    rate_limiter=RateLimiter(rate=5.0, burst=10),
+)
 
 
 # ========== 3. 用户管理系统 ==========
 
-class UserManager:
-    def __init__(self):
-        # 初始化一个admin
-        self.users = {
-            "admin": {
-                "password": generate_password_hash("admin123")
-            }
-        }
+# 密码哈希在原生线程池中计算, 最多 2 个并发; 重复登录命中缓存, 不再计算哈希
+user_manager = UserManager(hasher=PasswordHasher(max_concurrency=2),
+                           auth_cache=AuthCache(app.config["SECRET_KEY"], ttl=600))
+
+# 采集时才读取的指标, 热路径上没有额外开销
+metrics.gauge("p2p_ongoing_auctions", "Auctions still open for bids").set_function(lambda: len(manager.ongoing))
+metrics.gauge("p2p_auctions_in_memory", "Auctions held in memory (not archived)").set_function(
+    lambda: len(manager.auctions))
+metrics.gauge("p2p_open_order_books", "Order books not yet closed").set_function(lambda: len(order_books.books))
+metrics.gauge("p2p_bid_queues", "Auctions with queued bids").set_function(lambda: len(bid_processor.queues))
+metrics.counter("p2p_auth_cache_hits_total", "Logins answered from the auth cache").set_function(
+    lambda: user_manager.auth_cache.hits)
+metrics.counter("p2p_auth_cache_misses_total", "Logins that needed a password hash").set_function(
+    lambda: user_manager.auth_cache.misses)
+
+if EVENT_LOG_DIR:
+    # 重启时从快照 + 日志尾部恢复拍卖 (创建/出价/取消/结束/归档) 和用户, 之后的变化批量写入日志
+    auction_log = EventLog(os.path.join(EVENT_LOG_DIR, "auctions"), fsync=EVENT_LOG_FSYNC,
+                           snapshot_provider=manager.export_state)
+    replayed, elapsed = auction_log.recover(manager.apply_event, manager.load_state)
+    manager.restore_indexes()
+    manager.event_log = auction_log
+    print(f"[P2PTradeAgent] Restored {len(manager.auctions)} auctions, replayed {replayed} events in {elapsed:.3f}s")
+
+    user_log = EventLog(os.path.join(EVENT_LOG_DIR, "users"), fsync=EVENT_LOG_FSYNC,
+                        snapshot_provider=user_manager.export_state, snapshot_every=10000)
+    user_log.recover(user_manager.apply_event, user_manager.load_state)
+    user_manager.event_log = user_log
+
+
+# ========== 分片请求 ==========
+# 每个处理函数在拥有该拍卖/订单簿的 worker 上执行; 单进程时直接在本地执行
+
+def shard_auction_status(auction_id):
+    return manager.get_auction_status(auction_id)
+
+def shard_place_bid(p):
+    # 结果由该拍卖的处理任务通过 bid_response 回复 (经消息总线送到客户端所在的 worker)
+    bid_processor.submit((p["sid"], p["req_id"]), p["user"], p["auction_id"], p["price"])
 
-    def add_user(self, username, password):
-        if username in self.users:
-            return False
-        self.users[username] = {
-            "password": generate_password_hash(password)
-        }
-        return True
+def shard_list_auctions(_):
+    return manager.list_all_auctions()
 
-    def verify_user(self, username, password):
-        user = self.users.get(username)
-        if user and check_password_hash(user["password"], password):
-            return user
-        return None
+def shard_seller_auctions(seller_id):
+    return manager.list_seller_auctions(seller_id)
 
-user_manager = UserManager()
+def shard_query_auctions(kwargs):
+    return manager.query_auctions(**kwargs)
+
+def shard_subscribe_auctions(p):
+    return list_broadcaster.subscribe(p["sid"], p["data"])[2]
+
+def shard_unsubscribe_auctions(sid):
+    list_broadcaster.unsubscribe(sid)
+
+def shard_place_order(p):
+    res = order_books.submit(p["owner"], p["delivery_hour"], p["side"], p["price"], p["quantity"])
+    if res["status"] == "success":
+        room = f"order_book:{p['delivery_hour']}"
+        if res["trades"]:
+            socketio.emit("order_book_trades", {"delivery_hour": p["delivery_hour"], "trades": res["trades"]}, room=room)
+        socketio.emit("order_book_status", order_books.get_book(p["delivery_hour"]).get_status(), room=room)
+    return res
+
+def shard_cancel_order(p):
+    res = order_books.cancel(p["delivery_hour"], p["order_id"], p["owner"])
+    if res["status"] == "success":
+        socketio.emit("order_book_status", order_books.get_book(p["delivery_hour"]).get_status(),
+                      room=f"order_book:{p['delivery_hour']}")
+    return res
+
+def shard_order_book(p):
+    book = order_books.get_book(p["delivery_hour"])
+    return book.get_status(depth=p.get("depth", 5)) if book else None
+
+def shard_claim_user(p):
+    return user_manager.claim(p[0], p[1])
+
+def shard_add_user(p):
+    user_manager.add_hashed(p[0], p[1])
+
+def shard_metrics(_):
+    return {"worker": WORKER_INDEX, "families": metrics.REGISTRY.collect()}
+
+SHARD_HANDLERS = {
+    "auction_status": shard_auction_status,
+    "place_bid": shard_place_bid,
+    "list_auctions": shard_list_auctions,
+    "seller_auctions": shard_seller_auctions,
+    "query_auctions": shard_query_auctions,
+    "subscribe_auctions": shard_subscribe_auctions,
+    "unsubscribe_auctions": shard_unsubscribe_auctions,
+    "place_order": shard_place_order,
+    "cancel_order": shard_cancel_order,
+    "order_book": shard_order_book,
+    "claim_user": shard_claim_user,
+    "add_user": shard_add_user,
+    "metrics": shard_metrics,
+}
+if router is not None:
+    for kind, func in SHARD_HANDLERS.items():
+        router.handle(kind, func)
+    # 用户名和拍卖一样按 key 分片: 所属 worker 决定注册是否成功, 再同步给其他 worker
+    user_manager.owner_call = lambda username, pwhash: router.call(
+        router.owner_of(username), "claim_user", [username, pwhash])
+    user_manager.listener = lambda username, pwhash: router.broadcast("add_user", [username, pwhash])
+
+def on_owner(key, kind, payload):
+    """在拥有 key (拍卖 id / 交割小时) 的 worker 上执行并返回结果。"""
+    if router is None or router.is_local(key):
+        return SHARD_HANDLERS[kind](payload)
+    return router.call(router.owner_of(key), kind, payload)
+
+def send_to_owner(key, kind, payload):
+    """同 on_owner, 但不等待结果。"""
+    if router is None or router.is_local(key):
+        SHARD_HANDLERS[kind](payload)
+    else:
+        router.send(router.owner_of(key), kind, payload)
+
+def on_all(kind, payload):
+    """在所有 worker 上执行, 返回结果列表 (本 worker 的在最前)。"""
+    if router is None:
+        return [SHARD_HANDLERS[kind](payload)]
+    return router.gather(kind, payload)
 
 
 # ========== 4. Flask 路由 ==========
@@ -264,9 +276,46 @@ def seller_main():
 
 @app.route("/api/list_auctions", methods=["GET"])
 def list_auctions_api():
-    data = manager.list_all_auctions()
+    data = [st for part in on_all("list_auctions", None) for st in part]
     return jsonify(data)
 
+@app.route("/api/auctions", methods=["GET"])
+def query_auctions_api():
+    """
+    分页查询: status (ongoing/ended), seller, sort (created/end_time), offset, limit,
+    archived=1 时包括已归档的拍卖。
+    """
+    args = request.args
+    query = dict(
+        status=args.get("status") or None,
+        seller=args.get("seller") or None,
+        sort=args.get("sort", "created"),
+        offset=max(0, int(args.get("offset", 0))),
+        limit=min(500, max(1, int(args.get("limit", 50)))),
+        include_archived=args.get("archived") in ("1", "true"),
+    )
+    if router is None:
+        return jsonify(manager.query_auctions(**query))
+
+    # 多进程: 每个分片返回前 offset+limit 个, 合并排序后再分页
+    offset, limit = query["offset"], query["limit"]
+    parts = router.gather("query_auctions", dict(query, offset=0, limit=offset + limit))
+    key = "end_time" if query["sort"] == "end_time" else "start_time"
+    auctions = sorted((a for part in parts for a in part["auctions"]), key=lambda a: a[key])
+    return jsonify({
+        "total": sum(part["total"] for part in parts),
+        "offset": offset,
+        "limit": limit,
+        "auctions": auctions[offset:offset + limit],
+    })
+
+@app.route("/api/auction/<auction_id>", methods=["GET"])
+def auction_status_api(auction_id):
+    st = on_owner(auction_id, "auction_status", auction_id)
+    if st is None:
+        return jsonify({"status":"fail","msg":"Auction not found"}), 404
+    return jsonify(st)
+
 @app.route("/api/create_auction", methods=["POST"])
 def create_auction_api():
     # 如果没登录, 返回JSON而非跳转HTML
@@ -297,22 +346,116 @@ def list_seller_auctions_api():
     if "user" not in session or not session["user"]:
         return jsonify({"status":"fail","msg":"Please login first"}), 401
     seller_id = session["user"]
-    data = manager.list_seller_auctions(seller_id)
+    parts = on_all("seller_auctions", seller_id)
+    data = parts[0] if len(parts) == 1 else sorted(
+        (a for part in parts for a in part), key=lambda a: a["start_time"])[-100:]
     return jsonify(data)
 
 
+@app.route("/api/place_order", methods=["POST"])
+def place_order_api():
+    """
+    在订单簿中挂限价单: delivery_hour ("YYYY-MM-DD HH:00"), side ("buy"/"sell"), price, quantity。
+    立即按价格-时间优先撮合, 未成交部分留在订单簿中。
+    """
+    if "user" not in session or not session["user"]:
+        return jsonify({"status":"fail","msg":"Please login first"}), 401
+
+    payload = request.json if request.is_json else request.form
+    delivery_hour = payload.get("delivery_hour", "")
+    res = on_owner(delivery_hour, "place_order", {
+        "owner": session["user"],
+        "delivery_hour": delivery_hour,
+        "side": payload.get("side"),
+        "price": float(payload.get("price", 0)),
+        "quantity": float(payload.get("quantity", 0)),
+    })
+    return jsonify(res)
+
+@app.route("/api/cancel_order", methods=["POST"])
+def cancel_order_api():
+    if "user" not in session or not session["user"]:
+        return jsonify({"status":"fail","msg":"Please login first"}), 401
+
+    payload = request.json if request.is_json else request.form
+    delivery_hour = payload.get("delivery_hour", "")
+    res = on_owner(delivery_hour, "cancel_order", {
+        "owner": session["user"],
+        "delivery_hour": delivery_hour,
+        "order_id": int(payload.get("order_id", 0)),
+    })
+    return jsonify(res)
+
+@app.route("/api/order_book", methods=["GET"])
+def order_book_api():
+    delivery_hour = request.args.get("delivery_hour", "")
+    st = on_owner(delivery_hour, "order_book",
+                  {"delivery_hour": delivery_hour, "depth": int(request.args.get("depth", 5))})
+    if st is None:
+        return jsonify({"status":"fail","msg":"Order book not found"}), 404
+    return jsonify(st)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus metrics; in multi-worker mode the samples of every worker, labelled by worker."""
+    if router is None:
+        text = metrics.REGISTRY.render()
+    else:
+        parts = router.gather("metrics", None)
+        families = metrics.merge_families([p["families"] for p in parts], "worker", [p["worker"] for p in parts])
+        text = metrics.render_text(families)
+    return Response(text, content_type=metrics.CONTENT_TYPE)
+
+
 # ========== 6. SocketIO事件处理 ==========
 
 @socketio.on("join_auction")
 def handle_join_auction(data):
     auction_id = data.get("auction_id")
-    if auction_id not in manager.auctions:
+    st = on_owner(auction_id, "auction_status", auction_id)  # 已归档的拍卖返回最终结果
+    if st is None:
         emit("error", {"msg": f"Auction {auction_id} not found"})
         return
     join_room(auction_id)
-    st = manager.get_auction(auction_id).get_status()
     emit("auction_status", st, room=auction_id)
 
+@socketio.on("join_order_book")
+def handle_join_order_book(data):
+    delivery_hour = data.get("delivery_hour")
+    st = on_owner(delivery_hour, "order_book", {"delivery_hour": delivery_hour})
+    if st is None:
+        emit("error", {"msg": f"Order book {delivery_hour} not found"})
+        return
+    join_room(f"order_book:{delivery_hour}")
+    emit("order_book_status", st)
+
+@socketio.on("subscribe_auctions")
+def handle_subscribe_auctions(data):
+    """
+    订阅拍卖列表: 可按 status / seller / min_price / max_price 过滤。
+    先发送一次完整快照 (或 since 版本之后的变化), 之后只推送变化。
+    """
+    old_room = list_broadcaster.sid_room.get(request.sid)
+    room = list_broadcaster.room_for(list_broadcaster.normalize_filter(data))
+    # 每个分片都登记该过滤条件, 之后各自把自己拍卖的变化推送到同一个房间
+    parts = on_all("subscribe_auctions", {"sid": request.sid, "data": data})
+    payload = parts[0]
+    if len(parts) > 1:
+        # 各分片的版本号互不相关: 合并成一个完整快照, 重连时总是重新获取
+        payload = dict(payload, epoch=None, reset=True, removed=[],
+                       auctions=[a for part in parts for a in part["auctions"]])
+    if old_room and old_room != room:
+        leave_room(old_room)
+    join_room(room)
+    emit("auction_list_snapshot", payload)
+
+@socketio.on("disconnect")
+def handle_disconnect(*args):
+    list_broadcaster.unsubscribe(request.sid)
+    if router is not None:
+        router.broadcast("unsubscribe_auctions", request.sid)
+
 @socketio.on("place_bid")
 def handle_place_bid(data):
     auction_id = data.get("auction_id")
@@ -322,27 +465,47 @@ def handle_place_bid(data):
         emit("bid_response", {"status":"fail","msg":"Please login first"})
         return
 
-    bidder_name = session["user"]
-    auc = manager.get_auction(auction_id)
-    if not auc:
-        emit("bid_response", {"status": "fail", "msg": "Auction not found"})
-        return
-
-    res = auc.place_bid(bidder_name, float(bid_price))
-    emit("bid_response", res)
-
-    if res["status"] == "success":
-        socketio.emit("auction_status", auc.get_status(), room=auction_id)
+    # 出价转发给拥有该拍卖的 worker, 结果由那里的处理任务通过 bid_response 回复
+    send_to_owner(auction_id, "place_bid", {
+        "sid": request.sid,
+        "req_id": data.get("req_id"),
+        "user": session["user"],
+        "auction_id": auction_id,
+        "price": float(bid_price),
+    })
 
 
 # ========== 7. 后台监控线程 ==========
-def background_monitor():
+def expiry_monitor():
+    """睡到下一个截止时间 (或有更早的截止时间时被唤醒), 结束到期的拍卖并广播。"""
+    tick_seconds = TICK_SECONDS.labels("expiry")
     while True:
-        socketio.sleep(3)
-        manager.check_all_auctions()
-        # 推送全局拍卖列表更新
-        socketio.emit("auction_list_update", manager.list_all_auctions())
+        with tick_seconds.time():
+            for auc in manager.check_all_auctions():
+                # 拍卖刚结束 => 广播
+                socketio.emit("auction_status", auc.get_status(), room=auc.auction_id)
+        deadline = manager.next_deadline()
+        # check_if_ended 使用严格大于, 多等 1ms
+        timeout = None if deadline is None else max(0.0, deadline - time.time() + 0.001)
+        manager.wakeup.wait(timeout)
+        manager.wakeup.clear()
 
+def background_monitor():
+    tick_seconds = TICK_SECONDS.labels("background")
+    while True:
+        socketio.sleep(1)
+        with tick_seconds.time():
+            # 归档结束已久的拍卖, 再推送拍卖列表的变化 (没有变化时不发送)
+            manager.archive_ended()
+            list_broadcaster.broadcast()
+            # 到达关闸时间的订单簿: 剩余电量按电网价格结算
+            for book, grid_trades in order_books.close_due():
+                socketio.emit("order_book_closed", {
+                    "status": book.get_status(),
+                    "grid_trades": [t._asdict() for t in grid_trades],
+                }, room=f"order_book:{book.delivery_hour}")
+
+socketio.start_background_task(expiry_monitor)
 socketio.start_background_task(background_monitor)
 
 
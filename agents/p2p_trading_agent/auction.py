@@ -0,0 +1,657 @@
+import os
+import re
+import json
+import time
+import uuid
+import heapq
+import bisect
+import itertools
+import threading
+from collections import OrderedDict, deque
+
+class Grid:
+    """固定价格收购，数量无限。"""
+    def __init__(self, grid_price=0.3):
+        self.grid_price = grid_price
+
+    def buy_energy(self, quantity):
+        total = quantity * self.grid_price
+        print(f"[Grid] Buy {quantity} kWh at {self.grid_price} => total={total:.2f}")
+        return total
+
+class EnglishAuction:
+    def __init__(self, auction_id, quantity, grid_price=0.3,
+                 start_price=0.0,
+                 total_duration=3600, extension_duration=300):
+        self.auction_id = auction_id
+        self.quantity = quantity
+        self.grid = Grid(grid_price)
+
+        # 拍卖起始价
+        self.start_price = start_price
+        self.highest_bid = start_price  # <--- 初始化最高价=起始价
+
+        self.total_duration = total_duration
+        self.extension_duration = extension_duration
+        self.start_time = time.time()
+
+        self.highest_bidder = None
+        self.last_bid_time = None
+
+        self.auction_ended = False
+        self.canceled = False
+
+        # 出价成功后的回调 (AuctionManager 用来更新截止时间堆和版本号)
+        self.bid_listener = None
+
+    def place_bid(self, bidder_name, bid_price):
+        if self.auction_ended:
+            return {"status": "fail", "msg": "Auction ended already"}
+        if self.canceled:
+            return {"status": "fail", "msg": "Auction canceled by seller"}
+        if bid_price <= self.highest_bid:
+            return {
+                "status": "fail",
+                "msg": f"Bid {bid_price} not higher than current {self.highest_bid}"
+            }
+
+        self.highest_bid = bid_price
+        self.highest_bidder = bidder_name
+        self.last_bid_time = time.time()
+        if self.bid_listener:
+            self.bid_listener(self)
+        return {"status": "success", "msg": f"New highest bid={bid_price} by {bidder_name}"}
+
+    def get_remaining_time(self):
+        if self.auction_ended or self.canceled:
+            return 0
+
+        total_remaining = (self.start_time + self.total_duration) - time.time()
+
+        # 若无人出价 => extension_remaining = total_remaining
+        if self.last_bid_time is None:
+            extension_remaining = total_remaining
+        else:
+            extension_remaining = (self.last_bid_time + self.extension_duration) - time.time()
+
+        return max(0, max(total_remaining, extension_remaining))
+
+    def end_time(self):
+        """拍卖按 check_if_ended 的规则结束的时间点。"""
+        deadline = self.start_time + self.total_duration
+        if self.last_bid_time:
+            deadline = min(deadline, self.last_bid_time + self.extension_duration)
+        return deadline
+
+    def check_if_ended(self, now=None):
+        if self.auction_ended or self.canceled:
+            return
+
+        if now is None:
+            now = time.time()
+        # 若超总时长
+        if now > self.start_time + self.total_duration:
+            self.auction_ended = True
+            self._finalize_auction()
+            return
+
+        # 若有人出价过 且超了延长时长
+        if self.last_bid_time and (now > self.last_bid_time + self.extension_duration):
+            self.auction_ended = True
+            self._finalize_auction()
+
+    def _finalize_auction(self):
+        if self.highest_bid >= self.grid.grid_price and self.highest_bidder:
+            print(f"[P2PTradeAgent {self.auction_id}] Ended. Winner={self.highest_bidder}, Price={self.highest_bid}")
+        else:
+            cost = self.grid.buy_energy(self.quantity)
+            print(f"[P2PTradeAgent {self.auction_id}] Ended. Sold to Grid => cost={cost:.2f}")
+
+    def get_status(self):
+        st = "ended" if self.auction_ended or self.canceled else "ongoing"
+        time_left = self.get_remaining_time()
+        status_dict = {
+            "auction_id": self.auction_id,
+            "quantity": self.quantity,
+            "total_duration": self.total_duration,
+            "extension_duration": self.extension_duration,
+            "start_time": self.start_time,
+            "highest_bid": self.highest_bid,
+            "highest_bidder": self.highest_bidder,
+            "time_left": time_left,
+            "end_time": self.end_time(),
+            "status": st
+        }
+
+        if self.canceled:
+            status_dict["winner"] = "Canceled"
+        elif self.auction_ended:
+            if self.highest_bid >= self.grid.grid_price and self.highest_bidder:
+                status_dict["winner"] = self.highest_bidder
+                status_dict["price"] = self.highest_bid
+            else:
+                status_dict["winner"] = "Grid"
+                status_dict["price"] = self.grid.grid_price
+
+        return status_dict
+
+class AuctionArchive:
+    """
+    已结束拍卖的归档。
+
+    The final status of every archived auction is appended as one JSON line to
+    the current segment file; memory only holds the (segment, offset) per
+    auction id, the ids per seller and an LRU cache of the ``cache_size`` most
+    recently used results. A segment holds ``segment_size`` results; ``path``
+    itself is segment 0 and later ones are written next to it as
+    ``<name>.<n><ext>``. Only the newest ``max_segments`` segments are kept:
+    when a new one starts, the oldest file is deleted and its ids leave the
+    index, so memory and disk stay bounded. Without a path only the LRU cache
+    is kept, so at most ``cache_size`` results are remembered.
+    """
+    def __init__(self, path=None, cache_size=1000, segment_size=100000, max_segments=10):
+        """
+        :param path: JSON lines file of the first segment, or None for an in-memory LRU only.
+        :param cache_size: Number of results kept in memory.
+        :param segment_size: Results per segment file.
+        :param max_segments: Segments kept; older results are forgotten.
+        """
+        self.path = path
+        self.cache_size = cache_size
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.cache = OrderedDict()
+        # auction_id -> (segment, offset), or None without a file
+        self.offsets = {}
+        self.seller_ids = {}
+        # segment -> [(auction_id, seller)] in archive order, oldest segment first
+        self.segments = OrderedDict()
+        self.segment = 0
+        self.segment_count = 0
+        self.lock = threading.Lock()
+        self._file = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._load_index()
+            self.segments.setdefault(self.segment, [])
+            self._file = open(self._segment_path(self.segment), "ab")
+
+    def _segment_path(self, segment):
+        if segment == 0:
+            return self.path
+        root, ext = os.path.splitext(self.path)
+        return f"{root}.{segment}{ext}"
+
+    def _segment_numbers(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        root, ext = os.path.splitext(os.path.basename(self.path))
+        pattern = re.compile(re.escape(root) + r"\.(\d+)" + re.escape(ext) + "$")
+        numbers = [int(m.group(1)) for m in map(pattern.match, os.listdir(directory)) if m]
+        if os.path.exists(self.path):
+            numbers.append(0)
+        return sorted(numbers)
+
+    def _load_index(self):
+        for segment in self._segment_numbers():
+            seg_path = self._segment_path(segment)
+            self.segment, self.segment_count = segment, 0
+            self.segments[segment] = []
+            offset = 0
+            with open(seg_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    rec = json.loads(line)
+                    self._index(rec["auction_id"], rec.get("seller"), (segment, offset))
+                    offset += len(line)
+                    self.segment_count += 1
+            if offset < os.path.getsize(seg_path):
+                # 上次写到一半的记录
+                with open(seg_path, "r+b") as f:
+                    f.truncate(offset)
+        self._expire_segments()
+
+    def _index(self, auction_id, seller, location):
+        self.offsets[auction_id] = location
+        self.seller_ids.setdefault(seller, {})[auction_id] = None
+        if location is not None:
+            self.segments[location[0]].append((auction_id, seller))
+
+    def _rotate(self):
+        self._file.close()
+        self.segment += 1
+        self.segment_count = 0
+        self.segments[self.segment] = []
+        self._file = open(self._segment_path(self.segment), "ab")
+        self._expire_segments()
+
+    def _expire_segments(self):
+        while len(self.segments) > self.max_segments:
+            segment, ids = self.segments.popitem(last=False)
+            for auction_id, seller in ids:
+                location = self.offsets.get(auction_id)
+                # Skip ids archived again in a newer segment
+                if location is not None and location[0] == segment:
+                    del self.offsets[auction_id]
+                    self.cache.pop(auction_id, None)
+                    self._forget_seller(seller, auction_id)
+            seg_path = self._segment_path(segment)
+            if os.path.exists(seg_path):
+                os.remove(seg_path)
+
+    def _cache_put(self, auction_id, status):
+        self.cache[auction_id] = status
+        self.cache.move_to_end(auction_id)
+        while len(self.cache) > self.cache_size:
+            old_id, old = self.cache.popitem(last=False)
+            if self._file is None:
+                # 没有归档文件时, 移出缓存即遗忘
+                del self.offsets[old_id]
+                self._forget_seller(old.get("seller"), old_id)
+
+    def _forget_seller(self, seller, auction_id):
+        ids = self.seller_ids.get(seller)
+        if ids is not None:
+            ids.pop(auction_id, None)
+            if not ids:
+                del self.seller_ids[seller]
+
+    def add(self, status, seller):
+        """Archive the final status of an auction sold by ``seller``."""
+        status = dict(status, seller=seller)
+        with self.lock:
+            location = None
+            if self._file is not None:
+                if self.segment_count >= self.segment_size:
+                    self._rotate()
+                location = (self.segment, self._file.tell())
+                self._file.write(json.dumps(status, separators=(",", ":")).encode("utf-8") + b"\n")
+                self._file.flush()
+                self.segment_count += 1
+            self._index(status["auction_id"], seller, location)
+            self._cache_put(status["auction_id"], status)
+
+    def get(self, auction_id):
+        with self.lock:
+            status = self.cache.get(auction_id)
+            if status is not None:
+                self.cache.move_to_end(auction_id)
+                return status
+            location = self.offsets.get(auction_id)
+            if location is None or self.path is None:
+                return None
+            segment, offset = location
+            with open(self._segment_path(segment), "rb") as f:
+                f.seek(offset)
+                status = json.loads(f.readline())
+            self._cache_put(auction_id, status)
+            return status
+
+    def __contains__(self, auction_id):
+        return auction_id in self.offsets
+
+    def count(self, seller=None):
+        if seller is None:
+            return len(self.offsets)
+        return len(self.seller_ids.get(seller, ()))
+
+    def page(self, seller=None, offset=0, limit=50):
+        """Archived results in archive order (oldest first), ``limit`` of them from ``offset``."""
+        ids = self.offsets if seller is None else self.seller_ids.get(seller, {})
+        page_ids = list(itertools.islice(ids, offset, offset + limit))
+        return [st for st in map(self.get, page_ids) if st is not None]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class AuctionManager:
+    """
+    管理所有拍卖。
+
+    Auction deadlines are kept in a min-heap of (end_time, auction_id). A bid
+    pushes the auction's new deadline; superseded entries are dropped lazily
+    when they reach the top. check_all_auctions therefore only touches auctions
+    whose deadline has passed, and the monitor can sleep exactly until
+    next_deadline(), woken early through ``wakeup`` when an earlier deadline
+    appears.
+
+    Every change (create, bid, cancel, end, archive) bumps a global ``version``
+    and records it for the auction, kept in change order, so changed_since()
+    returns the auctions changed after a given version in O(changes).
+
+    Secondary indexes keep the auction ids per seller, the ongoing auctions and
+    the ongoing auctions sorted by end time, so the list queries never scan all
+    auctions. ``archive_after`` seconds after an auction ends it moves into the
+    AuctionArchive and leaves ``auctions``, which keeps memory bounded.
+    """
+    def __init__(self, archive=None, archive_after=3600, change_log_size=10000, id_factory=None):
+        """
+        :param archive: AuctionArchive for ended auctions (default: in-memory LRU only).
+        :param archive_after: Seconds an ended auction stays live before it is archived.
+        :param change_log_size: Number of archived auctions remembered in the change log;
+                                clients asking for changes older than that get a full snapshot.
+        :param id_factory: Callable returning a new auction id; in multi-worker mode the ids
+                           are drawn so that they hash to this worker's shard.
+        """
+        self.auctions = {}
+        self.auction_seller_map = {}
+        self.id_factory = id_factory or (lambda: str(uuid.uuid4())[:8])
+        self.deadlines = []
+        self.wakeup = threading.Event()
+        self.version = 0
+        self.changes = OrderedDict()
+
+        # 二级索引
+        self.seller_index = {}
+        self.ongoing = {}
+        self.end_index = []
+        self.indexed_end = {}
+        self.ended_queue = deque()
+
+        self.archive = archive or AuctionArchive()
+        self.archive_after = archive_after
+        self.change_log_size = change_log_size
+        self.archived_changes = deque()
+        self.min_version = 0
+        # 每次启动不同; 客户端带着旧 epoch 的版本号重连时收到完整快照
+        self.epoch = uuid.uuid4().hex[:8]
+
+        # Optional utils.event_log.EventLog (write-ahead log). Records are compact
+        # lists [type, auction_id, ...]; see apply_event for the layout.
+        self.event_log = None
+
+    def _log(self, record):
+        if self.event_log is not None:
+            self.event_log.append(record)
+
+    def _touch(self, auction_id):
+        self.version += 1
+        self.changes[auction_id] = self.version
+        self.changes.move_to_end(auction_id)
+
+    def _on_bid(self, auc):
+        self._log(["bid", auc.auction_id, auc.highest_bidder, auc.highest_bid, auc.last_bid_time])
+        self._schedule(auc)
+        self._index_end(auc)
+        self._touch(auc.auction_id)
+
+    def _index_end(self, auc):
+        aid = auc.auction_id
+        old = self.indexed_end.pop(aid, None)
+        if old is not None:
+            del self.end_index[bisect.bisect_left(self.end_index, (old, aid))]
+        if aid in self.ongoing:
+            end = auc.end_time()
+            bisect.insort(self.end_index, (end, aid))
+            self.indexed_end[aid] = end
+
+    def _mark_ended(self, auc, now):
+        self._log(["cancel" if auc.canceled else "end", auc.auction_id, now])
+        self.ongoing.pop(auc.auction_id, None)
+        self._index_end(auc)
+        self.ended_queue.append((now, auc.auction_id))
+        self._touch(auc.auction_id)
+
+    def changed_since(self, version):
+        """拍卖 id 列表: 在 version 之后有变化的拍卖 (按变化顺序)。"""
+        changed = []
+        for aid in reversed(self.changes):
+            if self.changes[aid] <= version:
+                break
+            changed.append(aid)
+        changed.reverse()
+        return changed
+
+    def _schedule(self, auc):
+        deadline = auc.end_time()
+        earliest = self.deadlines[0][0] if self.deadlines else None
+        heapq.heappush(self.deadlines, (deadline, auc.auction_id))
+        if earliest is None or deadline < earliest:
+            self.wakeup.set()
+
+    def _is_stale(self, entry):
+        deadline, aid = entry
+        auc = self.auctions.get(aid)
+        return auc is None or auc.auction_ended or auc.canceled or auc.end_time() != deadline
+
+    def create_auction(self, seller_id, quantity, grid_price=0.3,
+                       start_price=0.0,
+                       total_duration=3600, extension_duration=300):
+        auction_id = self.id_factory()
+        auc = EnglishAuction(
+            auction_id=auction_id,
+            quantity=quantity,
+            grid_price=grid_price,
+            start_price=start_price,   # <-- 关键：传给EnglishAuction
+            total_duration=total_duration,
+            extension_duration=extension_duration
+        )
+        self._log(["create", auction_id, seller_id, quantity, grid_price, start_price,
+                   total_duration, extension_duration, auc.start_time])
+        self._add_auction(auc, seller_id)
+        self._schedule(auc)
+        self._index_end(auc)
+        self._touch(auction_id)
+        print(f"[P2PTradeAgent] Created Auction {auction_id} by Seller {seller_id}, start_price={start_price}")
+        return auction_id
+
+    def _add_auction(self, auc, seller_id):
+        auc.bid_listener = self._on_bid
+        self.auctions[auc.auction_id] = auc
+        self.auction_seller_map[auc.auction_id] = seller_id
+        self.seller_index.setdefault(seller_id, {})[auc.auction_id] = None
+        if not auc.auction_ended:
+            self.ongoing[auc.auction_id] = None
+
+    def get_auction(self, auction_id):
+        return self.auctions.get(auction_id)
+
+    def get_auction_status(self, auction_id):
+        """进行中/最近结束的拍卖, 或归档中的最终结果; 都没有时返回 None。"""
+        auc = self.auctions.get(auction_id)
+        if auc is not None:
+            return auc.get_status()
+        return self.archive.get(auction_id)
+
+    def cancel_auction(self, auction_id, seller_id):
+        auc = self.auctions.get(auction_id)
+        if not auc:
+            return {"status": "fail", "msg": "Auction not found"}
+        if self.auction_seller_map.get(auction_id) != seller_id:
+            return {"status": "fail", "msg": "Not your auction"}
+        if auc.auction_ended or auc.canceled:
+            return {"status": "fail", "msg": "Auction ended/canceled already."}
+
+        auc.canceled = True
+        auc.auction_ended = True
+        self._mark_ended(auc, time.time())
+        return {"status": "success", "msg": f"Auction {auction_id} canceled."}
+
+    def list_all_auctions(self):
+        return [auc.get_status() for auc in self.auctions.values()]
+
+    def list_seller_auctions(self, seller_id, limit=100):
+        """卖家最近的 limit 个拍卖 (包括已归档的), 按创建顺序。"""
+        total = len(self.seller_index.get(seller_id, ())) + self.archive.count(seller_id)
+        return self.query_auctions(seller=seller_id, offset=max(0, total - limit), limit=limit,
+                                   include_archived=True)["auctions"]
+
+    def query_auctions(self, status=None, seller=None, sort="created",
+                       offset=0, limit=50, include_archived=False):
+        """
+        分页查询拍卖。
+
+        :param status: "ongoing", "ended" or None for both.
+        :param seller: Only auctions of this seller.
+        :param sort: "created" (creation order) or "end_time" (earliest end first).
+        :param offset: Number of results to skip.
+        :param limit: Maximum number of results.
+        :param include_archived: Also return archived auctions (for status "ended" or None),
+                                 listed before the live ones.
+        :return: Dict with total, offset, limit and the page of auction statuses.
+        """
+        if status == "ongoing" and seller is None:
+            if sort == "end_time":
+                # The end-time index is already sorted: slice it directly
+                ids = [aid for _, aid in self.end_index[offset:offset + limit]]
+                return self._page(len(self.end_index), offset, limit, ids)
+            ids = list(self.ongoing)
+        else:
+            ids = self.seller_index.get(seller, {}) if seller is not None else self.auctions
+            if status == "ongoing":
+                ids = [aid for aid in ids if aid in self.ongoing]
+            elif status == "ended":
+                ids = [aid for aid in ids if aid not in self.ongoing]
+            else:
+                ids = list(ids)
+        if sort == "end_time":
+            ids.sort(key=lambda aid: self.auctions[aid].end_time())
+
+        archived = 0
+        results = []
+        if include_archived and status != "ongoing":
+            archived = self.archive.count(seller)
+            if offset < archived:
+                results = self.archive.page(seller, offset, limit)
+        live_offset = max(0, offset - archived)
+        live_limit = limit - len(results)
+        page_ids = ids[live_offset:live_offset + live_limit]
+        return self._page(archived + len(ids), offset, limit, page_ids, results)
+
+    def _page(self, total, offset, limit, ids, prefix=()):
+        return {
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "auctions": list(prefix) + [self.auctions[aid].get_status() for aid in ids],
+        }
+
+    def archive_ended(self, now=None):
+        """
+        把结束超过 archive_after 秒的拍卖移入归档。
+        :return: Number of auctions archived.
+        """
+        if now is None:
+            now = time.time()
+        count = 0
+        while self.ended_queue and self.ended_queue[0][0] + self.archive_after <= now:
+            _, aid = self.ended_queue.popleft()
+            self._remove_auction(aid)
+            self._log(["archive", aid, now])
+            # 记录一次变化, 让订阅者把它从列表中移除
+            self._touch(aid)
+            self.archived_changes.append((self.version, aid))
+            count += 1
+        while len(self.archived_changes) > self.change_log_size:
+            version, aid = self.archived_changes.popleft()
+            if self.changes.get(aid) == version:
+                del self.changes[aid]
+            self.min_version = version
+        return count
+
+    def _remove_auction(self, aid):
+        """Move an ended auction from the live dicts into the archive."""
+        auc = self.auctions.pop(aid)
+        seller = self.auction_seller_map.pop(aid)
+        ids = self.seller_index[seller]
+        del ids[aid]
+        if not ids:
+            del self.seller_index[seller]
+        if aid not in self.archive:
+            self.archive.add(auc.get_status(), seller)
+
+    # ---------- 预写日志恢复 ----------
+
+    def apply_event(self, record):
+        """
+        Re-apply a logged event while replaying the write-ahead log. Layouts:
+        ["create", id, seller, quantity, grid_price, start_price, total_duration, extension_duration, time],
+        ["bid", id, bidder, price, time], ["end"/"cancel"/"archive", id, time].
+        Nothing is logged, printed or scheduled here; call restore_indexes() afterwards.
+        """
+        kind, aid = record[0], record[1]
+        if kind == "create":
+            _, _, seller, quantity, grid_price, start_price, total, extension, start_time = record
+            auc = EnglishAuction(aid, quantity, grid_price, start_price, total, extension)
+            auc.start_time = start_time
+            self._add_auction(auc, seller)
+            return
+        auc = self.auctions.get(aid)
+        if auc is None:
+            return
+        if kind == "bid":
+            auc.highest_bidder, auc.highest_bid, auc.last_bid_time = record[2], record[3], record[4]
+        elif kind in ("end", "cancel"):
+            auc.auction_ended = True
+            auc.canceled = kind == "cancel"
+            self.ongoing.pop(aid, None)
+            self.ended_queue.append((record[2], aid))
+        elif kind == "archive":
+            if self.ended_queue and self.ended_queue[0][1] == aid:
+                self.ended_queue.popleft()
+            else:
+                self.ended_queue = deque(e for e in self.ended_queue if e[1] != aid)
+            self._remove_auction(aid)
+
+    def restore_indexes(self):
+        """Rebuild the deadline heap and end-time index after replaying the log."""
+        self.deadlines = [(self.auctions[aid].end_time(), aid) for aid in self.ongoing]
+        heapq.heapify(self.deadlines)
+        self.end_index = sorted(self.deadlines)
+        self.indexed_end = {aid: end for end, aid in self.end_index}
+        self.wakeup.set()
+
+    def export_state(self):
+        """
+        Compact copy of all live auctions for a snapshot.
+        :return: (event log sequence number the copy corresponds to, JSON-serialisable state).
+        """
+        # Write out pending events first so the snapshot never gets ahead of the log
+        seq = self.event_log.sync() if self.event_log is not None else 0
+        auctions = [
+            [aid, self.auction_seller_map[aid], auc.quantity, auc.grid.grid_price, auc.start_price,
+             auc.total_duration, auc.extension_duration, auc.start_time, auc.highest_bid,
+             auc.highest_bidder, auc.last_bid_time, auc.auction_ended, auc.canceled]
+            for aid, auc in list(self.auctions.items())
+        ]
+        return seq, {"auctions": auctions, "ended": [list(e) for e in self.ended_queue]}
+
+    def load_state(self, state):
+        """Replace the live auctions with a state produced by export_state()."""
+        self.auctions, self.auction_seller_map, self.seller_index, self.ongoing = {}, {}, {}, {}
+        for (aid, seller, quantity, grid_price, start_price, total, extension, start_time,
+             highest_bid, highest_bidder, last_bid_time, ended, canceled) in state["auctions"]:
+            auc = EnglishAuction(aid, quantity, grid_price, start_price, total, extension)
+            auc.start_time = start_time
+            auc.highest_bid, auc.highest_bidder, auc.last_bid_time = highest_bid, highest_bidder, last_bid_time
+            auc.auction_ended, auc.canceled = ended, canceled
+            self._add_auction(auc, seller)
+        self.ended_queue = deque((t, aid) for t, aid in state["ended"])
+
+    def next_deadline(self):
+        """最近的截止时间, 没有进行中的拍卖时返回 None。"""
+        while self.deadlines and self._is_stale(self.deadlines[0]):
+            heapq.heappop(self.deadlines)
+        return self.deadlines[0][0] if self.deadlines else None
+
+    def check_all_auctions(self, now=None):
+        """
+        结束所有已到截止时间的拍卖。
+        :return: 刚结束的拍卖列表 (调用方负责广播)
+        """
+        if now is None:
+            now = time.time()
+        ended = []
+        while self.deadlines and self.deadlines[0][0] < now:
+            entry = heapq.heappop(self.deadlines)
+            if self._is_stale(entry):
+                continue
+            auc = self.auctions[entry[1]]
+            auc.check_if_ended(now)
+            if auc.auction_ended:
+                self._mark_ended(auc, now)
+                ended.append(auc)
+        return ended
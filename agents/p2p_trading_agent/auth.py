@@ -0,0 +1,187 @@
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+def _default_executor():
+    """
+    Under eventlet, run the work in eventlet's native thread pool so the
+    calling greenlet yields instead of blocking the hub; otherwise call it directly.
+    """
+    try:
+        from eventlet import patcher, tpool
+    except ImportError:
+        return lambda func, *args: func(*args)
+    if patcher.is_monkey_patched("thread"):
+        return tpool.execute
+    return lambda func, *args: func(*args)
+
+
+class PasswordHasher:
+    """
+    Password hashing off the event loop.
+
+    Werkzeug's scrypt hashes cost ~100 ms of CPU by design. They run through
+    ``executor`` (eventlet.tpool under eventlet; hashlib releases the GIL while
+    hashing) and at most ``max_concurrency`` at a time, so a login storm queues
+    up on the semaphore instead of taking every core from the auctions.
+    """
+
+    def __init__(self, max_concurrency=2, executor=None):
+        """
+        :param max_concurrency: Number of hashes computed at the same time.
+        :param executor: Callable executor(func, *args) running func and returning its result.
+        """
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.executor = executor or _default_executor()
+
+    def hash(self, password):
+        with self.semaphore:
+            return self.executor(generate_password_hash, password)
+
+    def verify(self, pwhash, password):
+        with self.semaphore:
+            return self.executor(check_password_hash, pwhash, password)
+
+
+class AuthCache:
+    """
+    Remembers successful logins so repeating them does not hash again.
+
+    Entries are keyed by an HMAC (server secret) of user name, password and the
+    stored hash; the password itself is never kept. A changed password hash
+    gives a different key, so old entries can never match. Entries expire
+    after ``ttl`` seconds and the least recently used are dropped beyond
+    ``max_entries``. Failed logins are not cached and always pay for a hash.
+    """
+
+    def __init__(self, secret, ttl=600, max_entries=10000):
+        """
+        :param secret: Server-side key for the HMAC (e.g. the Flask SECRET_KEY).
+        :param ttl: Seconds a successful login is remembered.
+        :param max_entries: Maximum number of remembered logins.
+        """
+        self.secret = secret.encode("utf-8") if isinstance(secret, str) else secret
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, username, password, pwhash):
+        msg = "\0".join((username, password, pwhash)).encode("utf-8")
+        return hmac.new(self.secret, msg, hashlib.sha256).digest()
+
+    def check(self, username, password, pwhash, now=None):
+        if now is None:
+            now = time.monotonic()
+        key = self._key(username, password, pwhash)
+        with self.lock:
+            expires = self.entries.get(key)
+            if expires is not None and expires > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True
+            if expires is not None:
+                del self.entries[key]
+            self.misses += 1
+            return False
+
+    def add(self, username, password, pwhash, now=None):
+        if now is None:
+            now = time.monotonic()
+        key = self._key(username, password, pwhash)
+        with self.lock:
+            self.entries[key] = now + self.ttl
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class UserManager:
+    """
+    Registered users (password hashes only). With several workers every worker
+    keeps all users, but a user name is claimed on the worker owning it, so two
+    concurrent registrations of one name cannot both succeed.
+    """
+
+    def __init__(self, hasher=None, auth_cache=None):
+        """
+        :param hasher: PasswordHasher running the hashing outside the event loop.
+        :param auth_cache: Optional AuthCache of recent successful logins.
+        """
+        # 初始化一个admin
+        self.users = {
+            "admin": {
+                "password": generate_password_hash("admin123")
+            }
+        }
+        self.hasher = hasher or PasswordHasher()
+        self.auth_cache = auth_cache
+        # 可选的 EventLog, 记录新注册的用户 (只保存密码哈希)
+        self.event_log = None
+        # 注册成功后的回调 listener(username, pwhash), 多进程时用来同步到其他 worker
+        self.listener = None
+        # 多进程时把注册交给用户名所属的 worker: owner_call(username, pwhash) -> 是否注册成功
+        self.owner_call = None
+
+    def add_user(self, username, password):
+        if username in self.users:
+            return False
+        pwhash = self.hasher.hash(password)
+        if self.owner_call is None:
+            return self.claim(username, pwhash)
+        # 两个 worker 可能同时注册同一用户名, 只有所属 worker 的判断算数
+        if not self.owner_call(username, pwhash):
+            return False
+        # 不必等广播: 注册后立刻在本 worker 登录也能成功
+        self.add_hashed(username, pwhash)
+        return True
+
+    def claim(self, username, pwhash):
+        """在用户名所属的 worker 上执行: 先到先得, 成功后通知其他 worker。"""
+        # 计算哈希时会让出事件循环, 期间可能已有同名用户注册
+        if not self.add_hashed(username, pwhash):
+            return False
+        if self.listener is not None:
+            self.listener(username, pwhash)
+        return True
+
+    def add_hashed(self, username, pwhash):
+        if username in self.users:
+            return False
+        self.users[username] = {
+            "password": pwhash
+        }
+        if self.event_log is not None:
+            self.event_log.append(["user", username, pwhash])
+        return True
+
+    def apply_event(self, record):
+        _, username, password_hash = record
+        self.users[username] = {"password": password_hash}
+
+    def export_state(self):
+        seq = self.event_log.sync() if self.event_log is not None else 0
+        return seq, {name: user["password"] for name, user in self.users.items()}
+
+    def load_state(self, state):
+        self.users.update({name: {"password": pw} for name, pw in state.items()})
+
+    def verify_user(self, username, password):
+        user = self.users.get(username)
+        if not user:
+            return None
+        pwhash = user["password"]
+        if self.auth_cache is not None and self.auth_cache.check(username, password, pwhash):
+            return user
+        if self.hasher.verify(pwhash, password):
+            if self.auth_cache is not None:
+                self.auth_cache.add(username, password, pwhash)
+            return user
+        return None
@@ -0,0 +1,214 @@
+import threading
+import time
+from collections import deque
+
+from utils import metrics
+
+BIDS = metrics.counter("p2p_bids_total", "Bids handled by the bid queues", ["result"])
+BID_BATCH_SIZE = metrics.histogram("p2p_bid_batch_size", "Bids applied per batch",
+                                   buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+
+
+class TokenBucket:
+    """令牌桶: 每秒补充 rate 个令牌, 最多 burst 个。"""
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def allow(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class RateLimiter:
+    """
+    Per-user token buckets. Buckets that have refilled completely carry no
+    state, so they are dropped once more than ``max_buckets`` exist.
+    """
+
+    def __init__(self, rate=5.0, burst=10, max_buckets=10000):
+        """
+        :param rate: Sustained number of actions per second per user.
+        :param burst: Number of actions a user can make at once.
+        :param max_buckets: Clean up full buckets above this many users.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_buckets = max_buckets
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def allow(self, user, now=None):
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(user)
+            if bucket is None:
+                if len(self.buckets) >= self.max_buckets:
+                    self._evict_full(now)
+                bucket = self.buckets[user] = TokenBucket(self.rate, self.burst, now)
+            return bucket.allow(now)
+
+    def _evict_full(self, now):
+        full_after = self.burst / self.rate
+        self.buckets = {user: b for user, b in self.buckets.items() if now - b.updated < full_after}
+
+
+class BidProcessor:
+    """
+    Per-auction bid queues served by one owner task per auction.
+
+    ``submit`` only appends the bid to its auction's queue and, if no task is
+    serving that auction, starts one. The owner task waits ``batch_window``
+    seconds for more bids, then applies the queued bids strictly in arrival
+    order. Each bidder gets its own reply, but the room only gets one status
+    broadcast per batch, with the best bid of the batch. The task exits when
+    the queue is empty, so idle auctions cost nothing.
+    """
+
+    def __init__(self, manager, reply, broadcast, spawn=None, sleep=time.sleep,
+                 batch_window=0.01, max_batch=256, rate_limiter=None):
+        """
+        :param manager: AuctionManager holding the auctions.
+        :param reply: Called as reply(client, result) for every processed bid.
+        :param broadcast: Called as broadcast(auction) once per batch with a successful bid.
+        :param spawn: Starts an owner task as spawn(func, auction_id), e.g.
+                      socketio.start_background_task; None means the caller runs drain() itself.
+        :param sleep: Sleep function of the async mode in use, e.g. socketio.sleep.
+        :param batch_window: Seconds an owner task waits to collect a batch.
+        :param max_batch: Maximum number of bids applied per batch.
+        :param rate_limiter: Optional RateLimiter checked per bidder before queueing.
+        """
+        self.manager = manager
+        self.reply = reply
+        self.broadcast = broadcast
+        self.spawn = spawn
+        self.sleep = sleep
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.rate_limiter = rate_limiter
+
+        self.queues = {}
+        self.lock = threading.Lock()
+        self.stats = {"bids": 0, "batches": 0, "broadcasts": 0, "rate_limited": 0}
+
+    def submit(self, client, bidder, auction_id, price):
+        """
+        Queue a bid.
+        :param client: Opaque reply address (e.g. the Socket.IO sid).
+        :return: None if the bid was queued, otherwise the failure result (already replied).
+        """
+        if self.rate_limiter is not None and not self.rate_limiter.allow(bidder):
+            self.stats["rate_limited"] += 1
+            BIDS.labels("rate_limited").inc()
+            res = {"status": "fail", "msg": "Too many bids, please slow down"}
+            self.reply(client, res)
+            return res
+        if auction_id not in self.manager.auctions:
+            BIDS.labels("fail").inc()
+            res = {"status": "fail", "msg": "Auction not found"}
+            self.reply(client, res)
+            return res
+
+        with self.lock:
+            queue = self.queues.get(auction_id)
+            start_owner = queue is None
+            if start_owner:
+                queue = self.queues[auction_id] = deque()
+            queue.append((client, bidder, price))
+        if start_owner and self.spawn is not None:
+            self.spawn(self._owner, auction_id)
+        return None
+
+    def _owner(self, auction_id):
+        finished = False
+        try:
+            while True:
+                if self.batch_window:
+                    self.sleep(self.batch_window)
+                if not self.drain(auction_id):
+                    finished = True
+                    return
+        except Exception as e:
+            print(f"[BidProcessor] Owner of auction {auction_id} failed: {e}")
+        finally:
+            if not finished:
+                # submit() only starts an owner for a new queue, so a dead owner must
+                # hand its queue on or every later bid on the auction would hang
+                with self.lock:
+                    queue = self.queues.get(auction_id)
+                    if not queue:
+                        self.queues.pop(auction_id, None)
+                if queue and self.spawn is not None:
+                    self.spawn(self._owner, auction_id)
+
+    def drain(self, auction_id):
+        """
+        Apply one batch of queued bids for an auction. A failing batch is logged and its
+        unanswered bids get an error reply; the queue is always handed back or removed.
+        :return: True if bids remain queued (the owner keeps going), False once the queue
+                 is empty and the auction has no owner any more.
+        """
+        with self.lock:
+            queue = self.queues.get(auction_id)
+            if not queue:
+                self.queues.pop(auction_id, None)
+                return False
+            batch = [queue.popleft() for _ in range(min(len(queue), self.max_batch))]
+
+        try:
+            self._apply(auction_id, batch)
+        except Exception as e:
+            print(f"[BidProcessor] Batch for auction {auction_id} failed: {e}")
+
+        with self.lock:
+            if self.queues.get(auction_id):
+                return True
+            self.queues.pop(auction_id, None)
+            return False
+
+    def _apply(self, auction_id, batch):
+        auc = self.manager.get_auction(auction_id)
+        replies = []
+        improved = False
+        accepted = 0
+        errors = 0
+        try:
+            for client, bidder, price in batch:
+                if auc is None:
+                    res = {"status": "fail", "msg": "Auction not found"}
+                else:
+                    res = auc.place_bid(bidder, price)
+                    if res["status"] == "success":
+                        improved = True
+                        accepted += 1
+                replies.append((client, res))
+        except Exception as e:
+            print(f"[BidProcessor] Bid on auction {auction_id} failed: {e}")
+            # The bid that raised and the rest of the batch are answered with an error
+            failed = batch[len(replies):]
+            errors = len(failed)
+            replies.extend((client, {"status": "fail", "msg": "Bid could not be processed"})
+                           for client, _, _ in failed)
+        self.stats["bids"] += len(batch)
+        self.stats["batches"] += 1
+        BIDS.labels("success").inc(accepted)
+        BIDS.labels("fail").inc(len(batch) - accepted - errors)
+        if errors:
+            BIDS.labels("error").inc(errors)
+        BID_BATCH_SIZE.observe(len(batch))
+
+        # Acknowledge the bidders first, then fan out the new best bid to the room
+        for client, res in replies:
+            self.reply(client, res)
+        if improved:
+            self.stats["broadcasts"] += 1
+            self.broadcast(auc)
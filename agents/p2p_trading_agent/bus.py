@@ -0,0 +1,206 @@
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+
+import socketio
+
+FRAME_HEADER = struct.Struct("!I")
+
+
+class LocalBus:
+    """
+    In-process message bus: every published message is delivered to every
+    subscriber of its channel, the publisher's own subscriptions included.
+    Used by the tests, where several "workers" live in one process.
+    """
+
+    def __init__(self):
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, channel):
+        """:return: A queue receiving every message published on ``channel``."""
+        q = queue.Queue()
+        with self.lock:
+            self.subscribers.setdefault(channel, []).append(q)
+        return q
+
+    def publish(self, channel, message):
+        # Round-trip through JSON so the local bus behaves like the IPC one
+        data = json.loads(json.dumps(message))
+        with self.lock:
+            subs = list(self.subscribers.get(channel, ()))
+        for q in subs:
+            q.put(data)
+
+    def close(self):
+        pass
+
+
+def _send_frame(sock, payload):
+    sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("bus connection closed")
+        buf += chunk
+    return bytes(buf)
+
+
+def _recv_frame(sock):
+    (length,) = FRAME_HEADER.unpack(_recv_exact(sock, FRAME_HEADER.size))
+    return _recv_exact(sock, length)
+
+
+class BusHub:
+    """
+    Relay for IPCBus clients on a unix socket.
+
+    Every frame received from one client is forwarded unchanged to all other
+    clients (IPCBus delivers to its own subscribers itself), so the hub never
+    decodes a message. One thread per
+    connection; started by the cluster supervisor, not by the workers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            os.remove(path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        os.chmod(path, 0o600)
+        self.server.listen(64)
+        self.clients = []
+        self.lock = threading.Lock()
+        self.running = True
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while self.running:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            with self.lock:
+                self.clients.append((conn, threading.Lock()))
+            threading.Thread(target=self._relay, args=(conn,), daemon=True).start()
+
+    def _relay(self, conn):
+        try:
+            while True:
+                payload = _recv_frame(conn)
+                with self.lock:
+                    clients = list(self.clients)
+                for client, send_lock in clients:
+                    if client is conn:
+                        continue
+                    try:
+                        with send_lock:
+                            _send_frame(client, payload)
+                    except OSError:
+                        pass
+        except (ConnectionError, OSError, EOFError):
+            # Client gone or hub closed (EOFError under eventlet)
+            pass
+        finally:
+            with self.lock:
+                self.clients = [c for c in self.clients if c[0] is not conn]
+            conn.close()
+
+    def close(self):
+        self.running = False
+        self.server.close()
+        with self.lock:
+            for conn, _ in self.clients:
+                conn.close()
+            self.clients = []
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class IPCBus:
+    """
+    Message bus between worker processes through a BusHub.
+
+    Messages are JSON frames ``[channel, message]``. A reader thread (a
+    greenlet when eventlet is monkey patched) dispatches incoming frames to
+    the per-channel subscriber queues; like LocalBus, a published message is
+    also delivered to the publisher's own subscribers.
+    """
+
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.send_lock = threading.Lock()
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        self.closed = False
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def subscribe(self, channel):
+        q = queue.Queue()
+        with self.lock:
+            self.subscribers.setdefault(channel, []).append(q)
+        return q
+
+    def publish(self, channel, message):
+        payload = json.dumps([channel, message], separators=(",", ":"))
+        with self.send_lock:
+            _send_frame(self.sock, payload.encode("utf-8"))
+        self._deliver(*json.loads(payload))
+
+    def _deliver(self, channel, message):
+        with self.lock:
+            subs = list(self.subscribers.get(channel, ()))
+        for q in subs:
+            q.put(message)
+
+    def _read(self):
+        try:
+            while True:
+                self._deliver(*json.loads(_recv_frame(self.sock)))
+        except (ConnectionError, OSError, EOFError):
+            # close() wakes the pending read with an error (EOFError under eventlet)
+            if not self.closed:
+                print("[P2PTradeAgent] Message bus connection closed")
+
+    def close(self):
+        self.closed = True
+        self.sock.close()
+
+
+class BusClientManager(socketio.PubSubManager):
+    """
+    Socket.IO client manager relaying emits and room operations through a
+    LocalBus or IPCBus, so a broadcast to a room reaches its members on every
+    worker and an emit to a sid reaches the worker holding that client.
+    """
+    name = "p2pbus"
+
+    def __init__(self, bus, channel="socketio", write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.bus = bus
+        self.queue = bus.subscribe(channel)
+
+    def emit(self, event, data, namespace=None, room=None, skip_sid=None,
+             callback=None, to=None, **kwargs):
+        # 发给本 worker 上的单个客户端 (如出价回复) 时不经过消息总线
+        sid = to or room
+        if isinstance(sid, str) and self.is_connected(sid, namespace or "/"):
+            kwargs["ignore_queue"] = True
+        return super().emit(event, data, namespace=namespace, room=sid, skip_sid=skip_sid,
+                            callback=callback, **kwargs)
+
+    def _publish(self, data):
+        self.bus.publish(self.channel, data)
+
+    def _listen(self):
+        while True:
+            yield self.queue.get()
@@ -0,0 +1,219 @@
+"""
+Multi-worker mode of the P2P trading agent.
+
+``run_cluster`` starts a BusHub and N worker processes. Every worker runs the
+whole app on the same port (SO_REUSEPORT, the kernel spreads connections) and
+owns the auctions whose id hashes to its index, and the order books of the
+delivery hours that hash to it. Socket.IO emits travel over the bus
+(BusClientManager), so clients can connect to any worker; requests for an
+auction or order book owned by another worker are forwarded by the ShardRouter.
+
+Because consecutive HTTP requests may reach different workers, Socket.IO
+clients must use the websocket transport (long-polling sessions are tied to
+one worker).
+
+Usage (from the repository root):
+    python -m agents.p2p_trading_agent.cluster --workers 4 --port 5001
+"""
+import argparse
+import itertools
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+
+from agents.p2p_trading_agent.bus import BusHub
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class ShardRouter:
+    """
+    Routes work to the worker owning a key (auction id or delivery hour).
+
+    Messages on the "shard" channel are dicts with ``kind``, ``payload``,
+    ``to`` (worker index, None for all) and, for calls, a request id the
+    target answers with a "_reply" message. Handlers are plain functions
+    payload -> JSON-serialisable result.
+    """
+
+    def __init__(self, bus, worker_index, n_workers, spawn=None, timeout=5.0):
+        """
+        :param bus: LocalBus or IPCBus shared by all workers.
+        :param worker_index: Index of this worker, 0 <= worker_index < n_workers.
+        :param n_workers: Number of workers (shards).
+        :param spawn: Starts the listener as spawn(func), e.g. socketio.start_background_task;
+                      defaults to a daemon thread.
+        :param timeout: Seconds call() and gather() wait for answers.
+        """
+        self.bus = bus
+        self.worker_index = worker_index
+        self.n_workers = n_workers
+        self.timeout = timeout
+        self.handlers = {}
+        self.pending = {}
+        self.request_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.queue = bus.subscribe("shard")
+        spawn = spawn or (lambda func: threading.Thread(target=func, daemon=True).start())
+        spawn(self._listen)
+
+    def owner_of(self, key):
+        return zlib.crc32(str(key).encode("utf-8")) % self.n_workers
+
+    def is_local(self, key):
+        return self.owner_of(key) == self.worker_index
+
+    def new_key(self):
+        """A new 8-character auction id owned by this worker."""
+        while True:
+            key = uuid.uuid4().hex[:8]
+            if self.is_local(key):
+                return key
+
+    def handle(self, kind, func):
+        self.handlers[kind] = func
+
+    def send(self, worker, kind, payload):
+        """Run a handler on ``worker`` without waiting for it."""
+        self.bus.publish("shard", {"kind": kind, "payload": payload, "to": worker,
+                                   "from": self.worker_index})
+
+    def broadcast(self, kind, payload):
+        """Run a handler on every other worker without waiting."""
+        self.bus.publish("shard", {"kind": kind, "payload": payload, "to": None,
+                                   "from": self.worker_index})
+
+    def _request(self, worker, kind, payload, expected):
+        request_id = f"{self.worker_index}:{next(self.request_ids)}"
+        waiter = {"event": threading.Event(), "results": [], "expected": expected}
+        with self.lock:
+            self.pending[request_id] = waiter
+        self.bus.publish("shard", {"kind": kind, "payload": payload, "to": worker,
+                                   "from": self.worker_index, "request_id": request_id})
+        finished = waiter["event"].wait(self.timeout)
+        with self.lock:
+            self.pending.pop(request_id, None)
+        if not finished:
+            raise TimeoutError(f"No answer for {kind} from worker {worker if worker is not None else 'all'}")
+        return waiter["results"]
+
+    def call(self, worker, kind, payload):
+        """Run a handler on ``worker`` and return its result."""
+        if worker == self.worker_index:
+            return self.handlers[kind](payload)
+        return self._request(worker, kind, payload, 1)[0]
+
+    def gather(self, kind, payload):
+        """Run a handler on every worker. :return: List of results, this worker's first."""
+        local = self.handlers[kind](payload)
+        if self.n_workers == 1:
+            return [local]
+        return [local] + self._request(None, kind, payload, self.n_workers - 1)
+
+    def _listen(self):
+        while True:
+            msg = self.queue.get()
+            try:
+                self._dispatch(msg)
+            except Exception as e:
+                print(f"[P2PTradeAgent] Error handling {msg.get('kind')} on worker {self.worker_index}: {e}")
+
+    def _dispatch(self, msg):
+        if msg["kind"] == "_reply":
+            if msg["to"] != self.worker_index:
+                return
+            with self.lock:
+                waiter = self.pending.get(msg["request_id"])
+                if waiter is None:
+                    return
+                waiter["results"].append(msg["payload"])
+                if len(waiter["results"]) >= waiter["expected"]:
+                    waiter["event"].set()
+            return
+        if msg["from"] == self.worker_index or msg["to"] not in (None, self.worker_index):
+            return
+        result = self.handlers[msg["kind"]](msg["payload"])
+        if msg.get("request_id"):
+            self.bus.publish("shard", {"kind": "_reply", "payload": result, "to": msg["from"],
+                                       "from": self.worker_index, "request_id": msg["request_id"]})
+
+
+# ---------- supervisor ----------
+
+def serve_worker(host, port):
+    """Entry point of one worker process (configured through P2P_* environment variables)."""
+    import eventlet
+    eventlet.monkey_patch()
+    from agents.p2p_trading_agent.app import app
+    sock = eventlet.listen((host, port), reuse_port=True)
+    print(f"[P2PTradeAgent] Worker {os.environ.get('P2P_WORKER_INDEX')} serving on {host}:{port}")
+    eventlet.wsgi.server(sock, app, log_output=False)
+
+
+def start_workers(n_workers, host="127.0.0.1", port=5001, state_dir=None, env=None):
+    """
+    Start the bus hub and the worker processes.
+    :return: (hub, list of worker Popen objects).
+    """
+    bus_dir = tempfile.mkdtemp(prefix="p2p_bus_")
+    bus_path = os.path.join(bus_dir, "bus.sock")
+    hub = BusHub(bus_path)
+    workers = []
+    for i in range(n_workers):
+        worker_env = dict(os.environ, **(env or {}))
+        worker_env.update({
+            "P2P_WORKERS": str(n_workers),
+            "P2P_WORKER_INDEX": str(i),
+            "P2P_BUS_ADDRESS": bus_path,
+            "PYTHONPATH": REPO_ROOT,
+        })
+        workers.append(subprocess.Popen(
+            [sys.executable, "-m", "agents.p2p_trading_agent.cluster", "--serve-worker",
+             "--host", host, "--port", str(port)],
+            cwd=state_dir or os.getcwd(), env=worker_env,
+        ))
+    return hub, workers
+
+
+def run_cluster(n_workers=4, host="127.0.0.1", port=5001):
+    hub, workers = start_workers(n_workers, host, port)
+    # terminate() 时也要先停掉各个 worker
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        while all(w.poll() is None for w in workers):
+            time.sleep(1)
+        print("[P2PTradeAgent] A worker exited, stopping the cluster")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for w in workers:
+            w.terminate()
+        for w in workers:
+            w.wait(10)
+        hub.close()
+        # start_workers() 创建的 p2p_bus_* 临时目录
+        shutil.rmtree(os.path.dirname(hub.path), ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the P2P trading agent with several worker processes.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--serve-worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve_worker:
+        serve_worker(args.host, args.port)
+    else:
+        run_cluster(args.workers, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
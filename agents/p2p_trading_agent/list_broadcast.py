@@ -0,0 +1,158 @@
+import json
+import time
+
+
+class AuctionListBroadcaster:
+    """
+    Versioned, filter-aware broadcasts of the auction list.
+
+    Clients subscribe with a filter (status, seller, price range) and receive a
+    full snapshot once. Afterwards ``broadcast`` only sends the auctions changed
+    since the last broadcast, using AuctionManager.changed_since. Clients with
+    the same filter share one Socket.IO room, so every changed auction is
+    serialised once per distinct filter, not once per client, and nothing is
+    sent while no auction changes.
+    """
+
+    def __init__(self, manager, emit):
+        """
+        :param manager: AuctionManager whose auctions are broadcast.
+        :param emit: Callable emit(event, data, room) used to send messages.
+        """
+        self.manager = manager
+        self.emit = emit
+        # room -> filter, and the members of each room
+        self.filters = {}
+        self.members = {}
+        self.sid_room = {}
+        self.last_version = manager.version
+
+    @staticmethod
+    def normalize_filter(data):
+        """Build a filter from client data: status ('ongoing'/'ended'), seller, min_price, max_price."""
+        data = data or {}
+        flt = {
+            "status": data.get("status") if data.get("status") in ("ongoing", "ended") else None,
+            "seller": data.get("seller") or None,
+            "min_price": float(data["min_price"]) if data.get("min_price") is not None else None,
+            "max_price": float(data["max_price"]) if data.get("max_price") is not None else None,
+        }
+        return flt
+
+    @staticmethod
+    def room_for(flt):
+        return "auction_list:" + json.dumps(flt, sort_keys=True)
+
+    def matches(self, status, flt):
+        if flt["status"] and status["status"] != flt["status"]:
+            return False
+        if flt["seller"] and status["seller"] != flt["seller"]:
+            return False
+        if flt["min_price"] is not None and status["highest_bid"] < flt["min_price"]:
+            return False
+        if flt["max_price"] is not None and status["highest_bid"] > flt["max_price"]:
+            return False
+        return True
+
+    def _status(self, auction_id):
+        status = self.manager.auctions[auction_id].get_status()
+        status["seller"] = self.manager.auction_seller_map.get(auction_id)
+        return status
+
+    def subscribe(self, sid, data):
+        """
+        Register a client's filter.
+
+        :param sid: Socket.IO session id.
+        :param data: Filter data from the client; with ``since`` (a version the client
+                     already has) and the matching ``epoch`` only the changes after it are returned.
+        :return: (room to join, previous room to leave or None, payload for the client).
+        """
+        flt = self.normalize_filter(data)
+        room = self.room_for(flt)
+        old_room = self.unsubscribe(sid)
+        self.filters[room] = flt
+        self.members.setdefault(room, set()).add(sid)
+        self.sid_room[sid] = room
+
+        since = (data or {}).get("since")
+        same_epoch = (data or {}).get("epoch") == self.manager.epoch
+        if since is not None and same_epoch and self.manager.min_version <= int(since) <= self.manager.version:
+            auctions, removed = self._split(self.manager.changed_since(int(since)), flt)
+            reset = False
+        else:
+            # 没有 since, 服务器已重启, 或 since 已超出变化记录范围: 发送完整快照, 客户端清空本地列表
+            auctions, removed = self._split(self.manager.auctions, flt)
+            removed, reset = [], True
+        payload = {
+            "version": self.manager.version,
+            "epoch": self.manager.epoch,
+            "server_time": time.time(),
+            "reset": reset,
+            "auctions": auctions,
+            "removed": removed,
+        }
+        return room, (old_room if old_room != room else None), payload
+
+    def _split(self, ids, flt):
+        """
+        :return: (statuses of the auctions matching flt, ids of the others);
+                 archived auctions count as not matching.
+        """
+        auctions, removed = [], []
+        for aid in ids:
+            if aid not in self.manager.auctions:
+                removed.append(aid)
+                continue
+            st = self._status(aid)
+            if self.matches(st, flt):
+                auctions.append(st)
+            else:
+                removed.append(aid)
+        return auctions, removed
+
+    def unsubscribe(self, sid):
+        """Forget a client. :return: the room it was in, if any."""
+        room = self.sid_room.pop(sid, None)
+        if room is not None:
+            members = self.members.get(room)
+            members.discard(sid)
+            if not members:
+                del self.members[room]
+                del self.filters[room]
+        return room
+
+    def broadcast(self):
+        """
+        Send the auctions changed since the last call to every filter room.
+        :return: Number of messages emitted.
+        """
+        version = self.manager.version
+        if version == self.last_version:
+            return 0
+        changed = self.manager.changed_since(self.last_version)
+        self.last_version = version
+        if not self.filters:
+            return 0
+
+        statuses = [self._status(aid) for aid in changed if aid in self.manager.auctions]
+        archived = [aid for aid in changed if aid not in self.manager.auctions]
+        now = time.time()
+        sent = 0
+        for room, flt in list(self.filters.items()):
+            auctions, removed = [], list(archived)
+            for st in statuses:
+                if self.matches(st, flt):
+                    auctions.append(st)
+                else:
+                    removed.append(st["auction_id"])
+            if not auctions and not removed:
+                continue
+            self.emit("auction_list_delta", {
+                "version": version,
+                "server_time": now,
+                "auctions": auctions,
+                "removed": removed,
+            }, room)
+            sent += 1
+        return sent
@@ -0,0 +1,358 @@
+import heapq
+import itertools
+import time
+from bisect import bisect_left, insort
+from collections import deque, namedtuple
+from datetime import datetime
+
+from agents.p2p_trading_agent.auction import Grid
+
+EPSILON = 1e-9
+DELIVERY_HOUR_FORMAT = "%Y-%m-%d %H:%M"
+
+Trade = namedtuple("Trade", "buy_order_id sell_order_id buyer seller price quantity timestamp")
+
+
+class Order:
+    __slots__ = ("order_id", "owner", "side", "price", "quantity", "remaining", "timestamp", "canceled")
+
+    def __init__(self, order_id, owner, side, price, quantity, timestamp):
+        self.order_id = order_id
+        self.owner = owner
+        self.side = side
+        self.price = price
+        self.quantity = quantity
+        self.remaining = quantity
+        self.timestamp = timestamp
+        self.canceled = False
+
+    def to_dict(self):
+        return {
+            "order_id": self.order_id,
+            "owner": self.owner,
+            "side": self.side,
+            "price": self.price,
+            "quantity": self.quantity,
+            "remaining": self.remaining,
+            "timestamp": self.timestamp,
+            "canceled": self.canceled,
+        }
+
+
+class _BookSide:
+    """
+    One side of the book: sorted price keys plus a FIFO queue per price level.
+
+    Keys are stored as sign * price so the best level (highest bid, lowest ask)
+    is always keys[0]. Canceled orders stay in their queue and are skipped when
+    they reach the front; ``live`` counts the active orders per level so an
+    emptied level is removed right away.
+    """
+
+    def __init__(self, sign):
+        self.sign = sign
+        self.keys = []
+        self.levels = {}
+        self.live = {}
+
+    def best_price(self):
+        return self.sign * self.keys[0] if self.keys else None
+
+    def add(self, order):
+        key = self.sign * order.price
+        queue = self.levels.get(key)
+        if queue is None:
+            insort(self.keys, key)
+            queue = self.levels[key] = deque()
+            self.live[key] = 0
+        queue.append(order)
+        self.live[key] += 1
+
+    def remove_level(self, key):
+        del self.keys[bisect_left(self.keys, key)]
+        del self.levels[key]
+        del self.live[key]
+
+    def order_done(self, order):
+        """An order left the level (filled or canceled)."""
+        key = self.sign * order.price
+        self.live[key] -= 1
+        if self.live[key] == 0:
+            self.remove_level(key)
+
+    def orders(self):
+        for key in self.keys:
+            for order in self.levels[key]:
+                if not order.canceled and order.remaining > EPSILON:
+                    yield order
+
+    def depth(self, n_levels):
+        result = []
+        for key in self.keys[:n_levels]:
+            volume = sum(o.remaining for o in self.levels[key] if not o.canceled)
+            result.append({"price": self.sign * key, "quantity": volume, "orders": self.live[key]})
+        return result
+
+
+class OrderBook:
+    """
+    Continuous double auction for one delivery hour.
+
+    Buy and sell limit orders (price per kWh, quantity in kWh) are matched on
+    arrival by price-time priority: the best opposite price level first and,
+    within a level, the oldest order first. Trades execute at the resting
+    order's price and orders can be filled partially; the unfilled part of an
+    incoming order rests in the book. An owner never trades with themselves: an
+    incoming order cancels the owner's resting orders it would have matched. Finding the best level is O(1) and adding
+    a level is a bisect into the sorted price keys.
+
+    At gate closure the remaining sell volume is bought by the Grid at
+    ``grid_price``, like an unsold EnglishAuction; remaining buy volume is
+    supplied by the grid at ``import_price`` if one is given.
+    """
+
+    def __init__(self, delivery_hour, gate_closure_time=None, grid_price=0.3,
+                 import_price=None, order_ids=None):
+        """
+        :param delivery_hour: Label of the delivery hour, e.g. "2024-06-01 14:00".
+        :param gate_closure_time: Unix time after which no orders are accepted.
+        :param grid_price: Price per kWh the grid pays for unmatched sell volume.
+        :param import_price: Price per kWh at which the grid supplies unmatched buy
+                             volume; None leaves unmatched buys unfilled.
+        :param order_ids: Iterator of order ids (shared between books by OrderBookManager).
+        """
+        self.delivery_hour = delivery_hour
+        self.gate_closure_time = gate_closure_time
+        self.grid = Grid(grid_price)
+        self.import_price = import_price
+        self.order_ids = order_ids or itertools.count(1)
+
+        self.bids = _BookSide(-1)
+        self.asks = _BookSide(1)
+        self.orders = {}
+        self.trades = []
+        self.closed = False
+
+    def best_bid(self):
+        return self.bids.best_price()
+
+    def best_ask(self):
+        return self.asks.best_price()
+
+    def submit(self, owner, side, price, quantity, now=None):
+        """
+        Place a limit order and match it immediately.
+
+        :param owner: User placing the order.
+        :param side: "buy" or "sell".
+        :param price: Limit price per kWh.
+        :param quantity: Quantity in kWh.
+        :return: (order, list of trades it caused).
+        """
+        if self.closed:
+            raise ValueError(f"Order book {self.delivery_hour} is closed")
+        if side not in ("buy", "sell"):
+            raise ValueError(f"Unknown side {side!r}")
+        if quantity <= 0 or price < 0:
+            raise ValueError("Quantity must be positive and price non-negative")
+        if now is None:
+            now = time.time()
+
+        order = Order(next(self.order_ids), owner, side, price, quantity, now)
+        if side == "buy":
+            trades = self._match(order, self.asks, lambda best: best <= price, now)
+            rest_side = self.bids
+        else:
+            trades = self._match(order, self.bids, lambda best: best >= price, now)
+            rest_side = self.asks
+
+        if order.remaining > EPSILON:
+            rest_side.add(order)
+            self.orders[order.order_id] = order
+        else:
+            order.remaining = 0.0
+        return order, trades
+
+    def _match(self, order, book_side, crosses, now):
+        trades = []
+        keys = book_side.keys
+        levels = book_side.levels
+        while order.remaining > EPSILON and keys:
+            key = keys[0]
+            level_price = book_side.sign * key
+            if not crosses(level_price):
+                break
+            queue = levels[key]
+            while queue and order.remaining > EPSILON:
+                maker = queue[0]
+                if maker.canceled:
+                    queue.popleft()
+                    continue
+                if maker.owner == order.owner:
+                    # Self-trade prevention: cancel the resting order instead of matching it
+                    maker.canceled = True
+                    queue.popleft()
+                    del self.orders[maker.order_id]
+                    book_side.live[key] -= 1
+                    continue
+                qty = min(order.remaining, maker.remaining)
+                order.remaining -= qty
+                maker.remaining -= qty
+                if order.side == "buy":
+                    trade = Trade(order.order_id, maker.order_id, order.owner, maker.owner, level_price, qty, now)
+                else:
+                    trade = Trade(maker.order_id, order.order_id, maker.owner, order.owner, level_price, qty, now)
+                trades.append(trade)
+                if maker.remaining <= EPSILON:
+                    maker.remaining = 0.0
+                    queue.popleft()
+                    del self.orders[maker.order_id]
+                    book_side.live[key] -= 1
+            if book_side.live[key] == 0:
+                book_side.remove_level(key)
+        self.trades.extend(trades)
+        return trades
+
+    def cancel(self, order_id, owner):
+        order = self.orders.get(order_id)
+        if order is None:
+            return {"status": "fail", "msg": "Order not found or already filled"}
+        if order.owner != owner:
+            return {"status": "fail", "msg": "Not your order"}
+        order.canceled = True
+        del self.orders[order_id]
+        (self.bids if order.side == "buy" else self.asks).order_done(order)
+        return {"status": "success", "msg": f"Order {order_id} canceled."}
+
+    def close(self, now=None):
+        """
+        Gate closure: stop trading and settle the remaining volume with the grid.
+        :return: List of trades with the grid.
+        """
+        if self.closed:
+            return []
+        if now is None:
+            now = time.time()
+        self.closed = True
+        trades = []
+        sold = 0.0
+        for order in self.asks.orders():
+            trades.append(Trade(None, order.order_id, "Grid", order.owner,
+                                self.grid.grid_price, order.remaining, now))
+            sold += order.remaining
+            order.remaining = 0.0
+        if sold > EPSILON:
+            self.grid.buy_energy(sold)
+        if self.import_price is not None:
+            for order in self.bids.orders():
+                trades.append(Trade(order.order_id, None, order.owner, "Grid",
+                                    self.import_price, order.remaining, now))
+                order.remaining = 0.0
+        self.orders.clear()
+        self.trades.extend(trades)
+        print(f"[OrderBook {self.delivery_hour}] Gate closed. {len(self.trades)} trades")
+        return trades
+
+    def get_status(self, depth=5):
+        return {
+            "delivery_hour": self.delivery_hour,
+            "gate_closure_time": self.gate_closure_time,
+            "status": "closed" if self.closed else "open",
+            "best_bid": self.best_bid(),
+            "best_ask": self.best_ask(),
+            "bids": self.bids.depth(depth),
+            "asks": self.asks.depth(depth),
+            "trade_count": len(self.trades),
+            "last_price": self.trades[-1].price if self.trades else None,
+        }
+
+
+class OrderBookManager:
+    """
+    One OrderBook per delivery hour, created on the first order.
+
+    Gate closure times are kept in a min-heap like the AuctionManager deadlines,
+    so close_due only touches books whose gate has passed. Closed books are
+    dropped from ``books``; ``closed_until`` (the latest gate closed so far)
+    keeps orders for those hours out.
+    """
+
+    def __init__(self, grid_price=0.3, import_price=None, gate_closure=300):
+        """
+        :param grid_price: Grid fallback price for unmatched sell volume.
+        :param import_price: Grid price for unmatched buy volume (None: left unfilled).
+        :param gate_closure: Seconds before the start of the delivery hour at which trading stops.
+        """
+        self.grid_price = grid_price
+        self.import_price = import_price
+        self.gate_closure = gate_closure
+        self.books = {}
+        self.closures = []
+        self.closed_until = float("-inf")
+        self.order_ids = itertools.count(1)
+
+    def gate_closure_time(self, delivery_hour):
+        start = datetime.strptime(delivery_hour, DELIVERY_HOUR_FORMAT)
+        if start.minute != 0:
+            raise ValueError(f"Delivery hour must start on the hour: {delivery_hour}")
+        return start.timestamp() - self.gate_closure
+
+    def get_book(self, delivery_hour):
+        return self.books.get(delivery_hour)
+
+    def _open_book(self, delivery_hour, gate):
+        book = self.books.get(delivery_hour)
+        if book is None:
+            book = OrderBook(delivery_hour, gate, self.grid_price, self.import_price, self.order_ids)
+            self.books[delivery_hour] = book
+            heapq.heappush(self.closures, (gate, delivery_hour))
+        return book
+
+    def submit(self, owner, delivery_hour, side, price, quantity, now=None):
+        """
+        :return: Dict with status, the order and the trades it caused.
+        """
+        if now is None:
+            now = time.time()
+        # Validate before opening a book, so rejected orders never leave an empty book behind
+        if side not in ("buy", "sell"):
+            return {"status": "fail", "msg": f"Unknown side {side!r}"}
+        if quantity <= 0 or price < 0:
+            return {"status": "fail", "msg": "Quantity must be positive and price non-negative"}
+        try:
+            gate = self.gate_closure_time(delivery_hour)
+        except ValueError as e:
+            return {"status": "fail", "msg": str(e)}
+        if now >= gate or gate <= self.closed_until:
+            return {"status": "fail", "msg": f"Gate closed for {delivery_hour}"}
+        book = self._open_book(delivery_hour, gate)
+        order, trades = book.submit(owner, side, price, quantity, now)
+        return {
+            "status": "success",
+            "order": order.to_dict(),
+            "trades": [t._asdict() for t in trades],
+        }
+
+    def cancel(self, delivery_hour, order_id, owner):
+        book = self.books.get(delivery_hour)
+        if book is None:
+            return {"status": "fail", "msg": "Order book not found"}
+        return book.cancel(order_id, owner)
+
+    def next_gate_closure(self):
+        return self.closures[0][0] if self.closures else None
+
+    def close_due(self, now=None):
+        """
+        Close every book whose gate closure time has passed and drop it from ``books``.
+        :return: List of (book, grid trades) for the books just closed.
+        """
+        if now is None:
+            now = time.time()
+        closed = []
+        while self.closures and self.closures[0][0] <= now:
+            gate, delivery_hour = heapq.heappop(self.closures)
+            self.closed_until = max(self.closed_until, gate)
+            book = self.books.pop(delivery_hour)
+            closed.append((book, book.close(now)))
+        return closed
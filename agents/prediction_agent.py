@@ -6,6 +6,16 @@ from sklearn.preprocessing import MinMaxScaler
 from sklearn.metrics import mean_squared_error
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import LSTM, Dense
+import time
+from utils import log, metrics, tracing
+
+logger = log.get_logger("PredictionAgent")
+
+PREDICTION_SECONDS = metrics.histogram(
+    "prediction_seconds", "Duration of a 7-day forecast", ["method"])
+MODEL_STEP_SECONDS = metrics.histogram(
+    "prediction_model_step_seconds", "Duration of one model call inside a forecast", ["method"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
 
 class EnergyPredictionAgent:
     """
@@ -177,8 +187,10 @@ class EnergyPredictionAgent:
         用上一小时的cons,gen预测下一小时, 直到推完168小时.
         """
         if self.model is None:
-            print("Model not trained!")
+            logger.error("Model not trained!")
             return None
+        start = time.perf_counter()
+        step_seconds = MODEL_STEP_SECONDS.labels("predict_7days")
 
         wf = weather_forecast_df
         # 假设它有: time, day_of_week, weather
@@ -190,8 +202,11 @@ class EnergyPredictionAgent:
         results = []
         prev_cons = start_consumption
         prev_gene = start_generation
+        # 开启追踪时记录每个阶段 (one-hot, 归一化, 模型, 反归一化) 的累计耗时
+        stage = tracing.stages("predict_7days")
 
         for i in range(len(wf)):
+            stage.skip()
             row = wf.iloc[i]
             # day_of_week => row["day_of_week"]
             # hour_of_day => row["hour_of_day"]
@@ -219,15 +234,19 @@ class EnergyPredictionAgent:
 
             # 4) 拼成特征 = [dow_..., hod_..., w_..., consumption, generation]
             cat_vector = dow_vector + hod_vector + list(weath_map.values()) + [prev_cons, prev_gene]
+            stage.lap("onehot")
 
             # 5) 归一化
             arr_2d = np.array([cat_vector], dtype='float32')
             scaled_2d = self.scaler.transform(arr_2d)
             # reshape => (1,1,F)
             input_lstm = scaled_2d.reshape((1,1, scaled_2d.shape[1]))
+            stage.lap("scale")
 
             # 6) 预测 => (1,2)
-            yhat = self.model.predict(input_lstm)[0]
+            with step_seconds.time():
+                yhat = self.model.predict(input_lstm)[0]
+            stage.lap("model")
             # 7) 反归一化 + clamp
             F = len(self.feature_columns)
             dummy_pred = np.zeros(F, dtype='float32')
@@ -235,6 +254,7 @@ class EnergyPredictionAgent:
             inv_ = self.scaler.inverse_transform([dummy_pred])[0]
             cons_pred = max(inv_[-2], 0)
             gene_pred = max(inv_[-1], 0)
+            stage.lap("inverse")
 
             results.append({
                 "time": row["time"],
@@ -248,18 +268,137 @@ class EnergyPredictionAgent:
             prev_cons = cons_pred
             prev_gene = gene_pred
 
+        stage.skip()
         df_res = pd.DataFrame(results)
+        stage.lap("dataframe")
+        stage.close()
+        PREDICTION_SECONDS.labels("predict_7days").observe(time.perf_counter() - start)
         return df_res
 
-print("[PredictionAgent] Loading LSTM model...")
+    def predict_7days_batch(self, weather_forecast_df, start_consumptions, start_generations):
+        """
+        同 predict_7days, 但一次预测多个家庭 (同一天气预报, 不同的起始 consumption/generation).
+        每小时只调用一次模型, 输入是所有家庭组成的 batch, 用于社区市场模拟等需要整个社区预测的场景.
+
+        :param weather_forecast_df: DataFrame [time, day_of_week, weather] (可选 hour_of_day).
+        :param start_consumptions: 每个家庭当前的 consumption, 长度 = 家庭数.
+        :param start_generations: 每个家庭当前的 generation, 长度 = 家庭数.
+        :return: (consumption, generation) 两个 (家庭数, 小时数) 的数组; 失败时返回 None.
+        """
+        if self.model is None:
+            logger.error("Model not trained!")
+            return None
+        start = time.perf_counter()
+        calendar = self._calendar_features(weather_forecast_df)
+        prev = np.stack([np.asarray(start_consumptions, dtype='float32'),
+                         np.asarray(start_generations, dtype='float32')], axis=1)
+        cons, gene = self._rollout(calendar, prev, "predict_7days_batch")
+        PREDICTION_SECONDS.labels("predict_7days_batch").observe(time.perf_counter() - start)
+        return cons, gene
+
+    def predict_horizons_batch(self, weather_forecast_dfs, start_consumptions, start_generations):
+        """
+        一次预测多个请求, 每个请求有自己的天气预报 (长度可以不同) 和起始 consumption/generation.
+        较短的预报在末尾补零, 结果再截断. 预测服务 (agents/forecast_service) 用它合并并发请求.
+
+        :param weather_forecast_dfs: DataFrame 列表, 每个 [time, day_of_week, weather] (可选 hour_of_day).
+        :param start_consumptions: 每个请求的起始 consumption.
+        :param start_generations: 每个请求的起始 generation.
+        :return: 每个请求一个 DataFrame, 列与 predict_7days 相同; 失败时返回 None.
+        """
+        if self.model is None:
+            logger.error("Model not trained!")
+            return None
+        start = time.perf_counter()
+        calendars = [self._calendar_features(wf) for wf in weather_forecast_dfs]
+        n_hours = max(len(c) for c in calendars)
+        padded = np.zeros((len(calendars), n_hours, calendars[0].shape[1]), dtype='float32')
+        for k, c in enumerate(calendars):
+            padded[k, :len(c)] = c
+        prev = np.stack([np.asarray(start_consumptions, dtype='float32'),
+                         np.asarray(start_generations, dtype='float32')], axis=1)
+        cons, gene = self._rollout(padded, prev, "predict_horizons_batch")
+
+        results = []
+        for k, wf in enumerate(weather_forecast_dfs):
+            n = len(wf)
+            results.append(pd.DataFrame({
+                "time": wf["time"].to_numpy(),
+                "day_of_week": wf["day_of_week"].to_numpy(),
+                "weather": wf["weather"].to_numpy(),
+                "consumption_pred": cons[k, :n],
+                "generation_pred": gene[k, :n],
+            }))
+        PREDICTION_SECONDS.labels("predict_horizons_batch").observe(time.perf_counter() - start)
+        return results
+
+    def _calendar_features(self, wf):
+        """日历和天气的 one-hot 部分 (小时数, 7+24+W), 顺序与 predict_7days 的特征相同."""
+        if 'hour_of_day' not in wf.columns:
+            wf['hour_of_day'] = pd.to_datetime(wf['time']).dt.hour
+
+        n_hours = len(wf)
+        weather_labels = [c[2:] for c in self.weather_categories]
+        dow = wf['day_of_week'].to_numpy(dtype='int64')
+        hod = wf['hour_of_day'].to_numpy(dtype='int64')
+        calendar = np.zeros((n_hours, 7 + 24 + len(weather_labels)), dtype='float32')
+        rows = np.arange(n_hours)
+        ok = (dow >= 0) & (dow <= 6)
+        calendar[rows[ok], dow[ok]] = 1
+        ok = (hod >= 0) & (hod <= 23)
+        calendar[rows[ok], 7 + hod[ok]] = 1
+        for j, label in enumerate(weather_labels):
+            calendar[(wf['weather'] == label).to_numpy(), 31 + j] = 1
+        return calendar
+
+    def _rollout(self, calendar, prev, method):
+        """
+        迭代预测, 每小时只调用一次模型, 输入是所有家庭组成的 batch.
+
+        :param calendar: (小时数, C) 所有家庭共用, 或 (家庭数, 小时数, C) 每个家庭各自的日历和天气.
+        :param prev: (家庭数, 2) 起始 consumption, generation.
+        :param method: 指标和追踪中使用的名字.
+        :return: (consumption, generation) 两个 (家庭数, 小时数) 的数组.
+        """
+        step_seconds = MODEL_STEP_SECONDS.labels(method)
+        n_homes = prev.shape[0]
+        n_hours = calendar.shape[-2]
+        F = len(self.feature_columns)
+        cons = np.empty((n_homes, n_hours), dtype='float32')
+        gene = np.empty((n_homes, n_hours), dtype='float32')
+        features = np.empty((n_homes, calendar.shape[-1] + 2), dtype='float32')
+        dummy = np.zeros((n_homes, F), dtype='float32')
+        stage = tracing.stages(method)
+        for i in range(n_hours):
+            stage.skip()
+            features[:, :-2] = calendar[..., i, :]
+            features[:, -2:] = prev
+            scaled = self.scaler.transform(features).astype('float32')
+            stage.lap("scale")
+            # 直接调用模型, 避免 predict() 每次调用的额外开销
+            with step_seconds.time():
+                yhat = np.asarray(self.model(scaled.reshape((n_homes, 1, F)), training=False))
+            stage.lap("model")
+            dummy[:, -2:] = yhat
+            inv_ = self.scaler.inverse_transform(dummy)
+            prev = np.clip(inv_[:, -2:], 0, None).astype('float32')
+            cons[:, i] = prev[:, 0]
+            gene[:, i] = prev[:, 1]
+            stage.lap("inverse")
+        stage.close()
+        return cons, gene
+
+logger.info("Loading LSTM model...")
 agent = EnergyPredictionAgent(train_path="./static/energy_dataset.csv", n_in=1)
 agent.load_model("./models/energy_lstm_model.keras",)  # 加载模型
-print("[PredictionAgent] Loaded LSTM model.")
+logger.info("Loaded LSTM model.")
 
 
 
 def run_prediction_agent(weather_data,start_consumption=1.0,start_generation=0.3,start_hour_of_day=0):
-    print("[PreditionAgent] Received Weather Data\n", weather_data)
+    logger.info("Received Weather Data", extra={"hours": len(weather_data)})
+    # DataFrame 只在 DEBUG 级别才会被格式化
+    logger.debug("Weather Data:\n%s", weather_data)
     # agent.train(epochs=50)
     # 假设当前时刻 consumption=1.0, generation=0.3
     df_7days = agent.predict_7days(
@@ -268,8 +407,8 @@ def run_prediction_agent(weather_data,start_consumption=1.0,start_generation=0.3
         start_generation=start_generation,
         start_hour_of_day=start_hour_of_day
     )
-    print("[PredictionAgent] Finished running.")
-    print("[PredictionAgent] Prediction Data:\n", df_7days)
+    logger.info("Finished running.")
+    logger.debug("Prediction Data:\n%s", df_7days)
     return df_7days
 
 # ============ 使用举例 =============
@@ -0,0 +1,101 @@
+"""
+Recovery time of the P2P auction write-ahead log.
+
+Writes a log of create/bid/end events, then measures how long a fresh
+AuctionManager takes to rebuild its state from it (with and without a snapshot).
+
+Usage (from the repository root):
+    python -m benchmarks.auction_recovery_benchmark --events 1000000
+"""
+import argparse
+import random
+import tempfile
+import time
+
+from agents.p2p_trading_agent.auction import AuctionManager
+from utils.event_log import EventLog
+
+
+def write_events(directory, n_events, bids_per_auction=8, seed=42):
+    """
+    Append a realistic mix of events: every auction is created, receives
+    ``bids_per_auction`` rising bids and most of them end.
+    :return: Number of auctions created.
+    """
+    rng = random.Random(seed)
+    log = EventLog(directory, flush_every=4096, fsync=False)
+    now = time.time()
+    n_auctions = 0
+    written = 0
+    while written < n_events:
+        aid = f"a{n_auctions:07d}"
+        n_auctions += 1
+        log.append(["create", aid, f"seller{rng.randrange(1000)}", 5.0, 0.3, 0.0, 3600, 300, now])
+        written += 1
+        price = 0.0
+        for _ in range(min(bids_per_auction, n_events - written)):
+            price += rng.uniform(0.01, 0.05)
+            log.append(["bid", aid, f"buyer{rng.randrange(1000)}", round(price, 3), now])
+            written += 1
+        if written < n_events and rng.random() < 0.8:
+            log.append(["end", aid, now])
+            written += 1
+    log.close()
+    return n_auctions
+
+
+def recover(directory):
+    manager = AuctionManager()
+    log = EventLog(directory, fsync=False)
+    start = time.perf_counter()
+    replayed, _ = log.recover(manager.apply_event, manager.load_state)
+    manager.restore_indexes()
+    seconds = time.perf_counter() - start
+    manager.event_log = log
+    return manager, log, replayed, seconds
+
+
+def run(n_events=1000000, seed=42):
+    """
+    :return: Dict with the number of events and auctions, the recovery time from the
+             log alone and from a snapshot, and the snapshot write time.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        n_auctions = write_events(directory, n_events, seed=seed)
+        manager, log, replayed, replay_seconds = recover(directory)
+
+        start = time.perf_counter()
+        seq, state = manager.export_state()
+        log.write_snapshot(seq, state)
+        snapshot_seconds = time.perf_counter() - start
+        log.close()
+
+        restored, log, _, snapshot_recovery_seconds = recover(directory)
+        log.close()
+        assert len(restored.auctions) == len(manager.auctions)
+
+    return {
+        "events": replayed,
+        "auctions": n_auctions,
+        "replay_seconds": replay_seconds,
+        "events_per_second": replayed / replay_seconds,
+        "snapshot_write_seconds": snapshot_seconds,
+        "snapshot_recovery_seconds": snapshot_recovery_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recovery of the P2P auction write-ahead log.")
+    parser.add_argument("--events", type=int, default=1000000, help="Number of logged events")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    res = run(args.events, args.seed)
+    print(f"[Benchmark] Replayed {res['events']} events ({res['auctions']} auctions) in "
+          f"{res['replay_seconds']:.3f}s => {res['events_per_second']:,.0f} events/s")
+    print(f"[Benchmark] Snapshot written in {res['snapshot_write_seconds']:.3f}s, "
+          f"recovery from snapshot {res['snapshot_recovery_seconds']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmark for the community market simulator: a synthetic fleet built from one
+forecast, cleared hourly for a grid of scenarios.
+
+Usage (from the repository root):
+    python -m benchmarks.community_market_benchmark --homes 1000 --hours 8760 --scenarios 27
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from utils.community_market import scenario_grid, simulate_market, synthetic_fleet
+
+FORECAST_CSV = "./static/predicted_7days.csv"
+
+
+def run(n_homes=1000, n_hours=8760, n_scenarios=27, forecast_csv=FORECAST_CSV):
+    """
+    :return: Dict with the fleet size, fleet build time, simulation time and home-hours per second.
+    """
+    forecast = pd.read_csv(forecast_csv)
+    start = time.perf_counter()
+    cons, gen, _ = synthetic_fleet(forecast, n_homes, n_hours)
+    build_seconds = time.perf_counter() - start
+
+    grid_prices = [0.02 + 0.01 * i for i in range(3)]
+    extensions = [60.0 * (i + 1) for i in range(max(1, n_scenarios // 9))]
+    scenarios = scenario_grid(grid_prices, extensions, ["english", "midpoint", "open"])[:n_scenarios]
+    start = time.perf_counter()
+    simulate_market(cons, gen, scenarios)
+    seconds = time.perf_counter() - start
+
+    return {
+        "homes": n_homes,
+        "hours": n_hours,
+        "scenarios": len(scenarios),
+        "build_seconds": build_seconds,
+        "seconds": seconds,
+        "home_hours_per_second": n_homes * n_hours * len(scenarios) / seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the community market simulator.")
+    parser.add_argument("--homes", type=int, default=1000)
+    parser.add_argument("--hours", type=int, default=8760)
+    parser.add_argument("--scenarios", type=int, default=27)
+    args = parser.parse_args()
+
+    res = run(args.homes, args.hours, args.scenarios)
+    print(f"[Benchmark] {res['homes']} homes x {res['hours']} hours: fleet built in {res['build_seconds']:.2f}s, "
+          f"{res['scenarios']} scenarios simulated in {res['seconds']:.2f}s "
+          f"=> {res['home_hours_per_second']:,.0f} home-hours/s")
+
+
+if __name__ == "__main__":
+    main()
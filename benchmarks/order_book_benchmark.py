@@ -0,0 +1,82 @@
+"""
+Throughput benchmark for the continuous double-auction order book.
+
+Usage (from the repository root):
+    python -m benchmarks.order_book_benchmark --orders 200000
+"""
+import argparse
+import random
+import time
+
+from agents.p2p_trading_agent.order_book import OrderBook
+
+
+def generate_orders(n_orders, n_traders=500, mid_price=0.25, spread=0.05, cancel_ratio=0.1, seed=42):
+    """
+    Random limit orders around a mid price, with prices on a 0.001 tick grid.
+    :return: List of ("submit", owner, side, price, quantity) or ("cancel", owner, index) tuples,
+             where index refers to an earlier submit.
+    """
+    rng = random.Random(seed)
+    ops = []
+    submitted = 0
+    for _ in range(n_orders):
+        if submitted and rng.random() < cancel_ratio:
+            ops.append(("cancel", None, rng.randrange(submitted)))
+            continue
+        side = "buy" if rng.random() < 0.5 else "sell"
+        offset = rng.gauss(0, spread)
+        price = round(max(0.001, mid_price + (-offset if side == "buy" else offset)), 3)
+        quantity = round(rng.uniform(0.5, 10.0), 2)
+        ops.append(("submit", f"user{rng.randrange(n_traders)}", side, price, quantity))
+        submitted += 1
+    return ops
+
+
+def run(n_orders=200000, seed=42):
+    """
+    Replay generated orders against one book and measure the matching rate.
+    :return: Dict with orders, cancels, trades, seconds and orders_per_second.
+    """
+    ops = generate_orders(n_orders, seed=seed)
+    book = OrderBook("2024-06-01 14:00")
+    placed = []
+    trades = cancels = 0
+    now = time.time()
+
+    start = time.perf_counter()
+    for op in ops:
+        if op[0] == "submit":
+            order, new_trades = book.submit(op[1], op[2], op[3], op[4], now)
+            placed.append(order)
+            trades += len(new_trades)
+        else:
+            order = placed[op[2]]
+            book.cancel(order.order_id, order.owner)
+            cancels += 1
+    seconds = time.perf_counter() - start
+
+    return {
+        "orders": len(ops) - cancels,
+        "cancels": cancels,
+        "trades": trades,
+        "resting_orders": len(book.orders),
+        "seconds": seconds,
+        "orders_per_second": len(ops) / seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the P2P order book matching engine.")
+    parser.add_argument("--orders", type=int, default=200000, help="Number of operations to replay")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    res = run(args.orders, args.seed)
+    print(f"[Benchmark] {res['orders']} orders, {res['cancels']} cancels, {res['trades']} trades "
+          f"in {res['seconds']:.3f}s => {res['orders_per_second']:,.0f} ops/s "
+          f"({res['resting_orders']} orders resting)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""
+Socket.IO bidding load test for the P2P trading agent.
+
+Starts the P2P app in a subprocess on the eventlet server (unless --url points
+to a running one), registers and logs in simulated users, lets them join
+auctions and place bids at a configurable rate, and writes a JSON report with:
+
+- bid acknowledgement latency (emit -> bid_response) percentiles,
+- broadcast fan-out delay (bid emit -> auction_status at every room member),
+- server CPU and memory from /proc (local server only),
+- the git commit and the configuration, so reports can be compared across commits.
+
+Usage (from the repository root):
+    python -m benchmarks.p2p_load_test --users 500 --auctions 10 --rate 1 --duration 30 -o load.json
+    # the same against the multi-worker mode (agents.p2p_trading_agent.cluster)
+    python -m benchmarks.p2p_load_test --workers 4 --users 2000 --auctions 40 -o load-4w.json
+
+Needs python-socketio's client dependencies (requests, and websocket-client for
+the websocket transport; without it the client falls back to long-polling).
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+import socketio
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVER_CODE = (
+    "from agents.p2p_trading_agent.app import app, socketio;"
+    "socketio.run(app, host='127.0.0.1', port={port}, log_output=False)"
+)
+
+
+# ---------- server ----------
+
+def start_server(port, state_dir, workers=1):
+    env = dict(os.environ, P2P_EVENT_LOG_DIR=os.path.join(state_dir, "events"))
+    if workers > 1:
+        cmd = [sys.executable, "-m", "agents.p2p_trading_agent.cluster",
+               "--workers", str(workers), "--port", str(port)]
+    else:
+        cmd = [sys.executable, "-c", SERVER_CODE.format(port=port)]
+    proc = subprocess.Popen(
+        cmd, cwd=state_dir, env=dict(env, PYTHONPATH=REPO_ROOT),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("P2P server exited during startup")
+        try:
+            requests.get(url + "/login", timeout=1)
+            return proc, url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("P2P server did not start within 30s")
+
+
+class ProcessSampler:
+    """Samples CPU time and resident memory of a process and its children from /proc."""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.ticks = os.sysconf("SC_CLK_TCK")
+        self.peak_rss = 0
+        self.running = False
+
+    def pids(self):
+        # The cluster supervisor's workers are its children
+        try:
+            with open(f"/proc/{self.pid}/task/{self.pid}/children") as f:
+                return [self.pid] + [int(p) for p in f.read().split()]
+        except OSError:
+            return [self.pid]
+
+    def cpu_seconds(self):
+        total = 0
+        for pid in self.pids():
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+            total += int(fields[11]) + int(fields[12])
+        return total / self.ticks
+
+    def rss_bytes(self):
+        total = 0
+        for pid in self.pids():
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+        return total
+
+    def _run(self):
+        while self.running:
+            self.peak_rss = max(self.peak_rss, self.rss_bytes())
+            eventlet.sleep(self.interval)
+
+    def start(self):
+        self.running = True
+        self.start_cpu = self.cpu_seconds()
+        self.start_wall = time.perf_counter()
+        eventlet.spawn(self._run)
+
+    def stop(self):
+        self.running = False
+        wall = time.perf_counter() - self.start_wall
+        cpu = self.cpu_seconds() - self.start_cpu
+        return {
+            "cpu_seconds": cpu,
+            "cpu_percent": 100.0 * cpu / wall if wall else 0.0,
+            "rss_peak_mb": max(self.peak_rss, self.rss_bytes()) / 1e6,
+        }
+
+
+# ---------- simulated users ----------
+
+def login_session(url, username, password):
+    """Register (if needed) and log in; :return: the session cookie header."""
+    http = requests.Session()
+    http.post(url + "/register", data={"username": username, "password": password}, allow_redirects=False)
+    http.post(url + "/login", data={"username": username, "password": password}, allow_redirects=False)
+    cookie = http.cookies.get("session")
+    if not cookie:
+        raise RuntimeError(f"Login failed for {username}")
+    return f"session={cookie}"
+
+
+class Recorder:
+    """Shared by all simulated users; they run in one process so send times are comparable."""
+
+    def __init__(self):
+        self.req_ids = itertools.count(1)
+        self.pending = {}
+        self.bid_sent = {}
+        self.ack_latency = []
+        self.fanout_delay = []
+        self.results = {"success": 0, "fail": 0, "rate_limited": 0}
+        self.status_messages = 0
+        self.errors = 0
+
+
+class SimulatedBidder:
+    def __init__(self, name, cookie, url, auction_id, recorder, rate, transports=None):
+        self.name = name
+        self.auction_id = auction_id
+        self.recorder = recorder
+        self.rate = rate
+        self.highest = 0.0
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on("bid_response", self.on_bid_response)
+        self.sio.on("auction_status", self.on_auction_status)
+        self.sio.connect(url, headers={"Cookie": cookie}, transports=transports, wait_timeout=30)
+        self.sio.emit("join_auction", {"auction_id": auction_id})
+
+    def on_bid_response(self, res):
+        now = time.perf_counter()
+        sent = self.recorder.pending.pop(res.get("req_id"), None)
+        if sent is not None:
+            self.recorder.ack_latency.append(now - sent)
+        if res["status"] == "success":
+            self.recorder.results["success"] += 1
+        elif "slow down" in res.get("msg", ""):
+            self.recorder.results["rate_limited"] += 1
+        else:
+            self.recorder.results["fail"] += 1
+
+    def on_auction_status(self, status):
+        now = time.perf_counter()
+        self.highest = max(self.highest, status.get("highest_bid") or 0.0)
+        self.recorder.status_messages += 1
+        sent = self.recorder.bid_sent.get((status["auction_id"], status.get("highest_bidder"), status.get("highest_bid")))
+        if sent is not None:
+            self.recorder.fanout_delay.append(now - sent)
+
+    def bid_loop(self, until):
+        rng = random.Random(self.name)
+        while True:
+            # Poisson arrivals at `rate` bids per second
+            eventlet.sleep(rng.expovariate(self.rate))
+            if time.perf_counter() >= until:
+                return
+            price = round(self.highest + rng.uniform(0.001, 0.01), 4)
+            req_id = next(self.recorder.req_ids)
+            now = time.perf_counter()
+            self.recorder.pending[req_id] = now
+            self.recorder.bid_sent[(self.auction_id, self.name, price)] = now
+            try:
+                self.sio.emit("place_bid", {"auction_id": self.auction_id, "bid_price": price, "req_id": req_id})
+            except Exception:
+                self.recorder.errors += 1
+
+    def close(self):
+        self.sio.disconnect()
+
+
+# ---------- report ----------
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1000.0
+    return {
+        "count": len(values),
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+        "max_ms": values[-1] * 1000.0,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(users=200, auctions=5, rate=1.0, duration=20.0, url=None, port=5101, connect_concurrency=50,
+        workers=1, keep_state=False):
+    """
+    Run one load test.
+    :param workers: Worker processes of the locally started server (>1 runs the cluster mode,
+                    whose clients must use the websocket transport).
+    :param keep_state: Keep the locally started server's state directory (event logs) instead
+                       of deleting it once the server has exited.
+    :return: The report dict.
+    """
+    state_dir = None
+    server = sampler = None
+    transports = ["websocket"] if workers > 1 else None
+    if url is None:
+        state_dir = tempfile.mkdtemp(prefix="p2p_load_")
+        server, url = start_server(port, state_dir, workers)
+        sampler = ProcessSampler(server.pid)
+    try:
+        print(f"[LoadTest] Logging in {users} users at {url}")
+        pool = eventlet.GreenPool(connect_concurrency)
+        names = [f"load_user_{i}" for i in range(users)]
+        cookies = list(pool.imap(lambda n: login_session(url, n, "load-test"), names))
+
+        # Sellers are the first few users
+        auction_ids = []
+        for i in range(auctions):
+            http = requests.Session()
+            resp = http.post(url + "/api/create_auction", headers={"Cookie": cookies[i % users]},
+                             json={"quantity": 5, "total_duration": int(duration) + 600})
+            auction_ids.append(resp.json()["auction_id"])
+
+        recorder = Recorder()
+        bidders = list(pool.imap(
+            lambda i: SimulatedBidder(names[i], cookies[i], url, auction_ids[i % auctions], recorder, rate,
+                                      transports),
+            range(users)))
+        print(f"[LoadTest] {len(bidders)} bidders connected, bidding for {duration}s")
+
+        if sampler:
+            sampler.start()
+        start = time.perf_counter()
+        until = start + duration
+        threads = [eventlet.spawn(b.bid_loop, until) for b in bidders]
+        for t in threads:
+            t.wait()
+        # Let the last acknowledgements and broadcasts arrive
+        eventlet.sleep(2.0)
+        elapsed = time.perf_counter() - start
+        server_stats = sampler.stop() if sampler else None
+
+        for b in bidders:
+            b.close()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(10)
+        if state_dir is not None:
+            if keep_state:
+                print(f"[LoadTest] Server state kept in {state_dir}")
+            else:
+                shutil.rmtree(state_dir, ignore_errors=True)
+
+    sent = len(recorder.ack_latency) + len(recorder.pending)
+    return {
+        "git_commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"users": users, "auctions": auctions, "rate_per_user": rate, "duration_s": duration,
+                   "workers": workers},
+        "bids_sent": sent,
+        "bids_acknowledged": len(recorder.ack_latency),
+        "bids_unacknowledged": len(recorder.pending),
+        "results": recorder.results,
+        "client_errors": recorder.errors,
+        "acked_bids_per_second": len(recorder.ack_latency) / elapsed,
+        "ack_latency": percentiles(recorder.ack_latency),
+        "fanout_delay": percentiles(recorder.fanout_delay),
+        "status_messages_received": recorder.status_messages,
+        "server": server_stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Socket.IO bidding load test for the P2P trading agent.")
+    parser.add_argument("--users", type=int, default=200, help="Number of simulated bidders")
+    parser.add_argument("--auctions", type=int, default=5, help="Number of auctions the bidders spread over")
+    parser.add_argument("--rate", type=float, default=1.0, help="Bids per second per user")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of bidding")
+    parser.add_argument("--url", default=None, help="Use a running server instead of starting one")
+    parser.add_argument("--port", type=int, default=5101, help="Port of the locally started server")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes of the locally started server")
+    parser.add_argument("--keep-state", action="store_true",
+                        help="Keep the locally started server's state directory (event logs)")
+    parser.add_argument("-o", "--output", default=None, help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(args.users, args.auctions, args.rate, args.duration, args.url, args.port,
+                 workers=args.workers, keep_state=args.keep_state)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+        print(f"[LoadTest] Report written to {args.output}")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+"""
+Benchmark suite for the hot paths of the project, with JSON results that can be
+compared between commits.
+
+Micro benchmarks time one call (best and median of several runs, looped like
+timeit when a call is short); macro benchmarks reuse the run() functions of the
+other benchmark modules (smaller sizes with --quick). Everything runs offline on the CPU.
+Cases whose dependencies are missing (TensorFlow for the forecast cases) are
+reported as skipped instead of failing the suite.
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmarks -o bench-main.json
+    python -m benchmarks.run_benchmarks --quick --only billing,auction
+    # run and compare against a stored result, exit code 1 on a regression
+    python -m benchmarks.run_benchmarks -o bench-head.json --compare bench-main.json
+    # compare two stored results without running
+    python -m benchmarks.run_benchmarks --compare bench-main.json bench-head.json --threshold 0.1
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WEATHER_CSV = "./static/weather_forecast_7days.csv"
+FORECAST_CSV = "./static/predicted_7days.csv"
+MODEL_PATH = "./models/energy_lstm_model.keras"
+
+# name -> (group, function(quick) -> result dict)
+CASES = {}
+
+
+def case(name, group):
+    def register(func):
+        CASES[name] = (group, func)
+        return func
+    return register
+
+
+def measure(func, setup=None, repeat=5, min_time=0.2):
+    """
+    Time ``func`` and return the best and median seconds per call.
+    :param setup: Optional callable run untimed before each run; its return value is
+                  passed to func as the only argument and every run times one call.
+                  Use it for calls that change their input (e.g. ending auctions).
+    :param min_time: Without setup, each run loops func until it lasts at least this long.
+    """
+    if setup is None:
+        timer = timeit.Timer(func)
+        number, _ = timer.autorange()
+        number = max(1, int(number * min_time / 0.2))
+        times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    else:
+        number = 1
+        times = []
+        for _ in range(repeat):
+            arg = setup()
+            start = time.perf_counter()
+            func(arg)
+            times.append(time.perf_counter() - start)
+    return {"seconds": min(times), "median_seconds": statistics.median(times),
+            "runs": repeat, "calls_per_run": number}
+
+
+# ---------- forecast (needs TensorFlow and the trained model) ----------
+
+def _prediction_agent():
+    # The module loads the model on import, which also covers load_model below
+    from agents.prediction_agent import agent
+    return agent
+
+
+@case("predict_7days", "prediction")
+def bench_predict_7days(quick):
+    agent = _prediction_agent()
+    weather = pd.read_csv(WEATHER_CSV)
+    return measure(lambda: agent.predict_7days(weather.copy(), 1.0, 0.3), repeat=3 if quick else 5, min_time=0)
+
+
+@case("predict_7days_batch", "prediction")
+def bench_predict_7days_batch(quick):
+    agent = _prediction_agent()
+    weather = pd.read_csv(WEATHER_CSV)
+    homes = 16 if quick else 256
+    rng = np.random.default_rng(42)
+    cons, gen = rng.uniform(0.5, 2.0, homes), rng.uniform(0.0, 0.5, homes)
+    res = measure(lambda: agent.predict_7days_batch(weather.copy(), cons, gen), repeat=3, min_time=0)
+    res["homes"] = homes
+    res["home_forecasts_per_second"] = homes / res["seconds"]
+    return res
+
+
+@case("load_model", "prediction")
+def bench_load_model(quick):
+    from agents.prediction_agent import EnergyPredictionAgent
+
+    def load():
+        EnergyPredictionAgent(train_path="./static/energy_dataset.csv").load_model(MODEL_PATH)
+    return measure(load, repeat=2 if quick else 3, min_time=0)
+
+
+# ---------- data conversion ----------
+
+@case("json_to_dataframe_168", "data_loader")
+def bench_json_to_dataframe(quick):
+    from utils.data_loader import dataframe_to_json, json_to_dataframe
+    payload = dataframe_to_json(pd.read_csv(WEATHER_CSV))
+    return measure(lambda: json_to_dataframe(payload))
+
+
+@case("dataframe_to_json_168", "data_loader")
+def bench_dataframe_to_json(quick):
+    from utils.data_loader import dataframe_to_json
+    df = pd.read_csv(FORECAST_CSV)
+    return measure(lambda: dataframe_to_json(df))
+
+
+# ---------- energy management ----------
+
+def _usage_data(n_appliances, seed=42):
+    rng = random.Random(seed)
+    return [{"appliance": f"appliance{i}", "usage": round(rng.uniform(0.1, 5.0), 2),
+             "usage_count": rng.randrange(1, 50)} for i in range(n_appliances)]
+
+
+@case("prioritize_appliances", "ems")
+def bench_prioritize_appliances(quick):
+    from agents.energy_manage_agent.agent import BehavioralSegmentationAgent
+    data = _usage_data(12)
+
+    def setup():
+        agent = BehavioralSegmentationAgent()
+        agent.update_data(data)
+        return agent
+    return measure(lambda agent: agent.prioritize_appliances(), setup=setup, repeat=5 if quick else 20)
+
+
+@case("prioritize_appliances_warm", "ems")
+def bench_prioritize_appliances_warm(quick):
+    from agents.energy_manage_agent.agent import BehavioralSegmentationAgent
+    agent = BehavioralSegmentationAgent()
+    agent.update_data(_usage_data(12))
+    agent.prioritize_appliances()
+    return measure(agent.prioritize_appliances, repeat=5 if quick else 20, min_time=0)
+
+
+# ---------- P2P auctions ----------
+
+def _auction_manager(n_auctions):
+    from agents.p2p_trading_agent.auction import AuctionManager
+    manager = AuctionManager()
+    for i in range(n_auctions):
+        manager.create_auction(f"seller{i % 500}", 5.0, total_duration=3600 + i % 600)
+    return manager
+
+
+@case("check_all_auctions_10k_idle", "auction")
+def bench_check_all_auctions_idle(quick):
+    # 10k live auctions, none of them due: the monitor's steady state
+    manager = _auction_manager(10000)
+    return measure(manager.check_all_auctions)
+
+
+@case("check_all_auctions_10k_expire", "auction")
+def bench_check_all_auctions_expire(quick):
+    # 10k live auctions that are all due at once
+    res = measure(lambda manager: manager.check_all_auctions(time.time() + 86400),
+                  setup=lambda: _auction_manager(10000), repeat=3 if quick else 5)
+    res["auctions"] = 10000
+    return res
+
+
+# ---------- generators and billing ----------
+
+@case("weather_forecast_7days", "generators")
+def bench_weather_forecast(quick):
+    from utils.weather_forecast import generate_7day_forecast_with_night_state
+    random.seed(42)
+    return measure(lambda: generate_7day_forecast_with_night_state(start_time=datetime(2025, 1, 1)))
+
+
+@case("energy_dataset", "generators")
+def bench_energy_dataset(quick):
+    from utils.generate_energy_dataset import generate_energy_data
+    rows = 1000 if quick else 9000
+    random.seed(42)
+    res = measure(lambda: generate_energy_data(num_rows=rows), repeat=3, min_time=0)
+    res["rows"] = rows
+    return res
+
+
+@case("hourly_bill_168", "billing")
+def bench_hourly_bill(quick):
+    from utils.billing import Tariff, hourly_bill
+    df = pd.read_csv(FORECAST_CSV)
+    return measure(lambda: hourly_bill(df, Tariff()))
+
+
+@case("compute_bills_fleet", "billing")
+def bench_compute_bills(quick):
+    from utils.billing import Tariff, compute_bills
+    homes, hours = (100, 720) if quick else (1000, 8760)
+    rng = np.random.default_rng(42)
+    cons = rng.uniform(0.3, 3.0, (homes, hours)).astype("float32")
+    gen = rng.uniform(0.0, 2.0, (homes, hours)).astype("float32")
+    tariffs = [Tariff(), Tariff(tou_rates=[0.1] * 7 + [0.2] * 12 + [0.1] * 5), Tariff(tiers=[(600, 0.05)])]
+    res = measure(lambda: compute_bills(cons, gen, tariffs), repeat=3, min_time=0)
+    res.update(homes=homes, hours=hours, tariffs=len(tariffs))
+    return res
+
+
+# ---------- macro benchmarks ----------
+
+@case("order_book", "macro")
+def bench_order_book(quick):
+    from benchmarks import order_book_benchmark
+    return order_book_benchmark.run(20000 if quick else 200000)
+
+
+@case("auction_recovery", "macro")
+def bench_auction_recovery(quick):
+    from benchmarks import auction_recovery_benchmark
+    res = auction_recovery_benchmark.run(50000 if quick else 1000000)
+    res["seconds"] = res["replay_seconds"]
+    return res
+
+
+@case("community_market", "macro")
+def bench_community_market(quick):
+    from benchmarks import community_market_benchmark
+    return community_market_benchmark.run(100, 720, 9) if quick else community_market_benchmark.run()
+
+
+def _format_seconds(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:10.2f} us"
+    return f"{seconds * 1e3:10.2f} ms"
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"],
+                                        cwd=REPO_ROOT, text=True).strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def select(only=None):
+    """:param only: Comma separated case names or groups (None = all)."""
+    if not only:
+        return list(CASES)
+    wanted = set(only.split(","))
+    names = [name for name, (group, _) in CASES.items() if name in wanted or group in wanted]
+    unknown = wanted - set(CASES) - {group for group, _ in CASES.values()}
+    if unknown:
+        raise ValueError(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+    return names
+
+
+def run_cases(names=None, quick=False):
+    """
+    :return: Dict case name -> result dict; skipped cases have a ``skipped`` reason instead of timings.
+    """
+    results = {}
+    for name in names or list(CASES):
+        group, func = CASES[name]
+        try:
+            # The agents log to stdout (e.g. every ended auction); keep that out of the timings
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                res = func(quick)
+        except ImportError as e:
+            res = {"skipped": f"missing dependency: {e.name or e}"}
+        except OSError as e:
+            res = {"skipped": str(e)}
+        res["group"] = group
+        results[name] = res
+        if "skipped" in res:
+            print(f"[Benchmark] {name:32s} skipped ({res['skipped']})")
+        else:
+            print(f"[Benchmark] {name:32s} {_format_seconds(res['seconds'])}")
+    return results
+
+
+def run(names=None, quick=False):
+    """
+    Run the selected cases.
+    :return: Report dict with the commit, the environment and ``results`` (see run_cases).
+    """
+    results = run_cases(names, quick)
+    return {
+        "git_commit": git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "quick": quick,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold=0.15):
+    """
+    Compare the best time per case of two reports.
+    :param threshold: Relative change counted as a regression / improvement (0.15 = 15%).
+    :return: List of dicts with case, baseline and current seconds, ratio and status
+             (regression, improved, unchanged, new, missing or skipped).
+    """
+    base, cur = baseline["results"], current["results"]
+    rows = []
+    for name in list(base) + [n for n in cur if n not in base]:
+        b, c = base.get(name), cur.get(name)
+        row = {"case": name, "baseline": None, "current": None, "ratio": None}
+        if c is None:
+            row["status"] = "missing"
+        elif b is None:
+            row["status"] = "new"
+        elif "skipped" in b or "skipped" in c:
+            row["status"] = "skipped"
+        else:
+            row.update(baseline=b["seconds"], current=c["seconds"], ratio=c["seconds"] / b["seconds"])
+            if row["ratio"] > 1 + threshold:
+                row["status"] = "regression"
+            elif row["ratio"] < 1 - threshold:
+                row["status"] = "improved"
+            else:
+                row["status"] = "unchanged"
+        rows.append(row)
+    return rows
+
+
+def print_comparison(rows, baseline, current):
+    print(f"[Benchmark] {baseline.get('git_commit')} -> {current.get('git_commit')}")
+    for row in rows:
+        if row["ratio"] is None:
+            print(f"  {row['case']:32s} {row['status']}")
+        else:
+            print(f"  {row['case']:32s} {_format_seconds(row['baseline'])} -> {_format_seconds(row['current'])} "
+                  f"x{row['ratio']:.2f} {row['status']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and compare results between commits.")
+    parser.add_argument("--only", help="Comma separated case names or groups: " +
+                        ", ".join(sorted({group for group, _ in CASES.values()})))
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes and fewer runs (smoke test)")
+    parser.add_argument("-o", "--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", nargs="+", metavar="REPORT",
+                        help="Baseline report to compare this run against, or two reports to compare without running")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Relative slowdown counted as a regression")
+    parser.add_argument("--list", action="store_true", help="List the cases and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, (group, _) in CASES.items():
+            print(f"{group:12s} {name}")
+        return 0
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes one or two reports")
+
+    reports = []
+    for path in args.compare or []:
+        with open(path, encoding="utf-8") as f:
+            reports.append(json.load(f))
+    if len(reports) == 2:
+        baseline, current = reports
+    else:
+        current = run(select(args.only), args.quick)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(current, f, indent=2)
+            print(f"[Benchmark] Results written to {args.output}")
+        if not reports:
+            return 0
+        baseline = reports[0]
+
+    rows = compare(baseline, current, args.threshold)
+    print_comparison(rows, baseline, current)
+    return 1 if any(row["status"] == "regression" for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
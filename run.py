@@ -1,13 +1,25 @@
 # run.py
 from multiprocessing import Process, Queue
+import asyncio
+import os
 from agents.data_collection_agent import DataCollectionAgent
 from agents.prediction_agent import run_prediction_agent
 import runpy
 from utils.data_loader import json_to_dataframe, dataframe_to_json
-from agents.p2p_trading_agent.app import run_p2p_agent_app
+from utils.billing import BillAccumulator
+from utils import tracing
+from agents.p2p_trading_agent.app import run_p2p_agent_app, manager as p2p_manager
+from agents.energy_manage_agent.battery import BatteryDispatchOptimizer, SurplusAuctions, delivery_days, surplus_offers
 from agents.energy_manage_agent.app import run_ems_app
+from agents.forecast_service.app import run_forecast_app
 import threading
 
+# 在 P2P 市场上出售余电时使用的卖家 id
+SELLER_ID = os.environ.get("P2P_SELLER_ID", "home")
+# 天气预报 (触发预测) 和电表读数 (更新账单) 的 MQTT 主题
+WEATHER_TOPIC = os.environ.get("MQTT_WEATHER_TOPIC", "energy_data")
+METER_TOPIC = os.environ.get("MQTT_METER_TOPIC", "meter_readings")
+
 
 def execute_file(filepath):
     """
@@ -31,21 +43,41 @@ def main():
     data_agent = DataCollectionAgent(
         broker_host="localhost",
         broker_port=1883,
-        topic="energy_data",
+        topic=[WEATHER_TOPIC, METER_TOPIC],
         data_queue=data_queue
     )
+    # Home battery plan; the surplus it still exports is offered on the P2P market
+    battery = BatteryDispatchOptimizer()
+    # One auction per delivery day, updated as new forecasts arrive
+    surplus_auctions = SurplusAuctions(p2p_manager, SELLER_ID)
+
+    # Running per-home bill, updated from meter readings on the ingestion path
+    bill_accumulator = BillAccumulator(checkpoint_path="./static/bill_checkpoint.json")
 
 
     
     # Define process wrappers
     def data_collection_process():
-        data_agent.add_listener(prediction_process)
-        data_agent.run()
+        # 预测是 CPU 密集型: asyncio 模式下在线程池中运行
+        data_agent.add_listener(prediction_process, blocking=True, topics=WEATHER_TOPIC)
+        data_agent.add_listener(bill_accumulator.on_reading, topics=METER_TOPIC)
+        if os.environ.get("MQTT_ASYNC") == "1":
+            asyncio.run(data_agent.run_async())
+        else:
+            data_agent.run()
 
     def prediction_process(json_weather_data):
-        weather_df = json_to_dataframe(json_weather_data)
-        df_7days = run_prediction_agent(weather_df)
-        prediction_queue.put(dataframe_to_json(df_7days))
+        with tracing.span("json_to_dataframe"):
+            weather_df = json_to_dataframe(json_weather_data)
+        with tracing.span("predict_7days", hours=len(weather_df)):
+            df_7days = run_prediction_agent(weather_df)
+        with tracing.span("dataframe_to_json"):
+            prediction_queue.put(dataframe_to_json(df_7days))
+
+        with tracing.span("battery.dispatch"):
+            plan = battery.dispatch(df_7days)
+        offers = surplus_offers(plan, price=battery.tariff.feed_in_rate or None)
+        surplus_auctions.post(offers, days=delivery_days(plan).unique())
 
     
     def ems_process():
@@ -56,9 +88,17 @@ def main():
         flask_thread = threading.Thread(target=run_p2p_agent_app)
         flask_thread.start()
 
+    def forecast_service_process():
+        flask_thread = threading.Thread(target=run_forecast_app)
+        flask_thread.start()
+
+    # kill -USR1 / -USR2 <pid> toggles pipeline tracing / profiling at runtime
+    tracing.install_signal_handlers()
+
     # Start processes
     ems_process()
     p2ptrading_process()
+    forecast_service_process()
     data_collection_process()
 
     # Optionally join them or keep them as daemons
@@ -0,0 +1,173 @@
+import os
+import time
+from agents.p2p_trading_agent.auction import AuctionManager, AuctionArchive
+
+
+def test_check_all_auctions_only_ends_expired_auctions():
+    manager = AuctionManager()
+    short_id = manager.create_auction("seller", 5, total_duration=10)
+    long_id = manager.create_auction("seller", 5, total_duration=100)
+    now = time.time()
+
+    assert manager.check_all_auctions(now + 5) == []
+    ended = manager.check_all_auctions(now + 11)
+    assert [auc.auction_id for auc in ended] == [short_id]
+    assert not manager.get_auction(long_id).auction_ended
+    assert manager.next_deadline() == manager.get_auction(long_id).end_time()
+
+
+def test_bids_reschedule_deadline_and_wake_monitor():
+    manager = AuctionManager()
+    aid = manager.create_auction("seller", 5, total_duration=100, extension_duration=20)
+    auc = manager.get_auction(aid)
+    manager.wakeup.clear()
+
+    assert auc.place_bid("buyer", 0.5)["status"] == "success"
+    # First bid moves the end forward to last bid + extension
+    assert manager.next_deadline() == auc.last_bid_time + 20
+    assert manager.wakeup.is_set()
+
+    auc.last_bid_time -= 15
+    auc.place_bid("buyer2", 0.6)
+    bid_deadline = auc.last_bid_time + 20
+    assert manager.check_all_auctions(bid_deadline - 1) == []
+    assert manager.check_all_auctions(bid_deadline + 0.01) == [auc]
+    assert auc.get_status()["winner"] == "buyer2"
+
+
+def test_canceled_auction_leaves_the_heap():
+    manager = AuctionManager()
+    aid = manager.create_auction("seller", 5, total_duration=10)
+    manager.cancel_auction(aid, "seller")
+
+    assert manager.next_deadline() is None
+    assert manager.check_all_auctions(time.time() + 20) == []
+
+
+def test_list_broadcaster_sends_only_changed_auctions_per_filter():
+    from agents.p2p_trading_agent.list_broadcast import AuctionListBroadcaster
+
+    manager = AuctionManager()
+    aid = manager.create_auction("alice", 5, total_duration=100)
+    sent = []
+    broadcaster = AuctionListBroadcaster(manager, lambda event, data, room: sent.append((room, data)))
+
+    room_all, _, snapshot = broadcaster.subscribe("sid1", {})
+    room_cheap, _, _ = broadcaster.subscribe("sid2", {"max_price": 0.5})
+    assert [a["auction_id"] for a in snapshot["auctions"]] == [aid]
+    assert broadcaster.broadcast() == 0
+
+    manager.get_auction(aid).place_bid("bob", 0.8)
+    assert broadcaster.broadcast() == 2
+    deltas = dict(sent)
+    assert [a["highest_bid"] for a in deltas[room_all]["auctions"]] == [0.8]
+    # The bid pushed the auction out of the cheap filter
+    assert deltas[room_cheap]["auctions"] == [] and deltas[room_cheap]["removed"] == [aid]
+
+    # Reconnecting with a known version only returns later changes
+    version = manager.version
+    other = manager.create_auction("carol", 2, total_duration=100)
+    _, old_room, payload = broadcaster.subscribe("sid1", {"since": version, "epoch": manager.epoch})
+    assert old_room is None
+    assert [a["auction_id"] for a in payload["auctions"]] == [other]
+
+
+def test_query_auctions_uses_indexes_and_paginates():
+    manager = AuctionManager()
+    ids = [manager.create_auction("alice" if i % 2 else "bob", 1, total_duration=100 - i) for i in range(6)]
+    manager.cancel_auction(ids[1], "alice")
+
+    by_end = manager.query_auctions(status="ongoing", sort="end_time", offset=1, limit=2)
+    assert by_end["total"] == 5
+    assert [a["auction_id"] for a in by_end["auctions"]] == [ids[4], ids[3]]
+    alice = manager.query_auctions(seller="alice")
+    assert [a["auction_id"] for a in alice["auctions"]] == [ids[1], ids[3], ids[5]]
+    assert [a["auction_id"] for a in manager.query_auctions(status="ended")["auctions"]] == [ids[1]]
+
+
+def test_ended_auctions_move_to_archive(tmp_path):
+    path = str(tmp_path / "archive.jsonl")
+    manager = AuctionManager(archive=AuctionArchive(path, cache_size=1), archive_after=60)
+    old = manager.create_auction("alice", 5, total_duration=10)
+    live = manager.create_auction("alice", 3, total_duration=1000)
+    now = time.time()
+    manager.check_all_auctions(now + 11)
+
+    assert manager.archive_ended(now + 30) == 0
+    assert manager.archive_ended(now + 72) == 1
+    assert old not in manager.auctions and manager.changed_since(manager.version - 1) == [old]
+    assert manager.get_auction_status(old)["winner"] == "Grid"
+    assert [a["auction_id"] for a in manager.list_seller_auctions("alice")] == [old, live]
+
+    # The archive index is rebuilt from the file after a restart
+    manager.archive.close()
+    reopened = AuctionArchive(path)
+    assert reopened.count("alice") == 1 and reopened.get(old)["seller"] == "alice"
+    reopened.close()
+
+
+def test_write_ahead_log_restores_auctions(tmp_path):
+    from utils.event_log import EventLog
+
+    def open_manager():
+        manager = AuctionManager(archive_after=60)
+        log = EventLog(str(tmp_path / "wal"), fsync=False)
+        log.recover(manager.apply_event, manager.load_state)
+        manager.restore_indexes()
+        manager.event_log = log
+        return manager, log
+
+    manager, log = open_manager()
+    bid_on = manager.create_auction("alice", 5, total_duration=1000)
+    canceled = manager.create_auction("alice", 2, total_duration=1000)
+    expired = manager.create_auction("bob", 1, total_duration=10)
+    manager.get_auction(bid_on).place_bid("carol", 0.4)
+    manager.cancel_auction(canceled, "alice")
+    seq, state = manager.export_state()
+    # The snapshot only covers events already on disk
+    assert seq == log.flushed_seq == log.last_seq
+    log.write_snapshot(seq, state)
+    # Events after the snapshot are replayed from the log tail
+    manager.get_auction(bid_on).place_bid("dave", 0.5)
+    now = time.time()
+    manager.check_all_auctions(now + 11)
+    manager.archive_ended(now + 100)
+    expected = {aid: manager.get_auction_status(aid) for aid in (bid_on, canceled, expired)}
+    log.close()
+
+    restored, log = open_manager()
+    for aid, status in expected.items():
+        got = restored.get_auction_status(aid)
+        for key in ("highest_bid", "highest_bidder", "status", "end_time"):
+            assert got[key] == status[key]
+    assert set(restored.auctions) == {bid_on}
+    assert restored.next_deadline() == restored.get_auction(bid_on).end_time()
+    log.close()
+
+
+def test_archive_rotates_segments_and_forgets_the_oldest(tmp_path):
+    path = str(tmp_path / "archive.jsonl")
+    archive = AuctionArchive(path, cache_size=2, segment_size=3, max_segments=2)
+    for i in range(8):
+        archive.add({"auction_id": f"a{i}", "winner": "Grid"}, "alice" if i % 2 else "bob")
+
+    # Segments of 3 results: a0-a2 (deleted), a3-a5, a6-a7
+    assert sorted(os.listdir(tmp_path)) == ["archive.1.jsonl", "archive.2.jsonl"]
+    assert archive.count() == 5 and "a2" not in archive and archive.get("a0") is None
+    assert archive.count("alice") == 3 and archive.count("bob") == 2
+    assert [st["auction_id"] for st in archive.page()] == ["a3", "a4", "a5", "a6", "a7"]
+    assert len(archive.offsets) == 5 and sum(map(len, archive.segments.values())) == 5
+
+    # Re-archiving an id keeps it when its first segment expires
+    archive.add({"auction_id": "a4", "winner": "carol"}, "bob")
+    archive.add({"auction_id": "a9", "winner": "Grid"}, "bob")
+    assert sorted(os.listdir(tmp_path)) == ["archive.2.jsonl", "archive.3.jsonl"]
+    assert archive.get("a4")["winner"] == "carol" and "a3" not in archive
+    archive.close()
+
+    reopened = AuctionArchive(path, segment_size=3, max_segments=2)
+    assert [st["auction_id"] for st in reopened.page()] == ["a6", "a7", "a4", "a9"]
+    assert reopened.get("a4")["winner"] == "carol"
+    reopened.add({"auction_id": "a10"}, "bob")
+    assert reopened.segment == 3 and reopened.segment_count == 2
+    reopened.close()
@@ -0,0 +1,73 @@
+import threading
+import time
+
+from agents.p2p_trading_agent.auth import AuthCache, PasswordHasher, UserManager
+from agents.p2p_trading_agent.bus import LocalBus
+from agents.p2p_trading_agent.cluster import ShardRouter
+
+
+def test_auth_cache_remembers_successful_logins_until_expiry():
+    cache = AuthCache("secret", ttl=10, max_entries=2)
+    assert not cache.check("alice", "pw", "hash1", now=0)
+    cache.add("alice", "pw", "hash1", now=0)
+
+    assert cache.check("alice", "pw", "hash1", now=5)
+    assert not cache.check("alice", "wrong", "hash1", now=5)
+    # A new password hash never matches old entries
+    assert not cache.check("alice", "pw", "hash2", now=5)
+    assert not cache.check("alice", "pw", "hash1", now=11)
+    assert b"pw" not in b"".join(cache.entries)
+
+    for user in ("a", "b", "c"):
+        cache.add(user, "pw", "h", now=20)
+    assert len(cache.entries) == 2 and not cache.check("a", "pw", "h", now=20)
+
+
+def test_password_hasher_runs_through_executor():
+    calls = []
+
+    def executor(func, *args):
+        calls.append(func.__name__)
+        return func(*args)
+
+    hasher = PasswordHasher(max_concurrency=1, executor=executor)
+    pwhash = hasher.hash("secret")
+    assert hasher.verify(pwhash, "secret") and not hasher.verify(pwhash, "nope")
+    assert calls == ["generate_password_hash", "check_password_hash", "check_password_hash"]
+
+
+def test_concurrent_registrations_of_one_name_are_decided_by_its_owner():
+    bus = LocalBus()
+    both_hashing = threading.Barrier(2)
+
+    class SlowHasher:
+        def hash(self, password):
+            # Both workers pass their local "name taken?" check before either finishes
+            both_hashing.wait(5)
+            return "hash:" + password
+
+    managers = []
+    for i in range(2):
+        router = ShardRouter(bus, i, 2, timeout=2)
+        users = UserManager(hasher=SlowHasher())
+        router.handle("claim_user", lambda p, users=users: users.claim(*p))
+        router.handle("add_user", lambda p, users=users: users.add_hashed(*p))
+        users.owner_call = lambda name, pwhash, router=router: router.call(
+            router.owner_of(name), "claim_user", [name, pwhash])
+        users.listener = lambda name, pwhash, router=router: router.broadcast("add_user", [name, pwhash])
+        managers.append(users)
+
+    results = [None, None]
+    threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, managers[i].add_user("bob", f"pw{i}")))
+               for i in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(results) == [False, True]
+    winner = "hash:pw%d" % results.index(True)
+    deadline = time.time() + 2
+    while time.time() < deadline and not all("bob" in m.users for m in managers):
+        time.sleep(0.01)
+    assert [m.users["bob"]["password"] for m in managers] == [winner, winner]
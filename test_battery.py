@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from agents.energy_manage_agent.battery import BatteryDispatchOptimizer, SurplusAuctions, surplus_offers
+from agents.p2p_trading_agent.auction import AuctionManager
+from utils.billing import Tariff
+
+# 0.1/kWh at midnight, 1.0/kWh for the rest of the day
+TARIFF = Tariff(tou_rates=[0.1] + [1.0] * 23)
+
+
+def forecast(consumption, generation, start="2025-01-06 00:00"):
+    return pd.DataFrame({
+        "time": pd.date_range(start, periods=len(consumption), freq="h").strftime("%Y-%m-%d %H:%M"),
+        "consumption_pred": consumption,
+        "generation_pred": generation,
+    })
+
+
+def test_dispatch_respects_soc_power_and_efficiency_limits():
+    # 1 kWh levels from 2 kWh (min_soc) to 10 kWh; charge cheaply at 00:00, cover the 4 kWh at 01:00
+    battery = BatteryDispatchOptimizer(capacity_kWh=10.0, max_charge_kW=3.0, max_discharge_kW=5.0,
+                                       charge_efficiency=1.0, discharge_efficiency=0.5, min_soc=0.2,
+                                       initial_soc=0.2, n_levels=9, tariff=TARIFF)
+    plan = battery.dispatch(forecast([0.0, 4.0], [0.0, 0.0]))
+
+    # Charging is capped at 3 kWh; the stored 3 kWh deliver 1.5 kWh at 50% efficiency
+    np.testing.assert_allclose(plan["charge_kWh"], [3.0, 0.0])
+    np.testing.assert_allclose(plan["discharge_kWh"], [0.0, 1.5])
+    np.testing.assert_allclose(plan["soc_kWh"], [5.0, 2.0])
+    np.testing.assert_allclose(plan["grid_import_kWh"], [3.0, 2.5])
+    np.testing.assert_allclose(plan["grid_export_kWh"], [0.0, 0.0])
+
+    # With 1 kW of discharge only 2 kWh of charge can be used (delivering 1 kWh)
+    battery.max_discharge_kW = 1.0
+    result = battery.optimize([[0.0, 4.0]], [[0.0, 0.0]])
+    np.testing.assert_allclose(result["soc"][0], [2.0, 4.0, 2.0])
+    np.testing.assert_allclose(result["discharge"][0], [0.0, 1.0])
+    assert result["cost"][0] == pytest.approx(2 * 0.1 + 3 * 1.0)
+    assert result["baseline_cost"][0] == pytest.approx(4.0)
+
+
+def test_batched_optimize_matches_per_home_dispatch():
+    rng = np.random.default_rng(0)
+    tariff = Tariff(tou_rates=[0.1] * 7 + [0.35] * 15 + [0.1] * 2, feed_in_rate=0.05)
+    homes = [forecast(rng.uniform(0.2, 2.0, 48), rng.uniform(0.0, 3.0, 48)) for _ in range(3)]
+    capacity = np.array([5.0, 10.0, 13.5])
+    max_kw = np.array([2.0, 5.0, 3.0])
+
+    batched = BatteryDispatchOptimizer(capacity_kWh=capacity, max_charge_kW=max_kw, max_discharge_kW=max_kw,
+                                       tariff=tariff)
+    times = pd.to_datetime(homes[0]["time"])
+    result = batched.optimize(np.stack([h["consumption_pred"] for h in homes]),
+                              np.stack([h["generation_pred"] for h in homes]),
+                              times.dt.hour.to_numpy(), times.dt.weekday.to_numpy())
+
+    for i, df in enumerate(homes):
+        plan = BatteryDispatchOptimizer(capacity_kWh=capacity[i], max_charge_kW=max_kw[i],
+                                        max_discharge_kW=max_kw[i], tariff=tariff).dispatch(df)
+        np.testing.assert_allclose(plan["soc_kWh"], result["soc"][i, 1:])
+        np.testing.assert_allclose(plan["grid_import_kWh"], result["grid_import"][i])
+        np.testing.assert_allclose(plan["grid_export_kWh"], result["grid_export"][i])
+        assert (plan["charge_kWh"] <= max_kw[i] + 1e-9).all() and (plan["discharge_kWh"] <= max_kw[i] + 1e-9).all()
+        assert plan["soc_kWh"].min() >= 0.1 * capacity[i] - 1e-9 and plan["soc_kWh"].max() <= capacity[i] + 1e-9
+    assert (result["cost"] <= result["baseline_cost"] + 1e-9).all()
+
+
+def test_surplus_offers_per_day():
+    plan = forecast(np.zeros(48), np.zeros(48))
+    plan["grid_export_kWh"] = np.r_[np.full(24, 0.1), np.full(24, 0.02)]
+    assert surplus_offers(plan) == [{"date": "2025-01-06", "quantity": 2.4}]
+    assert surplus_offers(plan, min_quantity=0.1, price=0.05) == [
+        {"date": "2025-01-06", "quantity": 2.4, "start_price": 0.05, "grid_price": 0.05},
+        {"date": "2025-01-07", "quantity": 0.48, "start_price": 0.05, "grid_price": 0.05},
+    ]
+
+
+def test_surplus_auctions_one_live_auction_per_day():
+    manager = AuctionManager()
+    auctions = SurplusAuctions(manager, "home-7")
+    days = ["2025-01-06", "2025-01-07", "2025-01-08"]
+    offers = [{"date": "2025-01-06", "quantity": 2.0}, {"date": "2025-01-07", "quantity": 3.0}]
+
+    first = auctions.post(offers, days)
+    assert len(first) == 2
+    # The same forecast again creates nothing
+    assert auctions.post(offers, days) == []
+    assert len(manager.ongoing) == 2
+
+    # Day 1 gets a bid; day 2's offer changes; day 3 now has surplus
+    manager.get_auction(first[0]).place_bid("buyer", 0.2)
+    changed = [{"date": "2025-01-06", "quantity": 2.5}, {"date": "2025-01-07", "quantity": 1.5},
+               {"date": "2025-01-08", "quantity": 1.0}]
+    created = auctions.post(changed, days)
+    assert len(created) == 2
+    assert manager.get_auction(first[1]).canceled
+    assert not manager.get_auction(first[0]).auction_ended
+    assert [manager.get_auction(a).quantity for a in created] == [1.5, 1.0]
+    assert all(manager.auction_seller_map[a] == "home-7" for a in first + created)
+
+    # Day 3's surplus disappears: its auction is withdrawn; earlier days are forgotten
+    assert auctions.post(changed[1:2], ["2025-01-07", "2025-01-08"]) == []
+    assert manager.get_auction(created[1]).canceled
+    assert set(auctions.posted) == {("home-7", "2025-01-07")}
+    assert len(manager.ongoing) == 2
@@ -0,0 +1,75 @@
+import warnings
+import pytest
+from agents.energy_manage_agent.agent import BehavioralSegmentationAgent
+
+
+def make_usage(scale):
+    # Three well separated groups of appliances: heavy, moderate, rarely used
+    return [
+        {"appliance": "Heater", "usage": 300 * scale, "usage_count": 30},
+        {"appliance": "Air Conditioner", "usage": 290 * scale, "usage_count": 28},
+        {"appliance": "Oven", "usage": 120 * scale, "usage_count": 12},
+        {"appliance": "Washing Machine", "usage": 110 * scale, "usage_count": 11},
+        {"appliance": "Dishwasher", "usage": 5 * scale, "usage_count": 1},
+        {"appliance": "Refrigerator", "usage": 3 * scale, "usage_count": 0},
+    ]
+
+
+def test_prioritize_batch_matches_single_home_kmeans():
+    home_data = {f"home-{i}": make_usage(1 + i / 10) for i in range(5)}
+    agent = BehavioralSegmentationAgent()
+
+    batch = agent.prioritize_batch(home_data)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for home_id, records in home_data.items():
+            single = BehavioralSegmentationAgent()
+            single.update_data(records)
+            single.prioritize_appliances()
+            assert batch[home_id] == single.get_priorities()
+    assert batch["home-0"]["Heater"] == "High"
+    assert batch["home-0"]["Refrigerator"] == "Low"
+
+
+def test_prioritize_batch_handles_ragged_and_identical_homes():
+    home_data = {
+        "small": make_usage(1)[:2],
+        "idle": [{"appliance": name, "usage": 0, "usage_count": 0} for name in ("Oven", "Heater", "Dishwasher")],
+    }
+    batch = BehavioralSegmentationAgent().prioritize_batch(home_data, n_jobs=2, chunk_size=1)
+
+    assert set(batch["small"]) == {"Heater", "Air Conditioner"}
+    assert set(batch["idle"].values()) == {"High"}
+
+
+def test_homes_with_fewer_than_three_appliances():
+    from agents.energy_manage_agent import app as ems
+
+    for records in (make_usage(1)[:1], make_usage(1)[2:4]):
+        single = BehavioralSegmentationAgent()
+        single.update_data(records)
+        single.prioritize_appliances()
+        assert single.get_priorities() == BehavioralSegmentationAgent().prioritize_batch({"h": records})["h"]
+
+    client = ems.app.test_client()
+    client.post("/register-home", json={"home_id": "two-appliances", "appliances": ["Oven", "Heater"]})
+    client.post("/start", json={"home_id": "two-appliances", "appliance": "Oven"})
+    res = client.get("/get-priority?home_id=two-appliances")
+    assert res.status_code == 200
+    assert {p["appliance"] for p in res.get_json()} == {"Oven", "Heater"}
+
+
+def test_recompute_priorities_validates_n_jobs(monkeypatch):
+    from agents.energy_manage_agent import app as ems
+
+    used = []
+    monkeypatch.setattr(BehavioralSegmentationAgent, "prioritize_batch",
+                        lambda self, home_data, n_jobs=1: used.append(n_jobs) or {})
+    monkeypatch.setattr(ems.os, "cpu_count", lambda: 4)
+    client = ems.app.test_client()
+
+    assert client.post("/recompute-priorities?n_jobs=many").status_code == 400
+    for requested in ("1000", "0", "-3", "2"):
+        assert client.post(f"/recompute-priorities?n_jobs={requested}").status_code == 200
+    assert used == [4, 1, 1, 2]
@@ -0,0 +1,86 @@
+from agents.p2p_trading_agent.auction import AuctionManager
+from agents.p2p_trading_agent.bidding import BidProcessor, RateLimiter
+
+
+def test_batch_applies_bids_in_order_and_broadcasts_once():
+    manager = AuctionManager()
+    aid = manager.create_auction("seller", 5, total_duration=100)
+    replies, broadcasts = [], []
+    processor = BidProcessor(manager, lambda client, res: replies.append((client, res["status"])),
+                             lambda auc: broadcasts.append(auc.highest_bid))
+
+    for client, price in [("a", 0.2), ("b", 0.5), ("c", 0.4), ("d", 0.6)]:
+        assert processor.submit(client, client, aid, price) is None
+    assert replies == []
+
+    assert processor.drain(aid) is False
+    assert replies == [("a", "success"), ("b", "success"), ("c", "fail"), ("d", "success")]
+    assert broadcasts == [0.6]
+    assert manager.get_auction(aid).highest_bidder == "d"
+    assert aid not in processor.queues
+
+
+def test_rate_limiter_rejects_bursts_per_user():
+    limiter = RateLimiter(rate=2.0, burst=3)
+    assert [limiter.allow("alice", now=0.0) for _ in range(4)] == [True, True, True, False]
+    assert limiter.allow("bob", now=0.0)
+    # Two tokens per second refill
+    assert limiter.allow("alice", now=0.5)
+    assert not limiter.allow("alice", now=0.5)
+
+    manager = AuctionManager()
+    aid = manager.create_auction("seller", 5)
+    replies = []
+    processor = BidProcessor(manager, lambda client, res: replies.append(res["status"]), lambda auc: None,
+                             rate_limiter=RateLimiter(rate=1.0, burst=1))
+    processor.submit("c1", "alice", aid, 0.1)
+    assert processor.submit("c1", "alice", aid, 0.2)["status"] == "fail"
+    assert processor.stats["rate_limited"] == 1
+
+
+def test_failing_listener_fails_the_batch_and_releases_the_queue():
+    manager = AuctionManager()
+    aid = manager.create_auction("seller", 5, total_duration=100)
+    auc = manager.get_auction(aid)
+    replies, spawned = [], []
+    processor = BidProcessor(manager, lambda client, res: replies.append((client, res["status"], res["msg"])),
+                             lambda auc: None, spawn=lambda func, auction_id: spawned.append(auction_id),
+                             batch_window=0)
+
+    def broken_listener(auction):
+        raise RuntimeError("listener down")
+
+    auc.bid_listener = broken_listener
+    processor.submit("a", "a", aid, 0.2)
+    processor.submit("b", "b", aid, 0.3)
+    assert spawned == [aid]
+    processor._owner(aid)
+    assert [r[:2] for r in replies] == [("a", "fail"), ("b", "fail")]
+    assert replies[0][2] == "Bid could not be processed"
+    assert aid not in processor.queues
+
+    # The auction takes bids again once the listener recovers
+    auc.bid_listener = None
+    replies.clear()
+    processor.submit("c", "c", aid, 0.5)
+    assert spawned == [aid, aid]
+    processor._owner(aid)
+    assert replies == [("c", "success", "New highest bid=0.5 by c")]
+
+
+def test_dead_owner_hands_its_queue_to_a_new_owner():
+    manager = AuctionManager()
+    aid = manager.create_auction("seller", 5, total_duration=100)
+    spawned = []
+    processor = BidProcessor(manager, lambda client, res: None, lambda auc: None,
+                             spawn=lambda func, auction_id: spawned.append(auction_id), batch_window=0.01)
+
+    def interrupted(seconds):
+        raise RuntimeError("sleep interrupted")
+
+    processor.sleep = interrupted
+    processor.submit("a", "a", aid, 0.2)
+    processor._owner(aid)
+    # The bid is still queued and a new owner was started for it
+    assert spawned == [aid, aid]
+    assert len(processor.queues[aid]) == 1
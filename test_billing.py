@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from utils.billing import BillAccumulator, Tariff, compute_bills, hourly_bill
+
+
+def test_flat_tariff_matches_hourly_formula():
+    cons = np.array([1.0, 2.0, 0.5, 0.0])
+    gen = np.array([0.0, 0.5, 1.5, 0.0])
+    bills = compute_bills(cons, gen, Tariff(rate=0.2, feed_in_rate=0.05))
+
+    assert bills["original_cost"][0] == pytest.approx(3.5 * 0.2)
+    assert bills["new_cost"][0] == pytest.approx(2.5 * 0.2)
+    assert bills["feed_in_credit"][0] == pytest.approx(1.0 * 0.05)
+    assert bills["net_cost"][0] == pytest.approx(2.5 * 0.2 - 0.05)
+
+
+def test_time_of_use_and_scenarios_shape():
+    tou = [0.1] * 12 + [0.3] * 12
+    cons = np.ones((3, 48))
+    gen = np.zeros((3, 48))
+    bills = compute_bills(cons, gen, [Tariff(rate=0.1), Tariff(tou_rates=tou)])
+
+    assert bills["original_cost"].shape == (2, 3)
+    assert bills["original_cost"][0] == pytest.approx([4.8] * 3)
+    assert bills["original_cost"][1] == pytest.approx([9.6] * 3)
+
+
+def test_tier_surcharge_resets_per_period_and_matches_hourly():
+    tariff = Tariff(rate=0.1, tiers=[(10, 0.05)], period_hours=24)
+    times = pd.date_range("2025-01-01", periods=48, freq="h")
+    df = pd.DataFrame({"time": times.strftime("%Y-%m-%d %H:%M"),
+                       "consumption_pred": 1.0, "generation_pred": 0.0})
+
+    total = compute_bills(df["consumption_pred"], df["generation_pred"], tariff)
+    hourly = hourly_bill(df, tariff)
+
+    # 14 kWh above the threshold in each of the two periods
+    expected = 48 * 0.1 + 2 * 14 * 0.05
+    assert total["original_cost"][0] == pytest.approx(expected)
+    assert hourly["original_cumulative_cost"].iloc[-1] == pytest.approx(expected)
+
+
+def test_bill_accumulator_matches_batch_bill(tmp_path):
+    tariff = Tariff(tou_rates=[0.1] * 12 + [0.3] * 12, tiers=[(5, 0.05)], feed_in_rate=0.04)
+    times = pd.date_range("2025-01-06", periods=24, freq="h")
+    cons = np.linspace(0.2, 1.0, 24)
+    gen = np.linspace(1.0, 0.0, 24)
+
+    acc = BillAccumulator(tariff, checkpoint_path=str(tmp_path / "bill.json"), checkpoint_every=10,
+                          period_anchor=datetime(2025, 1, 6))
+    acc.on_reading([
+        {"home_id": "h1", "time": t.isoformat(), "consumption_kWh": c, "generation_kWh": g}
+        for t, c, g in zip(times, cons, gen)
+    ])
+    acc.on_reading({"time": "2025-01-06 00:00", "day_of_week": 0, "weather": "Night"})
+
+    batch = compute_bills(cons, gen, tariff, times.hour, times.weekday, dtype="float64")
+    so_far = acc.cost_so_far("h1")
+    assert so_far["readings"] == 24
+    assert so_far["original_cost"] == pytest.approx(batch["original_cost"][0])
+    assert so_far["net_cost"] == pytest.approx(batch["net_cost"][0])
+
+    acc.checkpoint()
+    restored = BillAccumulator(tariff, checkpoint_path=str(tmp_path / "bill.json"),
+                               period_anchor=datetime(2025, 1, 6))
+    assert restored.cost_so_far("h1") == so_far
+    acc.close()
+    restored.close()
+
+
+def test_bill_accumulator_concurrent_checkpoints(tmp_path):
+    path = str(tmp_path / "bill.json")
+    acc = BillAccumulator(Tariff(), checkpoint_path=path, checkpoint_every=1)
+    start = datetime(2025, 1, 6)
+
+    def feed(home):
+        for h in range(50):
+            acc.add_reading(home, start + timedelta(hours=h), 0.5)
+
+    threads = [threading.Thread(target=feed, args=(f"h{i}",)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    acc.checkpoint()
+    assert not os.path.exists(path + ".tmp")
+    restored = BillAccumulator(Tariff(), checkpoint_path=path)
+    assert {h: restored.cost_so_far(h)["readings"] for h in restored.homes} == {f"h{i}": 50 for i in range(4)}
+    acc.close()
+    restored.close()
+
+
+def test_bill_accumulator_checkpoints_in_background_and_checks_tariff(tmp_path):
+    path = str(tmp_path / "bill.json")
+    acc = BillAccumulator(Tariff(name="flat"), checkpoint_path=path, checkpoint_every=5, checkpoint_interval=60)
+    for h in range(5):
+        acc.add_reading("h1", datetime(2025, 1, 6, h), 1.0)
+    # The fifth reading wakes the checkpoint thread; add_reading itself never writes
+    deadline = time.time() + 5
+    while not os.path.exists(path) and time.time() < deadline:
+        time.sleep(0.01)
+    acc.add_reading("h2", datetime(2025, 1, 6, 5), 1.0)
+    acc.close()
+
+    with open(path, encoding="utf-8") as f:
+        saved = json.load(f)
+    assert saved["tariff"]["name"] == "flat" and set(saved["homes"]) == {"h1", "h2"}
+    assert BillAccumulator(Tariff(name="flat"), checkpoint_path=path).cost_so_far("h1")["readings"] == 5
+    with pytest.raises(ValueError):
+        BillAccumulator(Tariff(rate=0.2, name="flat"), checkpoint_path=path)
+
+
+def test_billing_periods_are_shared_by_all_homes():
+    acc = BillAccumulator(Tariff(period_hours=24), period_anchor=datetime(2025, 1, 1))
+    acc.add_reading("early", datetime(2025, 1, 6, 1), 1.0)
+    acc.add_reading("late", datetime(2025, 1, 6, 20), 1.0)
+    acc.add_reading("early", datetime(2025, 1, 7, 0), 2.0)
+    acc.add_reading("late", datetime(2025, 1, 7, 0), 2.0)
+    assert acc.cost_so_far("early") == {**acc.cost_so_far("late"), "home_id": "early"}
+    assert acc.cost_so_far("late")["period_start"] == "2025-01-07T00:00:00"
@@ -0,0 +1,46 @@
+import time
+
+from agents.p2p_trading_agent.bus import BusHub, IPCBus, LocalBus
+from agents.p2p_trading_agent.cluster import ShardRouter
+
+
+def make_routers(n):
+    bus = LocalBus()
+    routers = [ShardRouter(bus, i, n, timeout=2) for i in range(n)]
+    for r in routers:
+        r.handle("whoami", lambda payload, i=r.worker_index: {"worker": i, "payload": payload})
+    return routers
+
+
+def test_keys_and_calls_reach_the_owning_worker():
+    routers = make_routers(3)
+    for r in routers:
+        key = r.new_key()
+        assert r.is_local(key)
+        assert all(other.owner_of(key) == r.worker_index for other in routers)
+
+    owner = routers[0].owner_of("2025-01-01 10:00")
+    assert routers[0].call(owner, "whoami", 7) == {"worker": owner, "payload": 7}
+
+
+def test_gather_returns_local_result_first():
+    routers = make_routers(3)
+    results = routers[1].gather("whoami", "x")
+    assert results[0] == {"worker": 1, "payload": "x"}
+    assert sorted(r["worker"] for r in results) == [0, 1, 2]
+
+
+def test_ipc_bus_relays_between_clients(tmp_path):
+    path = str(tmp_path / "bus.sock")
+    hub = BusHub(path)
+    a, b = IPCBus(path), IPCBus(path)
+    try:
+        qa, qb = a.subscribe("chan"), b.subscribe("chan")
+        time.sleep(0.1)
+        a.publish("chan", {"n": 1})
+        assert qb.get(timeout=2) == {"n": 1}
+        assert qa.get(timeout=2) == {"n": 1}
+    finally:
+        a.close()
+        b.close()
+        hub.close()
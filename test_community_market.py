@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from utils.billing import Tariff
+from utils.community_market import MarketScenario, simulate_market
+
+
+def test_two_homes_trade_at_fixed_price():
+    # Home 0 has 2 kWh surplus, home 1 needs 1 kWh
+    cons = np.array([[0.0], [1.0]])
+    gen = np.array([[2.0], [0.0]])
+    sc = MarketScenario(grid_price=0.05, import_tariff=Tariff(0.2), strategy="midpoint")
+    res = simulate_market(cons, gen, sc, per_home=True)[0]
+
+    price = (0.05 + 0.2) / 2
+    assert res["traded_kWh"] == pytest.approx(1.0)
+    assert res["grid_only_costs"] == pytest.approx([-2 * 0.05, 0.2])
+    assert res["market_costs"] == pytest.approx([-(price + 0.05), price])
+    assert res["savings"] == pytest.approx(0.2 - 0.05)
+    assert res["buyer_savings"] + res["seller_gain"] == pytest.approx(res["savings"])
+
+
+def test_no_trade_when_import_price_below_grid_price():
+    cons = np.array([[0.0, 1.0], [1.0, 0.0]])
+    gen = np.array([[1.0, 0.0], [0.0, 1.0]])
+    res = simulate_market(cons, gen, MarketScenario(grid_price=0.3, import_tariff=Tariff(0.2)))[0]
+    assert res["traded_kWh"] == 0
+    assert res["savings"] == pytest.approx(0.0)
+
+
+def test_longer_extension_raises_english_price():
+    rng = np.random.default_rng(1)
+    cons = rng.uniform(0, 2, (50, 24))
+    gen = rng.uniform(0, 2, (50, 24)) * (np.arange(50)[:, None] < 10)
+    scenarios = [MarketScenario(extension_duration=e, import_tariff=Tariff(0.2)) for e in (10, 60, 600)]
+    results = simulate_market(cons, gen, scenarios)
+
+    prices = [r["mean_price"] for r in results]
+    assert prices[0] < prices[1] < prices[2] <= 0.2 + 1e-9
+    # The price only moves gains between buyers and sellers
+    assert [r["savings"] for r in results] == pytest.approx([results[0]["savings"]] * 3, rel=1e-5)
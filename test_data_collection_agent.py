@@ -1,7 +1,15 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
 import time
+import types
 import queue
 import pytest
 from agents.data_collection_agent import DataCollectionAgent
+from utils import tracing
 
 def dummy_loop_forever():
     # Simulate a brief non-blocking loop.
@@ -34,3 +42,157 @@ def test_data_collection_agent_run(monkeypatch):
 
     # Assert that run() returns quickly (e.g., within 1 second).
     assert elapsed_time < 1.0, "run() should not block when loop_forever is replaced with a dummy function."
+
+
+def test_listeners_only_receive_their_topics():
+    agent = DataCollectionAgent("localhost", 1883, ["weather", "meter"], queue.Queue())
+    weather, meter, everything = [], [], []
+    agent.add_listener(weather.append, topics="weather")
+    agent.add_listener(meter.append, topics=["meter"])
+    agent.add_listener(everything.append)
+
+    for topic, payload in (("weather", b'{"w": 1}'), ("meter", b'{"m": 1}')):
+        agent.on_message(agent.client, None, types.SimpleNamespace(topic=topic, payload=payload))
+    assert weather == [{"w": 1}] and meter == [{"m": 1}]
+    assert everything == [{"w": 1}, {"m": 1}]
+
+
+# ---------- asyncio mode, against a minimal in-process MQTT 3.1.1 broker ----------
+
+async def read_packet(reader):
+    header = (await reader.readexactly(1))[0]
+    length, shift = 0, 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        length |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    return header & 0xF0, await reader.readexactly(length)
+
+
+def packet(header, body):
+    length, remaining = bytearray(), len(body)
+    while True:
+        byte, remaining = remaining & 0x7F, remaining >> 7
+        length.append(byte | (0x80 if remaining else 0))
+        if not remaining:
+            return bytes([header]) + bytes(length) + body
+
+
+def publish_packet(topic, payload):
+    return packet(0x30, len(topic).to_bytes(2, "big") + topic.encode() + payload)
+
+
+async def start_broker(messages):
+    """Answers CONNECT and SUBSCRIBE, then publishes ``messages`` [(topic, dict)] once."""
+    async def serve(reader, writer):
+        pending = list(messages)
+        try:
+            while True:
+                kind, body = await read_packet(reader)
+                if kind == 0x10:
+                    writer.write(b"\x20\x02\x00\x00")
+                elif kind == 0x80:
+                    n_topics = 0
+                    pos = 2
+                    while pos < len(body):
+                        pos += 2 + int.from_bytes(body[pos:pos + 2], "big") + 1
+                        n_topics += 1
+                    writer.write(packet(0x90, body[:2] + b"\x00" * n_topics))
+                    for topic, data in pending:
+                        writer.write(publish_packet(topic, json.dumps(data).encode()))
+                    pending = []
+                elif kind == 0xC0:
+                    writer.write(b"\xd0\x00")
+                elif kind == 0xE0:
+                    break
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass
+        writer.close()
+    server = await asyncio.start_server(serve, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def test_run_async_dispatches_to_coroutine_blocking_and_plain_listeners(tmp_path, monkeypatch):
+    out = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(tracing, "TRACER", tracing.Tracer(sample_rate=1.0, output=str(out)))
+    topics = [f"home/{i}/energy" for i in range(3)]
+    received = {"coro": [], "blocking": [], "plain": []}
+
+    async def main():
+        server, port = await start_broker([(t, {"home": t}) for t in topics])
+        agent = DataCollectionAgent("127.0.0.1", port, topics, queue.Queue())
+        loop_thread = threading.current_thread()
+
+        async def store(data):
+            await asyncio.sleep(0.01)
+            received["coro"].append(data["home"])
+
+        def forecast(data):
+            with tracing.span("forecast"):
+                received["blocking"].append(threading.current_thread() is not loop_thread)
+
+        def count(data):
+            received["plain"].append(threading.current_thread() is loop_thread)
+            if len(received["plain"]) == len(topics):
+                asyncio.get_running_loop().call_later(0.2, agent.stop)
+
+        agent.add_listener(store)
+        agent.add_listener(forecast, blocking=True)
+        agent.add_listener(count)
+        await asyncio.wait_for(agent.run_async(), timeout=5)
+        server.close()
+        return agent
+
+    agent = asyncio.run(main())
+    assert sorted(received["coro"]) == topics
+    assert received["blocking"] == [True] * 3 and received["plain"] == [True] * 3
+    assert agent.data_queue.qsize() == 3 and not agent.in_flight
+
+    spans = [{s["name"]: s for s in json.loads(line)["spans"]} for line in out.read_text().splitlines()]
+    assert len(spans) == 3
+    # The span opened in the executor thread joins the message's trace
+    assert all(t["forecast"]["parent"] == "listener" for t in spans)
+
+
+def test_loop_stays_responsive_during_blocking_listener_under_eventlet():
+    # Run in a fresh interpreter so the monkey patch does not leak into other tests
+    script = """
+import asyncio, queue, time
+import eventlet
+eventlet.monkey_patch()
+from eventlet.patcher import original
+from agents.data_collection_agent import DataCollectionAgent, _default_executor
+
+async def main():
+    agent = DataCollectionAgent("127.0.0.1", 1883, "t", queue.Queue())
+    agent.loop = asyncio.get_running_loop()
+    agent.executor = _default_executor()
+    ticks = 0
+
+    def blocking(data):
+        original("time").sleep(0.5)
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    agent.add_listener(blocking, blocking=True)
+    task = asyncio.ensure_future(ticker())
+    await agent._call_listener(blocking, {})
+    task.cancel()
+    print(type(agent.executor).__name__, ticks)
+
+asyncio.run(main())
+"""
+    out = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=60,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert out.returncode == 0, out.stderr
+    executor, ticks = out.stdout.splitlines()[-1].split()
+    assert executor == "_TpoolExecutor"
+    # A blocked loop would not tick at all during the 0.5 s listener
+    assert int(ticks) >= 10
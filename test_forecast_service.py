@@ -0,0 +1,130 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from agents.forecast_service import app as service
+from agents.forecast_service.batcher import DynamicBatcher, QueueFull
+
+
+def test_concurrent_requests_share_a_batch():
+    sizes = []
+
+    def double(items):
+        sizes.append(len(items))
+        return [2 * x for x in items]
+
+    batcher = DynamicBatcher(double, max_batch=8, max_wait=0.2)
+    results = {}
+    threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, batcher.submit(i))) for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+
+    assert results == {i: 2 * i for i in range(6)}
+    assert sizes == [6]
+    stats = batcher.stats()
+    assert stats["batches"] == 1 and stats["mean_batch_size"] == 6
+
+
+def test_batch_errors_reach_every_request():
+    def fail(items):
+        raise ValueError("model unavailable")
+
+    batcher = DynamicBatcher(fail, max_wait=0)
+    with pytest.raises(ValueError):
+        batcher.submit(1, timeout=5)
+    batcher.close()
+
+
+def test_failed_batch_falls_back_to_single_requests():
+    sizes = []
+
+    def double_non_negative(items):
+        sizes.append(len(items))
+        if any(x < 0 for x in items):
+            raise ValueError("negative input")
+        return [2 * x for x in items]
+
+    batcher = DynamicBatcher(double_non_negative, max_batch=8, max_wait=0.2)
+    results = {}
+
+    def submit(i):
+        try:
+            results[i] = batcher.submit(i, timeout=5)
+        except ValueError as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in (1, -1, 2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+
+    assert results[1] == 2 and results[2] == 4
+    assert isinstance(results[-1], ValueError)
+    assert sizes == [3, 1, 1, 1]
+    assert batcher.stats()["fallbacks"] == 1
+
+
+def test_forecast_endpoint_validates_and_returns_records(monkeypatch):
+    def fake_predict(items):
+        return [pd.DataFrame({"time": wf["time"], "consumption_pred": c, "generation_pred": g})
+                for wf, c, g in items]
+
+    batcher = DynamicBatcher(fake_predict, max_wait=0.001)
+    monkeypatch.setattr(service, "batcher", batcher)
+    client = service.app.test_client()
+    weather = [{"time": f"2025-01-01 0{h}:00", "day_of_week": 2, "weather": "Night"} for h in range(3)]
+
+    res = client.post("/forecast", json={"weather": weather, "start_consumption": 1.5})
+    assert res.status_code == 200
+    assert [r["consumption_pred"] for r in res.get_json()] == [1.5] * 3
+
+    assert client.post("/forecast", json={"weather": []}).status_code == 400
+    assert client.post("/forecast", json={"weather": [{"time": "x"}]}).status_code == 400
+    for bad in ({"time": "not a time"}, {"time": None}, {"day_of_week": 7}, {"day_of_week": "Monday"},
+                {"day_of_week": 1.5}, {"weather": 3}, {"weather": None}):
+        res = client.post("/forecast", json={"weather": [weather[0], dict(weather[1], **bad)]})
+        assert res.status_code == 400, bad
+    res = client.post("/forecast", json={"weather": [weather[0], 5]})
+    assert res.status_code == 400 and res.get_json() == {"message": "weather records must be objects"}
+    assert client.get("/stats").get_json()["requests"] == 1
+    batcher.close()
+
+
+def test_timed_out_requests_are_skipped_and_full_queue_is_rejected(monkeypatch):
+    release = threading.Event()
+    seen = []
+
+    def slow(items):
+        seen.extend(items)
+        release.wait(5)
+        return items
+
+    batcher = DynamicBatcher(slow, max_batch=1, max_wait=0, max_queue=1)
+    blocker = threading.Thread(target=batcher.submit, args=("running",))
+    blocker.start()
+    while not seen:
+        time.sleep(0.001)
+
+    # The worker is busy: this request times out while queued, and the queue is now full
+    with pytest.raises(TimeoutError):
+        batcher.submit("abandoned", timeout=0.01)
+    with pytest.raises(QueueFull):
+        batcher.submit("rejected", timeout=5)
+    monkeypatch.setattr(service, "batcher", batcher)
+    res = service.app.test_client().post("/forecast", json={
+        "weather": [{"time": "2025-01-01 00:00", "day_of_week": 2, "weather": "Night"}]})
+    assert res.status_code == 503
+
+    release.set()
+    blocker.join()
+    assert batcher.submit("next", timeout=5) == "next"
+    batcher.close()
+    assert seen == ["running", "next"]
+    assert batcher.stats()["cancelled"] == 1
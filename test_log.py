@@ -0,0 +1,75 @@
+import io
+import json
+import logging
+import threading
+
+from utils import log
+
+
+class Expensive:
+    formatted = 0
+
+    def __str__(self):
+        Expensive.formatted += 1
+        return "expensive"
+
+
+def test_text_and_json_records_are_written_in_the_background():
+    out = io.StringIO()
+    log.setup(level="INFO", fmt="text", stream=out)
+    logger = log.get_logger("DataCollectionAgent")
+    logger.info("Received MQTT data", extra={"topic": "energy_data", "bytes": 512})
+    logger.debug("Payload: %s", Expensive())
+    log.shutdown()
+    assert out.getvalue().rstrip().endswith("INFO [DataCollectionAgent] Received MQTT data topic=energy_data bytes=512")
+    assert Expensive.formatted == 0
+
+    out = io.StringIO()
+    log.setup(level="DEBUG", fmt="json", stream=out)
+    logger.debug("Payload: %s", Expensive())
+    log.shutdown()
+    entry = json.loads(out.getvalue())
+    assert entry["logger"] == "DataCollectionAgent" and entry["message"] == "Payload: expensive"
+    log.setup()
+
+
+def test_records_are_formatted_on_the_listener_thread():
+    formatted_on = []
+
+    class Recording(Expensive):
+        def __str__(self):
+            formatted_on.append(threading.current_thread())
+            return "recorded"
+
+    out = io.StringIO()
+    writer_thread = log.setup(level="INFO", fmt="json", stream=out)._thread
+    logger = log.get_logger("DataCollectionAgent")
+    logger.info("Payload: %s", Recording())
+    try:
+        raise ValueError("bad payload")
+    except ValueError:
+        logger.exception("Listener failed")
+    log.shutdown()
+    assert formatted_on == [writer_thread] and formatted_on[0] is not threading.current_thread()
+
+    first, second = map(json.loads, out.getvalue().splitlines())
+    assert first["message"] == "Payload: recorded"
+    assert second["message"] == "Listener failed"
+    assert "ValueError: bad payload" in second["exc_info"]
+    log.setup()
+
+
+def test_full_queue_drops_instead_of_blocking():
+    before = log.DROPPED.value
+    handler = log.DroppingQueueHandler(__import__("queue").Queue(1))
+    for _ in range(3):
+        handler.emit(logging.makeLogRecord({"msg": "x"}))
+    assert log.DROPPED.value - before == 2
+
+
+def test_sampler_rates_from_environment(monkeypatch):
+    monkeypatch.setenv("LOG_SAMPLE", "mqtt.message=0, prediction=0.5")
+    assert log.sampler("mqtt.message").rate == 0.0
+    assert log.sampler("prediction").rate == 0.5
+    assert log.sampler("other").rate == 1.0
+    assert not any(log.sampler("mqtt.message")() for _ in range(100))
@@ -0,0 +1,43 @@
+import pytest
+from utils.metrics import Counter, Gauge, Histogram, Registry, merge_families, render_text
+
+
+def test_render_counter_gauge_and_histogram():
+    registry = Registry()
+    received = registry.get_or_create(Counter, "messages_total", "Messages", ["topic"])
+    latency = registry.get_or_create(Histogram, "latency_seconds", "Latency", buckets=(0.1, 1.0))
+    queued = registry.get_or_create(Gauge, "queued", "Queue length")
+    queued.set_function(lambda: 7)
+
+    received.labels("energy_data").inc()
+    received.labels("energy_data").inc(2)
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE messages_total counter" in lines
+    assert 'messages_total{topic="energy_data"} 3' in lines
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1"} 2' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert "latency_seconds_count 3" in lines
+    assert "queued 7" in lines
+
+
+def test_get_or_create_reuses_and_checks_type():
+    registry = Registry()
+    first = registry.get_or_create(Counter, "x_total", "X")
+    assert registry.get_or_create(Counter, "x_total", "X") is first
+    with pytest.raises(ValueError):
+        registry.get_or_create(Histogram, "x_total", "X")
+
+
+def test_merge_adds_worker_label_and_escapes():
+    parts = []
+    for worker in range(2):
+        registry = Registry()
+        registry.get_or_create(Counter, "bids_total", "Bids", ["event"]).labels('a"b').inc(worker + 1)
+        parts.append(registry.collect())
+    text = render_text(merge_families(parts, "worker", [0, 1]))
+    assert text.count("# TYPE bids_total counter") == 1
+    assert 'bids_total{event="a\\"b",worker="1"} 2' in text
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+from agents.p2p_trading_agent.order_book import OrderBook, OrderBookManager
+
+
+def test_price_time_priority_and_partial_fills():
+    book = OrderBook("2024-06-01 14:00")
+    first, _ = book.submit("alice", "sell", 0.20, 3)
+    second, _ = book.submit("bob", "sell", 0.20, 3)
+    cheap, _ = book.submit("carol", "sell", 0.18, 2)
+
+    order, trades = book.submit("dave", "buy", 0.22, 6)
+    # Best price first, then the older order at the same price; trades at the resting price
+    assert [(t.seller, t.price, t.quantity) for t in trades] == [
+        ("carol", 0.18, 2), ("alice", 0.20, 3), ("bob", 0.20, 1)]
+    assert order.remaining == 0
+    assert book.orders[second.order_id].remaining == 2
+    assert book.best_ask() == 0.20 and book.best_bid() is None
+    assert first.order_id not in book.orders and cheap.order_id not in book.orders
+
+
+def test_unmatched_volume_rests_and_cancel_removes_level():
+    book = OrderBook("2024-06-01 14:00")
+    order, trades = book.submit("alice", "buy", 0.15, 4)
+    assert trades == [] and book.best_bid() == 0.15
+
+    assert book.cancel(order.order_id, "bob")["status"] == "fail"
+    assert book.cancel(order.order_id, "alice")["status"] == "success"
+    assert book.best_bid() is None
+    _, trades = book.submit("carol", "sell", 0.10, 1)
+    assert trades == []
+
+
+def test_gate_closure_settles_with_grid():
+    hour = (datetime.now() + timedelta(hours=2)).strftime("%Y-%m-%d %H:00")
+    manager = OrderBookManager(grid_price=0.05, import_price=0.3, gate_closure=300)
+    assert manager.submit("alice", hour, "sell", 0.2, 5)["status"] == "success"
+    assert manager.submit("bob", hour, "buy", 0.1, 2)["status"] == "success"
+    gate = manager.next_gate_closure()
+
+    assert manager.close_due(gate - 1) == []
+    [(book, grid_trades)] = manager.close_due(gate)
+    assert book.closed
+    assert {(t.buyer, t.seller, t.price, t.quantity) for t in grid_trades} == {
+        ("Grid", "alice", 0.05, 5), ("bob", "Grid", 0.3, 2)}
+    assert manager.submit("carol", hour, "buy", 0.3, 1)["status"] == "fail"
+
+
+def test_own_resting_orders_are_canceled_not_matched():
+    book = OrderBook("2024-06-01 14:00")
+    own, _ = book.submit("alice", "sell", 0.18, 2)
+    other, _ = book.submit("bob", "sell", 0.20, 3)
+
+    order, trades = book.submit("alice", "buy", 0.22, 4)
+    assert [(t.buyer, t.seller, t.price, t.quantity) for t in trades] == [("alice", "bob", 0.20, 3)]
+    assert own.canceled and own.order_id not in book.orders
+    assert other.order_id not in book.orders
+    assert order.remaining == 1 and book.best_bid() == 0.22 and book.best_ask() is None
+
+
+def test_manager_validates_before_opening_and_evicts_closed_books():
+    hour = (datetime.now() + timedelta(hours=2)).strftime("%Y-%m-%d %H:00")
+    past = (datetime.now() - timedelta(hours=2)).strftime("%Y-%m-%d %H:00")
+    manager = OrderBookManager(gate_closure=300)
+    assert manager.submit("alice", hour, "hold", 0.2, 5)["status"] == "fail"
+    assert manager.submit("alice", hour, "sell", 0.2, 0)["status"] == "fail"
+    assert manager.submit("alice", past, "sell", 0.2, 1)["status"] == "fail"
+    assert manager.submit("alice", "2024-06-01 14:30", "sell", 0.2, 1)["status"] == "fail"
+    assert manager.books == {} and manager.next_gate_closure() is None
+
+    assert manager.submit("alice", hour, "sell", 0.2, 5)["status"] == "success"
+    [(book, _)] = manager.close_due(manager.next_gate_closure())
+    assert book.closed and manager.get_book(hour) is None
+    assert manager.submit("bob", hour, "buy", 0.3, 1)["status"] == "fail"
+    assert manager.books == {}
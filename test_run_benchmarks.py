@@ -0,0 +1,32 @@
+from benchmarks import run_benchmarks
+from benchmarks.run_benchmarks import compare, measure
+
+
+def report(**seconds):
+    return {"results": {name: ({"skipped": "tensorflow"} if s is None else {"seconds": s})
+                        for name, s in seconds.items()}}
+
+
+def test_compare_flags_regressions_beyond_threshold():
+    baseline = report(a=1.0, b=1.0, c=1.0, d=None, gone=1.0)
+    current = report(a=1.1, b=1.5, c=0.5, d=None, added=1.0)
+    status = {row["case"]: row["status"] for row in compare(baseline, current, threshold=0.15)}
+    assert status == {"a": "unchanged", "b": "regression", "c": "improved", "d": "skipped",
+                      "gone": "missing", "added": "new"}
+
+
+def test_measure_with_setup_times_one_call_per_run():
+    calls = []
+    res = measure(calls.append, setup=lambda: len(calls), repeat=4)
+    assert calls == [0, 1, 2, 3]
+    assert res["runs"] == 4 and res["calls_per_run"] == 1
+    assert 0 <= res["seconds"] <= res["median_seconds"]
+
+
+def test_missing_dependency_is_reported_as_skipped(monkeypatch):
+    def needs_tensorflow(quick):
+        raise ModuleNotFoundError("No module named 'tensorflow'", name="tensorflow")
+    monkeypatch.setitem(run_benchmarks.CASES, "needs_tf", ("prediction", needs_tensorflow))
+    res = run_benchmarks.run_cases(["needs_tf", "json_to_dataframe_168"], quick=True)
+    assert res["needs_tf"]["skipped"] == "missing dependency: tensorflow"
+    assert res["json_to_dataframe_168"]["seconds"] > 0
@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from agents.energy_manage_agent import app as ems
+from agents.energy_manage_agent.scheduler import DEFAULT_APPLIANCE_JOBS, PRIORITY_LEVELS, LoadShiftScheduler
+from utils.billing import DEFAULT_RATE, Tariff
+
+
+def forecast(consumption, generation, start="2025-01-06 00:00"):
+    return pd.DataFrame({
+        "time": pd.date_range(start, periods=len(consumption), freq="h").strftime("%Y-%m-%d %H:%M"),
+        "consumption_pred": consumption,
+        "generation_pred": generation,
+    })
+
+
+def test_job_takes_its_only_feasible_window():
+    plan = LoadShiftScheduler().schedule_fleet(
+        np.full(24, 0.5), np.zeros(24),
+        [{"appliance": "Oven", "duration": 3, "power": 2.0, "earliest": 10, "latest": 13}])
+    assert plan["start"][0, 0] == 10
+    assert plan["cost"][0, 0] == pytest.approx(3 * 2.0 * DEFAULT_RATE)
+    assert plan["solar_kWh"][0, 0] == 0
+
+    # A window shorter than the run leaves the job unscheduled
+    plan = LoadShiftScheduler().schedule_fleet(
+        np.full(24, 0.5), np.zeros(24),
+        [{"appliance": "Oven", "duration": 3, "power": 2.0, "earliest": 10, "latest": 12}])
+    assert plan["start"][0, 0] == -1 and plan["cost"][0, 0] == 0
+
+
+def test_job_moves_into_solar_surplus():
+    generation = np.zeros(24)
+    generation[11:15] = 2.0
+    runs = LoadShiftScheduler(Tariff(feed_in_rate=0.05)).schedule(
+        forecast(np.full(24, 0.5), generation),
+        [{"appliance": "Washing Machine", "duration": 2, "power": 1.0}])
+
+    assert len(runs) == 1
+    run = runs[0]
+    assert 11 <= run["start_slot"] <= 13
+    assert run["start_time"] == f"2025-01-06 {run['start_slot']:02d}:00"
+    assert run["end_time"] == f"2025-01-06 {run['start_slot'] + 2:02d}:00"
+    assert run["solar_kWh"] == pytest.approx(2.0)
+    # Only the lost feed-in credit is paid
+    assert run["cost"] == pytest.approx(2.0 * 0.05)
+
+
+def test_windows_durations_and_surplus_are_respected():
+    rng = np.random.default_rng(0)
+    cons = rng.uniform(0.2, 1.0, (5, 48))
+    gen = np.clip(np.sin(np.arange(48) / 24 * 2 * np.pi - np.pi / 2), 0, None) * rng.uniform(1, 3, (5, 1))
+    jobs = [
+        {"appliance": "Washing Machine", "duration": 2, "power": 0.5, "earliest": 6, "latest": 20},
+        {"appliance": "Dishwasher", "duration": 2, "power": 1.2, "earliest": 18},
+        {"appliance": "Oven", "duration": 1, "power": 2.0, "latest": 30},
+        {"appliance": "Heater", "duration": 3, "power": 1.5},
+    ]
+    plan = LoadShiftScheduler().schedule_fleet(cons, gen, jobs)
+
+    drawn = np.zeros_like(cons)
+    for j, job in enumerate(jobs):
+        start = plan["start"][:, j]
+        assert (start >= job.get("earliest", 0)).all()
+        assert (start + job["duration"] <= job.get("latest", 48)).all()
+        for home, s in enumerate(start):
+            drawn[home, s:s + job["duration"]] += job["power"]
+    np.testing.assert_allclose(plan["surplus"], gen - cons - drawn)
+
+
+def test_fleet_matches_per_home_schedule():
+    rng = np.random.default_rng(1)
+    tariff = Tariff(tou_rates=[0.1] * 7 + [0.3] * 15 + [0.1] * 2, feed_in_rate=0.04)
+    scheduler = LoadShiftScheduler(tariff)
+    homes = [forecast(rng.uniform(0.2, 1.5, 72), rng.uniform(0, 2.5, 72)) for _ in range(4)]
+    priorities = [
+        {}, {"Oven": "High", "Heater": "Low"}, {"Dishwasher": "High"}, {"Washing Machine": "Low", "Oven": "Low"},
+    ]
+    levels = [[PRIORITY_LEVELS.get(p.get(j["appliance"]), 2) for j in DEFAULT_APPLIANCE_JOBS] for p in priorities]
+    hour_of_day = pd.to_datetime(homes[0]["time"]).dt.hour.to_numpy()
+    day_of_week = pd.to_datetime(homes[0]["time"]).dt.weekday.to_numpy()
+
+    plan = scheduler.schedule_fleet(
+        np.stack([h["consumption_pred"] for h in homes]), np.stack([h["generation_pred"] for h in homes]),
+        DEFAULT_APPLIANCE_JOBS, levels, hour_of_day, day_of_week)
+
+    for home, (df, prio) in enumerate(zip(homes, priorities)):
+        runs = {r["appliance"]: r for r in scheduler.schedule(df, priorities=prio)}
+        for j, job in enumerate(DEFAULT_APPLIANCE_JOBS):
+            run = runs[job["appliance"]]
+            assert run["start_slot"] == plan["start"][home, j]
+            assert run["cost"] == pytest.approx(plan["cost"][home, j])
+            assert run["solar_kWh"] == pytest.approx(plan["solar_kWh"][home, j])
+            assert run["priority"] == prio.get(job["appliance"], "Medium")
+
+
+def test_schedule_route():
+    client = ems.app.test_client()
+    response = client.post("/schedule", json={"home_id": ems.DEFAULT_HOME})
+    assert response.status_code == 400
+    assert response.get_json() == {"message": "forecast is required"}
+
+    df = forecast(np.full(24, 0.5), np.zeros(24))
+    response = client.post("/schedule", json={
+        "home_id": "unknown-home",
+        "forecast": df.to_dict(orient="records"),
+        "jobs": [{"appliance": "Oven", "duration": 1, "power": 2.0, "earliest": 5, "latest": 6}],
+    })
+    assert response.status_code == 200
+    assert [(r["appliance"], r["start_slot"], r["priority"]) for r in response.get_json()] == [("Oven", 5, "Medium")]
+
+
+def test_schedule_route_rejects_malformed_input():
+    client = ems.app.test_client()
+    records = forecast(np.full(24, 0.5), np.zeros(24)).to_dict(orient="records")
+
+    response = client.post("/schedule", json={"forecast": records, "jobs": [{"appliance": "Oven", "duration": 1}]})
+    assert response.status_code == 400
+    assert response.get_json() == {"message": "jobs[0] is missing power"}
+
+    response = client.post("/schedule", json={"forecast": records, "jobs": {"appliance": "Oven"}})
+    assert response.status_code == 400
+    assert response.get_json() == {"message": "jobs must be a list of objects"}
+
+    response = client.post("/schedule", json={"forecast": [{"time": "2025-01-06 00:00", "consumption_pred": 0.5}]})
+    assert response.status_code == 400
+    assert response.get_json() == {"message": "forecast[0] is missing generation_pred"}
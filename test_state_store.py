@@ -0,0 +1,85 @@
+import json
+import threading
+from agents.energy_manage_agent.state_store import ApplianceStateStore
+
+
+def test_start_stop_accumulates_usage_and_counts():
+    store = ApplianceStateStore()
+    store.register_home("h1", ["washer", "tv"])
+    version = store.version("h1")
+
+    assert store.start("h1", "washer", now=0)
+    assert not store.start("h1", "washer", now=10)  # already running
+    assert not store.stop("h1", "tv", now=10)  # not running
+    assert not store.start("h1", "oven", now=10) and not store.start("h2", "tv", now=10)
+
+    status = store.appliance_status("h1", "washer", now=90)
+    assert status == {"start_time": 0.0, "usage": 0.0, "current_usage": 1.5, "usage_count": 1}
+
+    assert store.stop("h1", "washer", now=120)
+    assert store.start("h1", "washer", now=600)
+    assert store.stop("h1", "washer", now=900)
+    assert store.version("h1") == version + 4
+
+    status = store.home_status("h1", now=1000)
+    assert status["washer"] == {"start_time": None, "usage": 7.0, "current_usage": 0, "usage_count": 2}
+    assert status["tv"] == {"start_time": None, "usage": 0.0, "current_usage": 0, "usage_count": 0}
+    assert store.home_usage("h1") == (version + 4, [
+        {"appliance": "washer", "usage": 7.0, "usage_count": 2},
+        {"appliance": "tv", "usage": 0.0, "usage_count": 0},
+    ])
+
+
+def test_grows_past_initial_block_and_exports_snapshot():
+    store = ApplianceStateStore(block_size=4, lock_stripes=2)
+    for i in range(5):
+        store.register_home(f"h{i}", ["a", "b"])
+    # Re-registering keeps the known slots and only adds the new appliance
+    store.register_home("h0", ["a", "c"])
+    assert store.size == 11 and len(store.usage_blocks) == 3
+
+    store.start("h4", "b", now=0)
+    store.stop("h4", "b", now=60)
+    store.start("h0", "c", now=30)
+    assert store.home_status("h4", now=60)["b"]["usage"] == 1.0
+    assert store.home_status("h0", now=90)["c"]["current_usage"] == 1.0
+
+    seq, state = store.export_state()
+    assert seq == 0
+    state = json.loads(json.dumps(state))
+    assert state["homes"]["h0"] == {"a": 0, "b": 1, "c": 10}
+    assert state["versions"]["h4"] == 2 and state["versions"]["h0"] == 1
+    assert len(state["usage"]) == len(state["start_time"]) == len(state["usage_count"]) == 11
+    assert state["start_time"][10] == 30 and state["start_time"][9] is None
+    assert state["usage"][9] == 1.0 and state["usage_count"][9] == 1
+
+    restored = ApplianceStateStore(block_size=4)
+    restored.load_state(state)
+    assert restored.home_status("h0", now=90) == store.home_status("h0", now=90)
+    assert restored.home_usage("h4") == store.home_usage("h4")
+
+
+def test_concurrent_updates_are_not_lost():
+    store = ApplianceStateStore(block_size=8, lock_stripes=4)
+    homes = [f"h{i}" for i in range(8)]
+    for home in homes:
+        store.register_home(home, ["heater"])
+
+    def toggle(worker):
+        for i in range(200):
+            home = homes[(worker + i) % len(homes)]
+            if store.start(home, "heater", now=0):
+                store.stop(home, "heater", now=60)
+
+    threads = [threading.Thread(target=toggle, args=(w,)) for w in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    usage = {home: store.home_usage(home)[1][0] for home in homes}
+    # Every successful start is matched by exactly one stop adding one minute
+    assert all(rec["usage"] == rec["usage_count"] for rec in usage.values())
+    assert sum(rec["usage_count"] for rec in usage.values()) > 0
+    assert all(store.appliance_status(home, "heater")["start_time"] is None for home in homes)
+    assert sum(store.version(home) for home in homes) == 2 * sum(rec["usage_count"] for rec in usage.values())
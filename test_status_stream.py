@@ -0,0 +1,97 @@
+import json
+import queue
+import threading
+import time
+
+from agents.energy_manage_agent import app as ems
+from agents.energy_manage_agent.status_stream import StatusBroadcaster, UsageThresholdWatcher, format_sse
+
+
+def parse_sse(message):
+    if isinstance(message, bytes):
+        message = message.decode()
+    lines = dict(line.split(": ", 1) for line in message.strip().split("\n"))
+    return lines["event"], json.loads(lines["data"])
+
+
+def test_subscribers_receive_deltas_and_stalled_ones_are_dropped():
+    broadcaster = StatusBroadcaster(max_queue_size=2)
+    q = broadcaster.subscribe("h1")
+    other = broadcaster.subscribe("h2")
+
+    broadcaster.publish("h1", "delta", {"version": 1})
+    broadcaster.publish("h3", "delta", {"version": 1})  # nobody listening
+    assert parse_sse(q.get_nowait()) == ("delta", {"version": 1})
+    assert other.empty()
+
+    for version in range(3):
+        broadcaster.publish("h2", "delta", {"version": version})
+    assert not broadcaster.has_subscribers("h2")
+
+    broadcaster.unsubscribe("h1", q)
+    assert broadcaster.subscribers == {}
+
+
+def test_refresh_runs_on_broadcaster_thread():
+    ran = queue.Queue()
+
+    def refresh(home_id):
+        ran.put(threading.current_thread())
+        return {"priorities": [home_id]}
+
+    broadcaster = StatusBroadcaster(refresh=refresh)
+    broadcaster.request_refresh("h1")  # no subscribers: skipped
+    q = broadcaster.subscribe("h1")
+    broadcaster.request_refresh("h1")
+
+    assert parse_sse(q.get(timeout=2)) == ("delta", {"priorities": ["h1"]})
+    assert ran.get_nowait() is broadcaster.thread
+    assert ran.empty()
+
+
+def test_threshold_watcher_fires_in_deadline_order():
+    fired = queue.Queue()
+    watcher = UsageThresholdWatcher(lambda *args: fired.put(args))
+    now = time.time()
+    watcher.schedule(now + 0.2, "h1", "Oven", 1.0)
+    watcher.schedule(now + 0.05, "h2", "Heater", 2.0)
+
+    assert fired.get(timeout=2) == ("h2", "Heater", 2.0)
+    assert fired.get(timeout=2) == ("h1", "Oven", 1.0)
+    assert time.time() >= now + 0.2
+
+
+def test_stream_sends_snapshot_then_versioned_deltas_and_alerts():
+    client = ems.app.test_client()
+    home = "stream-test"
+    client.post("/register-home", json={"home_id": home})
+
+    response = client.get(f"/stream?home_id={home}")
+    assert response.mimetype == "text/event-stream"
+    events = iter(response.response)
+    event, snapshot = parse_sse(next(events))
+    assert event == "snapshot"
+    assert set(snapshot["appliances"]) == set(ems.DEFAULT_APPLIANCES)
+    assert len(snapshot["priorities"]) == len(ems.DEFAULT_APPLIANCES)
+    assert snapshot["version"] == 0
+
+    client.post("/start", json={"home_id": home, "appliance": "Oven"})
+    event, delta = parse_sse(next(events))
+    assert event == "delta" and delta["version"] == 1
+    assert delta["appliances"]["Oven"]["start_time"] is not None
+    assert "priorities" not in delta
+
+    # Usage threshold alert for the running appliance
+    start_time = delta["appliances"]["Oven"]["start_time"]
+    ems.threshold_watcher.schedule(time.time(), home, "Oven", start_time)
+    alert = None
+    while alert is None:
+        event, delta = parse_sse(next(events))
+        alert = delta.get("alerts")
+    assert alert[0]["appliance"] == "Oven"
+    assert delta["version"] == 1
+
+    response.close()
+    assert not ems.broadcaster.has_subscribers(home)
+    assert client.get("/stream?home_id=unknown-home").status_code == 404
+    assert format_sse("x", 1) == "event: x\ndata: 1\n\n"
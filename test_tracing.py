@@ -0,0 +1,68 @@
+import json
+import os
+import pstats
+import signal
+import time
+
+from utils import tracing
+from utils.tracing import NOOP, Tracer
+
+
+def test_disabled_tracer_returns_noop():
+    tracer = Tracer(sample_rate=0.0)
+    assert tracer.trace("mqtt.message") is NOOP
+    assert tracing.span("json.decode") is NOOP
+    assert tracing.stages("predict_7days") is NOOP
+
+
+def test_spans_and_stages_are_written_per_trace(tmp_path):
+    out = tmp_path / "traces.jsonl"
+    tracer = Tracer(sample_rate=1.0, output=str(out))
+    with tracer.trace("mqtt.message", topic="energy_data"):
+        with tracing.span("predict_7days", hours=3):
+            stage = tracing.stages("predict_7days")
+            for _ in range(3):
+                stage.skip()
+                stage.lap("scale")
+                stage.lap("model")
+            stage.close()
+    assert tracing.span("outside") is NOOP
+
+    trace = json.loads(out.read_text())
+    spans = {s["name"]: s for s in trace["spans"]}
+    assert trace["name"] == "mqtt.message"
+    assert spans["mqtt.message"]["topic"] == "energy_data"
+    assert spans["predict_7days"]["parent"] == "mqtt.message"
+    assert spans["predict_7days.model"]["parent"] == "predict_7days"
+    assert spans["predict_7days.model"]["count"] == 3
+
+
+def test_profiling_dumps_stats_when_toggled_off(tmp_path):
+    prof = tmp_path / "pipeline.prof"
+    tracer = Tracer(profile=True, profile_sample_rate=1.0, profile_output=str(prof))
+    with tracer.trace("mqtt.message"):
+        sum(range(1000))
+    tracer.toggle_profiling()
+    assert prof.exists()
+    assert pstats.Stats(str(prof)).total_calls > 0
+
+
+def test_profiling_signal_does_not_deadlock_while_lock_is_held(tmp_path):
+    prof = tmp_path / "pipeline.prof"
+    tracer = Tracer(profile=True, profile_sample_rate=1.0, profile_output=str(prof))
+    with tracer.trace("mqtt.message"):
+        sum(range(1000))
+    previous = {sig: signal.getsignal(sig) for sig in (signal.SIGUSR1, signal.SIGUSR2)}
+    try:
+        tracing.install_signal_handlers(tracer)
+        # The signal arrives while this (the main) thread is writing a trace
+        with tracer.lock:
+            os.kill(os.getpid(), signal.SIGUSR2)
+            time.sleep(0.01)
+            assert tracer.profile is False and not prof.exists()
+        # The dump happens outside the handler: on the next trace, or by the watcher thread
+        assert tracer.trace("mqtt.message") is NOOP
+        assert prof.exists() and not tracer.toggled
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
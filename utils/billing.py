@@ -0,0 +1,516 @@
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# Default electricity cost per kWh (CAD), example rate for Ontario, Canada
+DEFAULT_RATE = 0.147
+# Default billing period length in hours (~ one month)
+DEFAULT_PERIOD_HOURS = 730
+# Billing periods of BillAccumulator are counted from here, so every home shares the same boundaries
+PERIOD_ANCHOR = datetime(2000, 1, 1)
+
+
+class Tariff:
+    """
+    Electricity tariff used to price imported energy and credit exported energy.
+
+    Supports flat, time-of-use and tiered pricing plus a feed-in credit. Prices
+    are expanded to one value per hour so bills can be computed with array
+    operations instead of per-row loops.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, tou_rates=None, tiers=None,
+                 feed_in_rate=0.0, period_hours=DEFAULT_PERIOD_HOURS, name=None):
+        """
+        :param rate: Flat import price per kWh.
+        :param tou_rates: Optional time-of-use import prices, either 24 values (one per
+                          hour of day) or a 7x24 table indexed by [day_of_week][hour_of_day].
+                          Overrides ``rate`` when given.
+        :param tiers: Optional list of (threshold_kWh, surcharge) pairs. Within a billing
+                      period, every kWh imported beyond ``threshold_kWh`` is charged
+                      ``surcharge`` on top of the base price.
+        :param feed_in_rate: Credit per kWh exported to the grid.
+        :param period_hours: Length of a billing period in hours. Tier counters reset
+                             at every period boundary.
+        :param name: Optional label used in reports.
+        """
+        self.rate = float(rate)
+        self.tou_rates = None
+        if tou_rates is not None:
+            tou = np.asarray(tou_rates, dtype="float64")
+            if tou.shape == (24,):
+                tou = np.tile(tou, (7, 1))
+            if tou.shape != (7, 24):
+                raise ValueError("tou_rates must have 24 values or a 7x24 table.")
+            self.tou_rates = tou
+        self.tiers = sorted((float(t), float(s)) for t, s in (tiers or []))
+        self.feed_in_rate = float(feed_in_rate)
+        if period_hours <= 0:
+            raise ValueError("period_hours must be positive.")
+        self.period_hours = int(period_hours)
+        self.name = name or "tariff"
+
+    def describe(self):
+        """:return: JSON-serialisable description of the tariff (stored with bill checkpoints)."""
+        return {
+            "name": self.name,
+            "rate": self.rate,
+            "tou_rates": None if self.tou_rates is None else self.tou_rates.tolist(),
+            "tiers": [list(tier) for tier in self.tiers],
+            "feed_in_rate": self.feed_in_rate,
+            "period_hours": self.period_hours,
+        }
+
+    def import_prices(self, hour_of_day, day_of_week):
+        """
+        Return the base import price for every hour.
+
+        :param hour_of_day: Array of hours (0..23).
+        :param day_of_week: Array of weekdays (0=Monday..6=Sunday).
+        :return: 1-D float array, one price per hour.
+        """
+        hour_of_day = np.asarray(hour_of_day, dtype="int64")
+        if self.tou_rates is None:
+            return np.full(hour_of_day.shape, self.rate)
+        day_of_week = np.asarray(day_of_week, dtype="int64")
+        return self.tou_rates[day_of_week % 7, hour_of_day % 24]
+
+    def price_at(self, hour_of_day, day_of_week):
+        """Scalar import price for a single hour."""
+        if self.tou_rates is None:
+            return self.rate
+        return float(self.tou_rates[day_of_week % 7, hour_of_day % 24])
+
+    def incremental_surcharge(self, period_kwh_before, kwh):
+        """Surcharge for ``kwh`` imported on top of ``period_kwh_before`` in the same period."""
+        total = 0.0
+        after = period_kwh_before + kwh
+        for threshold, surcharge in self.tiers:
+            if after > threshold:
+                total += (after - max(period_kwh_before, threshold)) * surcharge
+        return total
+
+    def tier_surcharge(self, period_imports):
+        """
+        Surcharge owed for the imports of each billing period.
+
+        :param period_imports: Array (..., periods) of kWh imported per period.
+        :return: Array (...,) with the total surcharge.
+        """
+        total = np.zeros(period_imports.shape[:-1])
+        for threshold, surcharge in self.tiers:
+            total += np.clip(period_imports - threshold, 0, None).sum(axis=-1) * surcharge
+        return total
+
+    def hourly_tier_surcharge(self, imports):
+        """
+        Spread the tier surcharge over the hours in which it was incurred.
+
+        :param imports: Array (homes, hours) of kWh imported per hour.
+        :return: Array (homes, hours) with the surcharge per hour.
+        """
+        out = np.zeros(imports.shape)
+        if not self.tiers:
+            return out
+        n_hours = imports.shape[-1]
+        cum = np.cumsum(imports, axis=-1)
+        starts = np.arange(0, n_hours, self.period_hours)
+        # Cumulative imports at the end of the previous period, repeated per hour
+        offsets = np.concatenate(
+            [np.zeros(imports.shape[:-1] + (1,)), cum[..., starts[1:] - 1]], axis=-1
+        )
+        cum_in_period = cum - np.repeat(offsets, np.diff(np.append(starts, n_hours)), axis=-1)
+        prev_in_period = cum_in_period - imports
+        for threshold, surcharge in self.tiers:
+            excess = np.clip(cum_in_period - threshold, 0, None) - np.clip(prev_in_period - threshold, 0, None)
+            out += excess * surcharge
+        return out
+
+
+def calendar_from_times(times):
+    """
+    Derive hour-of-day and day-of-week arrays from timestamps.
+
+    :param times: Sequence of timestamps or strings parsable by pandas.
+    :return: (hour_of_day, day_of_week) as int arrays.
+    """
+    parsed = pd.to_datetime(pd.Series(times))
+    return parsed.dt.hour.to_numpy(), parsed.dt.weekday.to_numpy()
+
+
+def _as_2d(values, dtype):
+    arr = np.asarray(values, dtype=dtype)
+    if arr.ndim == 1:
+        arr = arr[np.newaxis, :]
+    if arr.ndim != 2:
+        raise ValueError("Expected an array of shape (hours,) or (homes, hours).")
+    return arr
+
+
+def _default_calendar(n_hours, hour_of_day, day_of_week):
+    if hour_of_day is None:
+        hour_of_day = np.arange(n_hours) % 24
+    if day_of_week is None:
+        day_of_week = (np.arange(n_hours) // 24) % 7
+    return np.asarray(hour_of_day), np.asarray(day_of_week)
+
+
+def compute_bills(consumption, generation, tariffs, hour_of_day=None, day_of_week=None,
+                  chunk_size=1024, dtype="float32"):
+    """
+    Compute original and solar-offset bills for many homes under one or more tariffs.
+
+    The original bill prices all consumption as imported energy. The new bill only
+    prices the part of consumption not covered by generation, and exported surplus
+    earns the feed-in credit. Homes are processed in chunks so memory stays bounded
+    for large fleets, and each chunk is priced with a single matrix product.
+
+    :param consumption: Array (hours,) or (homes, hours) of consumption in kWh.
+    :param generation: Array with the same shape as ``consumption`` (kWh).
+    :param tariffs: A Tariff or a list of Tariffs (one per scenario).
+    :param hour_of_day: Optional hour for each column; defaults to a series starting at 00:00.
+    :param day_of_week: Optional weekday for each column; defaults to starting on Monday.
+    :param chunk_size: Number of homes priced at once.
+    :param dtype: Float type used for the energy arrays.
+    :return: Dict of arrays ``original_cost``, ``new_cost``, ``feed_in_credit`` and
+             ``net_cost``, shaped (homes,) for a single tariff or (scenarios, homes)
+             for a list of tariffs.
+    """
+    single = isinstance(tariffs, Tariff)
+    tariffs = [tariffs] if single else list(tariffs)
+    if not tariffs:
+        raise ValueError("At least one tariff is required.")
+
+    cons = _as_2d(consumption, dtype)
+    gen = _as_2d(generation, dtype)
+    if cons.shape != gen.shape:
+        raise ValueError("consumption and generation must have the same shape.")
+    n_homes, n_hours = cons.shape
+    hour_of_day, day_of_week = _default_calendar(n_hours, hour_of_day, day_of_week)
+
+    # (hours, scenarios) price matrix so each chunk is priced with one matmul
+    prices = np.stack([t.import_prices(hour_of_day, day_of_week) for t in tariffs], axis=1).astype(dtype)
+    feed_in = np.array([t.feed_in_rate for t in tariffs])
+
+    n_scen = len(tariffs)
+    original = np.empty((n_scen, n_homes))
+    new = np.empty((n_scen, n_homes))
+    credit = np.empty((n_scen, n_homes))
+
+    for lo in range(0, n_homes, chunk_size):
+        hi = min(lo + chunk_size, n_homes)
+        c = cons[lo:hi]
+        net = c - gen[lo:hi]
+        imports = np.clip(net, 0, None)
+        exported = np.clip(-net, 0, None).sum(axis=1, dtype="float64")
+
+        original[:, lo:hi] = (c @ prices).T
+        new[:, lo:hi] = (imports @ prices).T
+        credit[:, lo:hi] = feed_in[:, np.newaxis] * exported
+
+        for s, tariff in enumerate(tariffs):
+            if not tariff.tiers:
+                continue
+            starts = np.arange(0, n_hours, tariff.period_hours)
+            original[s, lo:hi] += tariff.tier_surcharge(np.add.reduceat(c, starts, axis=1, dtype="float64"))
+            new[s, lo:hi] += tariff.tier_surcharge(np.add.reduceat(imports, starts, axis=1, dtype="float64"))
+
+    result = {
+        "original_cost": original,
+        "new_cost": new,
+        "feed_in_credit": credit,
+        "net_cost": new - credit,
+    }
+    if single:
+        result = {k: v[0] for k, v in result.items()}
+    return result
+
+
+def hourly_bill(df, tariff, consumption_col="consumption_pred", generation_col="generation_pred"):
+    """
+    Compute per-hour and cumulative costs for one home's forecast.
+
+    :param df: DataFrame with a ``time`` column plus consumption and generation columns,
+               e.g. the output of ``predict_7days``.
+    :param tariff: Tariff to apply.
+    :return: DataFrame with time, original_cost, new_cost, feed_in_credit and the
+             cumulative original/new bill columns.
+    """
+    hour_of_day, day_of_week = calendar_from_times(df["time"])
+    cons = df[consumption_col].to_numpy(dtype="float64")[np.newaxis, :]
+    gen = df[generation_col].to_numpy(dtype="float64")[np.newaxis, :]
+    prices = tariff.import_prices(hour_of_day, day_of_week)
+    net = cons - gen
+    imports = np.clip(net, 0, None)
+
+    out = pd.DataFrame({"time": df["time"].to_numpy()})
+    out["original_cost"] = (cons * prices + tariff.hourly_tier_surcharge(cons))[0]
+    out["new_cost"] = (imports * prices + tariff.hourly_tier_surcharge(imports))[0]
+    out["feed_in_credit"] = (np.clip(-net, 0, None) * tariff.feed_in_rate)[0]
+    out["original_cumulative_cost"] = out["original_cost"].cumsum()
+    out["new_cumulative_cost"] = (out["new_cost"] - out["feed_in_credit"]).cumsum()
+    return out
+
+
+class BillAccumulator:
+    """
+    Running per-home bill fed by meter readings from the ingestion path.
+
+    Each reading updates the home's cumulative original cost, solar-offset cost and
+    feed-in credit in O(1), so "cost so far this billing period" never rescans
+    history. Billing periods are consecutive ``period_hours`` windows counted
+    from ``period_anchor``, the same for every home.
+
+    State is checkpointed to a JSON file by a background thread every
+    ``checkpoint_every`` readings or ``checkpoint_interval`` seconds, whichever
+    comes first, so the ingestion thread never serialises the homes itself. The
+    checkpoint records the tariff, and restoring it under a different tariff
+    raises ValueError instead of mixing prices.
+
+    A reading is a dict with ``home_id``, ``time`` (ISO string or epoch seconds),
+    ``consumption_kWh`` and optionally ``generation_kWh``.
+    """
+
+    # Layout of the per-home state list
+    PERIOD_START, ORIGINAL, NEW, FEED_IN, CONSUMED, IMPORTED, EXPORTED, READINGS = range(8)
+
+    def __init__(self, tariff=None, checkpoint_path=None, checkpoint_every=1000, checkpoint_interval=60.0,
+                 period_anchor=PERIOD_ANCHOR):
+        """
+        :param tariff: Active Tariff. Defaults to the flat DEFAULT_RATE tariff.
+        :param checkpoint_path: JSON file used to persist and restore state. None disables checkpoints.
+        :param checkpoint_every: Checkpoint after this many readings.
+        :param checkpoint_interval: Checkpoint at least this often (seconds) while readings arrive.
+        :param period_anchor: datetime at which a billing period starts.
+        """
+        self.tariff = tariff or Tariff()
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self.period_anchor = period_anchor.timestamp()
+
+        self.homes = {}
+        self.lock = threading.Lock()
+        # Serialises checkpoint writers so they never share the tmp file
+        self._checkpoint_lock = threading.Lock()
+        self._pending = 0
+        self._last_checkpoint = time.time()
+        self._wakeup = threading.Event()
+        self._closed = False
+
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            self.load_checkpoint()
+        if checkpoint_path:
+            self._checkpointer = threading.Thread(target=self._checkpoint_loop, name="bill-checkpoint", daemon=True)
+            self._checkpointer.start()
+
+    @staticmethod
+    def _parse_time(value):
+        if isinstance(value, (int, float)):
+            return datetime.fromtimestamp(value)
+        return datetime.fromisoformat(value)
+
+    def add_reading(self, home_id, when, consumption_kwh, generation_kwh=0.0):
+        """
+        Add one hourly reading for a home.
+
+        :param home_id: Home identifier.
+        :param when: datetime of the reading.
+        :param consumption_kwh: Energy consumed during the reading interval.
+        :param generation_kwh: Energy generated during the reading interval.
+        """
+        tariff = self.tariff
+        ts = when.timestamp()
+        price = tariff.price_at(when.hour, when.weekday())
+        net = consumption_kwh - generation_kwh
+        imported = net if net > 0 else 0.0
+        exported = -net if net < 0 else 0.0
+
+        with self.lock:
+            state = self.homes.get(home_id)
+            if state is None or ts >= state[self.PERIOD_START] + tariff.period_hours * 3600:
+                # New home or a new billing period: start fresh counters
+                period = tariff.period_hours * 3600
+                start = self.period_anchor + (ts - self.period_anchor) // period * period
+                state = [start, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0]
+                self.homes[home_id] = state
+
+            state[self.ORIGINAL] += consumption_kwh * price
+            state[self.NEW] += imported * price
+            if tariff.tiers:
+                state[self.ORIGINAL] += tariff.incremental_surcharge(state[self.CONSUMED], consumption_kwh)
+                state[self.NEW] += tariff.incremental_surcharge(state[self.IMPORTED], imported)
+            state[self.FEED_IN] += exported * tariff.feed_in_rate
+            state[self.CONSUMED] += consumption_kwh
+            state[self.IMPORTED] += imported
+            state[self.EXPORTED] += exported
+            state[self.READINGS] += 1
+            self._pending += 1
+            due = self._pending >= self.checkpoint_every
+
+        if due and self.checkpoint_path:
+            # Written by the checkpoint thread, not on the ingestion path
+            self._wakeup.set()
+
+    def on_reading(self, data):
+        """
+        Listener for DataCollectionAgent. Accepts a reading dict or a list of them and
+        ignores payloads that are not meter readings (e.g. weather forecasts).
+        """
+        records = data if isinstance(data, list) else [data]
+        for rec in records:
+            if not isinstance(rec, dict) or "home_id" not in rec or "consumption_kWh" not in rec:
+                continue
+            self.add_reading(
+                rec["home_id"],
+                self._parse_time(rec["time"]),
+                float(rec["consumption_kWh"]),
+                float(rec.get("generation_kWh", 0.0)),
+            )
+
+    def cost_so_far(self, home_id):
+        """
+        Return the bill for the current billing period of a home, or None if unknown.
+        """
+        with self.lock:
+            state = self.homes.get(home_id)
+            if state is None:
+                return None
+            state = list(state)
+        return {
+            "home_id": home_id,
+            "period_start": datetime.fromtimestamp(state[self.PERIOD_START]).isoformat(),
+            "original_cost": state[self.ORIGINAL],
+            "new_cost": state[self.NEW],
+            "feed_in_credit": state[self.FEED_IN],
+            "net_cost": state[self.NEW] - state[self.FEED_IN],
+            "consumption_kWh": state[self.CONSUMED],
+            "imported_kWh": state[self.IMPORTED],
+            "exported_kWh": state[self.EXPORTED],
+            "readings": state[self.READINGS],
+        }
+
+    def _checkpoint_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.checkpoint_interval)
+            self._wakeup.clear()
+            if self._closed:
+                return
+            if self._pending:
+                try:
+                    self.checkpoint()
+                except OSError as e:
+                    print(f"[Billing] Checkpoint failed: {e}")
+
+    def close(self):
+        """Stop the checkpoint thread and write a final checkpoint."""
+        if not self.checkpoint_path or self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._checkpointer.join()
+        self.checkpoint()
+
+    def checkpoint(self):
+        """Atomically write the current state to ``checkpoint_path``."""
+        if not self.checkpoint_path:
+            return
+        # Held from the snapshot to os.replace, so a later snapshot is never overwritten by an older one
+        with self._checkpoint_lock:
+            with self.lock:
+                snapshot = {home: list(state) for home, state in self.homes.items()}
+                self._pending = 0
+                self._last_checkpoint = saved_at = time.time()
+            tmp_path = self.checkpoint_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"saved_at": saved_at, "tariff": self.tariff.describe(), "homes": snapshot}, f)
+            os.replace(tmp_path, self.checkpoint_path)
+
+    def load_checkpoint(self):
+        """
+        Restore state from ``checkpoint_path``.
+        :raise ValueError: The checkpoint was written under a different tariff.
+        """
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        saved = snapshot.get("tariff")
+        if saved is not None and saved != self.tariff.describe():
+            raise ValueError(f"Bill checkpoint {self.checkpoint_path} was written under tariff "
+                             f"{saved.get('name')!r} with different prices; move it away to start new bills")
+        with self.lock:
+            self.homes = {home: list(state) for home, state in snapshot.get("homes", {}).items()}
+
+
+def _parse_tier(text):
+    threshold, surcharge = text.split(":")
+    return float(threshold), float(surcharge)
+
+
+def _plot_cumulative(bill_df, path):
+    # matplotlib stays optional; it is only needed for the --plot flag
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+
+    times = pd.to_datetime(bill_df["time"])
+    fig, ax = plt.subplots(figsize=(12, 6))
+    ax.plot(times, bill_df["original_cumulative_cost"], label="Cumulative Original Bill (CAD)",
+            color="darkgreen", marker="o")
+    ax.plot(times, bill_df["new_cumulative_cost"], label="Cumulative New Bill (CAD)",
+            color="orange", marker="o")
+    ax.set_title("Cumulative Electricity Bill (CAD)")
+    ax.set_xlabel("Time")
+    ax.set_ylabel("Cumulative Bill (CAD)")
+    ax.legend()
+    ax.xaxis.set_major_locator(mdates.HourLocator(interval=6))
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%m-%d %H:%M'))
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare the original and solar-offset electricity bill for a forecast CSV."
+    )
+    parser.add_argument("input", nargs="?", default="static/predicted_7days.csv",
+                        help="CSV with time, consumption_pred and generation_pred columns.")
+    parser.add_argument("-o", "--output", default="bill_comparison.csv",
+                        help="Where to write the hourly bill CSV.")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="Flat import price per kWh.")
+    parser.add_argument("--tou-rates", help="24 comma-separated hourly import prices.")
+    parser.add_argument("--tier", action="append", type=_parse_tier, default=[],
+                        help="Tier as THRESHOLD_KWH:SURCHARGE, may be repeated.")
+    parser.add_argument("--feed-in-rate", type=float, default=0.0, help="Credit per exported kWh.")
+    parser.add_argument("--period-hours", type=int, default=DEFAULT_PERIOD_HOURS,
+                        help="Billing period length in hours (tier reset).")
+    parser.add_argument("--plot", help="Optionally save the cumulative bill chart to this image file.")
+    args = parser.parse_args(argv)
+
+    tou_rates = [float(x) for x in args.tou_rates.split(",")] if args.tou_rates else None
+    tariff = Tariff(rate=args.rate, tou_rates=tou_rates, tiers=args.tier,
+                    feed_in_rate=args.feed_in_rate, period_hours=args.period_hours)
+
+    df = pd.read_csv(args.input)
+    bill_df = hourly_bill(df, tariff)
+    bill_df.to_csv(args.output, index=False, float_format="%.4f")
+
+    original = bill_df["original_cumulative_cost"].iloc[-1]
+    new = bill_df["new_cumulative_cost"].iloc[-1]
+    print(f"[Billing] Original bill: {original:.2f} CAD, with solar: {new:.2f} CAD, "
+          f"saving: {original - new:.2f} CAD")
+    print(f"[Billing] Hourly bill written to {args.output}")
+    if args.plot:
+        _plot_cumulative(bill_df, args.plot)
+        print(f"[Billing] Chart saved to {args.plot}")
+
+
+if __name__ == "__main__":
+    main()
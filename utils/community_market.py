@@ -0,0 +1,312 @@
+import argparse
+import json
+import time
+import numpy as np
+import pandas as pd
+
+from utils.billing import Tariff, DEFAULT_RATE, calendar_from_times
+
+
+class MarketScenario:
+    """
+    Parameters of one community market run.
+
+    Every hour, each home with surplus auctions it like an ``EnglishAuction``:
+    deficit homes bid, the highest bid wins if it reaches ``grid_price`` and
+    otherwise the ``Grid`` takes the energy at ``grid_price``. Buyers never pay
+    more than the import price of ``import_tariff``, the price they would pay
+    the grid instead.
+    """
+
+    def __init__(self, grid_price=0.05, import_tariff=None, start_price=0.0, bid_increment=0.01,
+                 extension_duration=300, total_duration=3600, bid_rate=1.0 / 60, strategy="english",
+                 name=None):
+        """
+        :param grid_price: Price per kWh the grid pays for surplus not sold to peers.
+        :param import_tariff: Tariff for energy bought from the grid (flat or time-of-use;
+                              tiers are not supported). Defaults to Tariff(DEFAULT_RATE).
+        :param start_price: Auction start price.
+        :param bid_increment: Amount each new bid raises the price by.
+        :param extension_duration: Seconds without a new bid after which an auction ends.
+        :param total_duration: Maximum auction length in seconds.
+        :param bid_rate: Bids per second a competing buyer places while outbid.
+        :param strategy: Name in STRATEGIES or a callable strategy(scenario, open_price,
+                         retail, buyers, sellers) returning the clearing price per hour.
+        :param name: Optional label used in reports.
+        """
+        self.grid_price = float(grid_price)
+        self.import_tariff = import_tariff or Tariff(DEFAULT_RATE)
+        if self.import_tariff.tiers:
+            raise ValueError("Tiered import tariffs are not supported by the market simulator.")
+        self.start_price = float(start_price)
+        self.bid_increment = float(bid_increment)
+        self.extension_duration = float(extension_duration)
+        self.total_duration = float(total_duration)
+        self.bid_rate = float(bid_rate)
+        self.strategy = strategy
+        self.name = name or f"{strategy if isinstance(strategy, str) else 'custom'}-g{grid_price}-e{extension_duration}"
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "grid_price": self.grid_price,
+            "import_tariff": self.import_tariff.name,
+            "start_price": self.start_price,
+            "bid_increment": self.bid_increment,
+            "extension_duration": self.extension_duration,
+            "total_duration": self.total_duration,
+            "bid_rate": self.bid_rate,
+            "strategy": self.strategy if isinstance(self.strategy, str) else "custom",
+        }
+
+
+# ---------- pricing strategies ----------
+# 输入均为每小时的数组: open_price 开拍价, retail 买方的电网购电价, buyers/sellers 缺电/余电的家庭数
+
+def english_price(scenario, open_price, retail, buyers, sellers):
+    """
+    Expected final price of an English auction with extensions.
+
+    Each lot has buyers/sellers competing bidders. While outbid, the other
+    bidders together bid at rate (competitors - 1) * bid_rate; the auction ends
+    when no bid arrives within ``extension_duration``, when the price would
+    pass the buyers' import price, or after ``total_duration``. With
+    continuation probability p and at most K raises, the expected number of
+    raises is p(1 - p^K) / (1 - p).
+    """
+    competitors = np.divide(buyers, sellers, out=np.zeros(buyers.shape), where=sellers > 0)
+    rival_rate = np.clip(competitors - 1.0, 0.0, None) * scenario.bid_rate
+    p = -np.expm1(-rival_rate * scenario.extension_duration)
+    k_price = np.floor(np.clip(retail - open_price, 0.0, None) / scenario.bid_increment)
+    k = np.minimum(k_price, np.floor(rival_rate * scenario.total_duration))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        raises = np.where(p < 1.0, p * (1.0 - p ** k) / (1.0 - p), k)
+    return open_price + scenario.bid_increment * np.nan_to_num(raises)
+
+
+def midpoint_price(scenario, open_price, retail, buyers, sellers):
+    """Split the gap between the grid price and the import price evenly."""
+    return (open_price + retail) / 2.0
+
+
+def open_price_only(scenario, open_price, retail, buyers, sellers):
+    """Every lot sells at its opening bid; buyers keep the whole gain."""
+    return np.asarray(open_price, dtype="float64") + np.zeros(retail.shape)
+
+
+STRATEGIES = {
+    "english": english_price,
+    "midpoint": midpoint_price,
+    "open": open_price_only,
+}
+
+
+# ---------- fleet ----------
+
+def fleet_from_forecasts(frames, consumption_col="consumption_pred", generation_col="generation_pred"):
+    """
+    Stack per-home forecasts (e.g. ``predict_7days`` outputs covering the same hours).
+
+    :param frames: List of DataFrames with ``time``, consumption and generation columns.
+    :return: (consumption, generation, times), arrays shaped (homes, hours).
+    """
+    cons = np.stack([f[consumption_col].to_numpy(dtype="float32") for f in frames])
+    gen = np.stack([f[generation_col].to_numpy(dtype="float32") for f in frames])
+    return cons, gen, frames[0]["time"].to_numpy()
+
+
+def synthetic_fleet(forecast_df, n_homes, n_hours=8760, pv_share=0.6, noise=0.1, seed=0,
+                    consumption_col="consumption_pred", generation_col="generation_pred"):
+    """
+    Build a fleet from one home's forecast: the profile is repeated to ``n_hours`` and
+    scaled per home (household size, PV system size, ``pv_share`` of homes with PV)
+    with multiplicative hourly noise.
+
+    :return: (consumption, generation, times), float32 arrays shaped (homes, hours).
+    """
+    rng = np.random.default_rng(seed)
+    base_cons = forecast_df[consumption_col].to_numpy(dtype="float32")
+    base_gen = forecast_df[generation_col].to_numpy(dtype="float32")
+    reps = -(-n_hours // len(base_cons))
+    base_cons = np.tile(base_cons, reps)[:n_hours]
+    base_gen = np.tile(base_gen, reps)[:n_hours]
+
+    size = rng.lognormal(0.0, 0.3, (n_homes, 1)).astype("float32")
+    pv = (rng.uniform(0.5, 2.5, (n_homes, 1)) * (rng.random((n_homes, 1)) < pv_share)).astype("float32")
+    cons = base_cons * size * rng.normal(1.0, noise, (n_homes, n_hours)).clip(0.0, None).astype("float32")
+    gen = base_gen * pv * rng.normal(1.0, noise, (n_homes, n_hours)).clip(0.0, None).astype("float32")
+
+    start = pd.Timestamp(forecast_df["time"].iloc[0])
+    times = pd.date_range(start, periods=n_hours, freq="h").strftime("%Y-%m-%d %H:%M").to_numpy()
+    return cons, gen, times
+
+
+# ---------- simulation ----------
+
+def simulate_market(consumption, generation, scenarios, hour_of_day=None, day_of_week=None,
+                    chunk_size=1024, per_home=False):
+    """
+    Clear the community market for every hour and compare with grid-only trading.
+
+    Per hour, the traded volume is min(total surplus, total deficit). It is shared
+    pro rata: every seller sells the same fraction of its surplus to peers (the rest
+    goes to the grid at ``grid_price``) and every buyer covers the same fraction of
+    its deficit from peers (the rest is imported at the tariff). Because a home's
+    cost is linear in its hourly surplus and deficit, all scenarios are priced at
+    once with two matrix products per chunk of homes.
+
+    :param consumption: Array (homes, hours) in kWh.
+    :param generation: Array (homes, hours) in kWh.
+    :param scenarios: A MarketScenario or a list of them.
+    :param hour_of_day: Optional hour for each column; defaults to a series starting at 00:00.
+    :param day_of_week: Optional weekday for each column; defaults to starting on Monday.
+    :param chunk_size: Number of homes processed at once.
+    :param per_home: Also return the per-home costs.
+    :return: List of result dicts, one per scenario.
+    """
+    scenarios = [scenarios] if isinstance(scenarios, MarketScenario) else list(scenarios)
+    cons = np.atleast_2d(np.asarray(consumption, dtype="float32"))
+    gen = np.atleast_2d(np.asarray(generation, dtype="float32"))
+    if cons.shape != gen.shape:
+        raise ValueError("consumption and generation must have the same shape.")
+    n_homes, n_hours = cons.shape
+    if hour_of_day is None:
+        hour_of_day = np.arange(n_hours) % 24
+    if day_of_week is None:
+        day_of_week = (np.arange(n_hours) // 24) % 7
+
+    # 1) 每小时的总余电/缺电量和家庭数, 与场景无关, 只算一次
+    supply = np.zeros(n_hours)
+    demand = np.zeros(n_hours)
+    sellers = np.zeros(n_hours)
+    buyers = np.zeros(n_hours)
+    for lo in range(0, n_homes, chunk_size):
+        net = cons[lo:lo + chunk_size] - gen[lo:lo + chunk_size]
+        supply += np.clip(-net, 0, None).sum(axis=0, dtype="float64")
+        demand += np.clip(net, 0, None).sum(axis=0, dtype="float64")
+        sellers += (net < 0).sum(axis=0)
+        buyers += (net > 0).sum(axis=0)
+    traded = np.minimum(supply, demand)
+    sell_share = np.divide(traded, supply, out=np.zeros(n_hours), where=supply > 0)
+    buy_share = np.divide(traded, demand, out=np.zeros(n_hours), where=demand > 0)
+
+    # 2) 每个场景: 成交价和每 kWh 缺电/余电的价值 => (hours, scenarios) 权重矩阵
+    n_scen = len(scenarios)
+    w_deficit = np.empty((n_hours, 2 * n_scen))
+    w_surplus = np.empty((n_hours, 2 * n_scen))
+    prices = np.zeros((n_scen, n_hours))
+    traded_kwh = np.zeros(n_scen)
+    # 成交价只在买卖双方之间转移收益: 社区总节省与价格无关, 价格决定分配
+    buyer_savings = np.zeros(n_scen)
+    seller_gain = np.zeros(n_scen)
+    for s, sc in enumerate(scenarios):
+        retail = sc.import_tariff.import_prices(hour_of_day, day_of_week).astype("float64")
+        open_price = max(sc.start_price, sc.grid_price)
+        strategy = STRATEGIES[sc.strategy] if isinstance(sc.strategy, str) else sc.strategy
+        price = np.minimum(strategy(sc, open_price, retail, buyers, sellers), retail)
+        # 和 EnglishAuction 一样: 价格达不到 grid_price (或高于买方的电网价) 时卖给电网
+        trades = (traded > 0) & (price >= sc.grid_price) & (retail > open_price)
+        fs = np.where(trades, sell_share, 0.0)
+        fb = np.where(trades, buy_share, 0.0)
+        prices[s] = np.where(trades, price, np.nan)
+        traded_kwh[s] = traded[trades].sum()
+        buyer_savings[s] = (traded * (retail - price))[trades].sum()
+        seller_gain[s] = (traded * (price - sc.grid_price))[trades].sum()
+
+        # 列 s: 电网方案, 列 n_scen + s: 社区市场
+        w_deficit[:, s] = retail
+        w_surplus[:, s] = sc.grid_price
+        w_deficit[:, n_scen + s] = fb * price + (1.0 - fb) * retail
+        w_surplus[:, n_scen + s] = fs * price + (1.0 - fs) * sc.grid_price
+
+    # 3) 成本 = 缺电 @ 买价 - 余电 @ 卖价, 按家庭分块
+    w_deficit = w_deficit.astype("float32")
+    w_surplus = w_surplus.astype("float32")
+    costs = np.empty((n_homes, 2 * n_scen))
+    for lo in range(0, n_homes, chunk_size):
+        net = cons[lo:lo + chunk_size] - gen[lo:lo + chunk_size]
+        costs[lo:lo + chunk_size] = (np.clip(net, 0, None) @ w_deficit - np.clip(-net, 0, None) @ w_surplus)
+
+    results = []
+    for s, sc in enumerate(scenarios):
+        grid_only = costs[:, s]
+        market = costs[:, n_scen + s]
+        savings = grid_only - market
+        res = {
+            "scenario": sc.to_dict(),
+            "homes": n_homes,
+            "hours": n_hours,
+            "grid_only_cost": float(grid_only.sum()),
+            "market_cost": float(market.sum()),
+            "savings": float(savings.sum()),
+            "savings_pct": float(100.0 * savings.sum() / grid_only.sum()) if grid_only.sum() else 0.0,
+            "buyer_savings": float(buyer_savings[s]),
+            "seller_gain": float(seller_gain[s]),
+            "traded_kWh": float(traded_kwh[s]),
+            "surplus_kWh": float(supply.sum()),
+            "deficit_kWh": float(demand.sum()),
+            "trading_hours": int(np.count_nonzero(~np.isnan(prices[s]))),
+            "mean_price": float(np.nanmean(prices[s])) if traded_kwh[s] else None,
+            "homes_better_off": int(np.count_nonzero(savings > 1e-9)),
+            "homes_worse_off": int(np.count_nonzero(savings < -1e-9)),
+        }
+        if per_home:
+            res["grid_only_costs"] = grid_only
+            res["market_costs"] = market
+        results.append(res)
+    return results
+
+
+def scenario_grid(grid_prices, extension_durations, strategies, import_tariff=None, **kwargs):
+    """:return: One MarketScenario per combination of the given values."""
+    return [
+        MarketScenario(grid_price=g, extension_duration=e, strategy=st, import_tariff=import_tariff, **kwargs)
+        for st in strategies for g in grid_prices for e in extension_durations
+    ]
+
+
+def _floats(text):
+    return [float(v) for v in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a community P2P energy market driven by forecasts.")
+    parser.add_argument("forecast_csv", nargs="+",
+                        help="predict_7days output(s); one file is expanded into a synthetic fleet")
+    parser.add_argument("--homes", type=int, default=1000, help="Fleet size when a single forecast is given")
+    parser.add_argument("--hours", type=int, default=8760, help="Simulated hours when a single forecast is given")
+    parser.add_argument("--pv-share", type=float, default=0.6, help="Share of synthetic homes with solar")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--grid-price", type=_floats, default=[0.05], help="Comma separated grid prices")
+    parser.add_argument("--extension", type=_floats, default=[300.0], help="Comma separated extension durations (s)")
+    parser.add_argument("--strategy", default="english", help="Comma separated pricing strategies")
+    parser.add_argument("--import-rate", type=float, default=DEFAULT_RATE, help="Flat grid import price")
+    parser.add_argument("--tou-rates", type=_floats, default=None, help="24 comma separated hourly import prices")
+    parser.add_argument("-o", "--output", default=None, help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    frames = [pd.read_csv(path) for path in args.forecast_csv]
+    if len(frames) == 1:
+        cons, gen, times = synthetic_fleet(frames[0], args.homes, args.hours, args.pv_share, seed=args.seed)
+    else:
+        cons, gen, times = fleet_from_forecasts(frames)
+    hour_of_day, day_of_week = calendar_from_times(times)
+
+    tariff = Tariff(args.import_rate, tou_rates=args.tou_rates, name="import")
+    scenarios = scenario_grid(args.grid_price, args.extension, args.strategy.split(","), tariff)
+    start = time.perf_counter()
+    results = simulate_market(cons, gen, scenarios, hour_of_day, day_of_week)
+    elapsed = time.perf_counter() - start
+
+    for res in results:
+        print(f"[CommunityMarket] {res['scenario']['name']}: savings={res['savings']:.2f} "
+              f"({res['savings_pct']:.1f}%, buyers {res['buyer_savings']:.2f} / sellers {res['seller_gain']:.2f}), traded={res['traded_kWh']:.0f} kWh, mean price={res['mean_price'] or 0:.4f}")
+    print(f"[CommunityMarket] {cons.shape[0]} homes x {cons.shape[1]} hours x {len(scenarios)} scenarios "
+          f"in {elapsed:.2f}s")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import gc
+import json
+import os
+import threading
+import time
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+SNAPSHOT_FILE = "snapshot.json"
+
+
+class EventLog:
+    """
+    Append-only event log with group commit, segment rotation and snapshots.
+
+    ``append`` only assigns a sequence number and buffers the record, so callers
+    never wait for disk I/O. A background thread writes the buffer in one
+    ``write`` (and optionally one ``fsync``) every ``flush_every`` events or
+    ``flush_interval_ms`` milliseconds, whichever comes first. Records are JSON
+    lines ``[seq, record]`` in segment files named after their first sequence
+    number; a new segment starts once the current one exceeds ``segment_bytes``.
+
+    A snapshot stores the full state at a sequence number. Recovery loads the
+    snapshot and replays only the records after it; segments fully covered by
+    the snapshot are deleted. Events buffered but not yet flushed when the
+    process dies are lost, which bounds the loss window to one flush interval.
+    """
+
+    def __init__(self, directory, flush_every=256, flush_interval_ms=50,
+                 segment_bytes=16 * 1024 * 1024, fsync=True,
+                 snapshot_provider=None, snapshot_every=100000):
+        """
+        :param directory: Directory holding the segments and the snapshot.
+        :param flush_every: Flush as soon as this many events are buffered.
+        :param flush_interval_ms: Flush buffered events at least this often.
+        :param segment_bytes: Rotate to a new segment after this many bytes.
+        :param fsync: Whether each group commit is fsynced.
+        :param snapshot_provider: Optional callable returning (seq, state); called from the
+                                  background thread every ``snapshot_every`` events. ``seq``
+                                  must be on disk already, i.e. the value ``sync()`` returned
+                                  while no event could change the state.
+        :param snapshot_every: Number of events between automatic snapshots.
+        """
+        self.directory = directory
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.snapshot_provider = snapshot_provider
+        self.snapshot_every = snapshot_every
+
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        # Serialises writers so batches reach the file in sequence order
+        self.write_lock = threading.Lock()
+        self.buffer = []
+        self.snapshot_seq = self._read_snapshot_seq()
+        # A snapshot may be ahead of the segments if it was written just before a
+        # crash; numbering must continue after it or replay would skip new records
+        self.last_seq = max(self._recover_last_seq(), self.snapshot_seq)
+        self.flushed_seq = self.last_seq
+
+        self._file = None
+        self._file_size = 0
+        self._closed = False
+        self._flusher = threading.Thread(target=self._run, daemon=True)
+        self._flusher.start()
+
+    # ---------- segments ----------
+
+    def _segments(self):
+        names = [n for n in os.listdir(self.directory)
+                 if n.startswith(SEGMENT_PREFIX) and n.endswith(SEGMENT_SUFFIX)]
+        return sorted(names)
+
+    def _segment_first_seq(self, name):
+        return int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+    def _recover_last_seq(self):
+        """Find the last complete record on disk, dropping a torn trailing write."""
+        segments = self._segments()
+        if not segments:
+            return 0
+        path = os.path.join(self.directory, segments[-1])
+        with open(path, "rb") as f:
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            with open(path, "r+b") as f:
+                f.truncate(end)
+        lines = data[:end].splitlines()
+        if lines:
+            return json.loads(lines[-1])[0]
+        return self._segment_first_seq(segments[-1]) - 1
+
+    def _open_segment(self, first_seq, resume=False):
+        if self._file is not None:
+            self._file.close()
+        segments = self._segments()
+        if resume and segments:
+            # Keep appending to the newest segment after a restart
+            path = os.path.join(self.directory, segments[-1])
+        else:
+            path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{first_seq:020d}{SEGMENT_SUFFIX}")
+        self._file = open(path, "ab")
+        self._file_size = self._file.tell()
+
+    # ---------- writing ----------
+
+    def append(self, record):
+        """
+        Buffer a record for the next group commit.
+        :param record: JSON-serialisable event.
+        :return: The sequence number assigned to the record.
+        """
+        with self.lock:
+            if self._closed:
+                raise RuntimeError("EventLog is closed")
+            self.last_seq += 1
+            self.buffer.append((self.last_seq, record))
+            if len(self.buffer) >= self.flush_every:
+                self.cond.notify()
+            return self.last_seq
+
+    def _write_batch(self, batch):
+        if self._file is None:
+            self._open_segment(batch[0][0], resume=True)
+        elif self._file_size >= self.segment_bytes:
+            self._open_segment(batch[0][0])
+        data = "".join(json.dumps([seq, rec], separators=(",", ":")) + "\n" for seq, rec in batch).encode("utf-8")
+        self._file.write(data)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._file_size += len(data)
+
+    def sync(self):
+        """
+        Write every buffered record now, without taking a snapshot.
+        :return: The sequence number of the last record on disk.
+        """
+        with self.write_lock:
+            with self.lock:
+                batch, self.buffer = self.buffer, []
+            if batch:
+                self._write_batch(batch)
+                self.flushed_seq = batch[-1][0]
+            return self.flushed_seq
+
+    def flush(self):
+        """Write every buffered record now (called by the background thread and on close)."""
+        self.sync()
+        if (self.snapshot_provider is not None
+                and self.flushed_seq - self.snapshot_seq >= self.snapshot_every):
+            seq, state = self.snapshot_provider()
+            self.write_snapshot(seq, state)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if not self.buffer and not self._closed:
+                    self.cond.wait()
+                if self._closed:
+                    return
+                if len(self.buffer) < self.flush_every:
+                    # Group commit: give concurrent appends a short window to join
+                    self.cond.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[EventLog] Flush failed: {e}")
+                time.sleep(self.flush_interval)
+
+    def close(self):
+        with self.lock:
+            self._closed = True
+            self.cond.notify()
+        self._flusher.join()
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # ---------- snapshots & recovery ----------
+
+    def _read_snapshot_seq(self):
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if not os.path.exists(path):
+            return 0
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["seq"]
+
+    def write_snapshot(self, seq, state):
+        """
+        Atomically store ``state`` as of ``seq`` and delete segments it fully covers.
+        """
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            # dumps + one write uses the C encoder; json.dump streams through the slow Python one
+            f.write(json.dumps({"seq": seq, "saved_at": time.time(), "state": state}, separators=(",", ":")))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self.snapshot_seq = seq
+
+        segments = self._segments()
+        for name, nxt in zip(segments, segments[1:]):
+            # A segment ends right before the next one starts
+            if self._segment_first_seq(nxt) - 1 <= seq:
+                os.remove(os.path.join(self.directory, name))
+
+    def load_snapshot(self):
+        """
+        :return: (seq, state) of the latest snapshot, or (0, None) if there is none.
+        """
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if not os.path.exists(path):
+            return 0, None
+        with open(path, "r", encoding="utf-8") as f:
+            snap = json.load(f)
+        return snap["seq"], snap["state"]
+
+    def replay(self, after_seq=0):
+        """
+        Yield (seq, record) for every flushed record with seq > after_seq, in order.
+        """
+        for name in self._segments():
+            with open(os.path.join(self.directory, name), "rb") as f:
+                data = f.read()
+            if not data:
+                continue
+            # Parse a whole segment at once, much faster than one json.loads per line
+            records = json.loads(b"[" + data.rstrip(b"\n").replace(b"\n", b",") + b"]")
+            for seq, rec in records:
+                if seq > after_seq:
+                    yield seq, rec
+
+    def recover(self, apply, load_state=None):
+        """
+        Rebuild state: load the snapshot, then apply every later record.
+
+        :param apply: Called with each record after the snapshot.
+        :param load_state: Called with the snapshot state, if there is one.
+        :return: (number of records replayed, seconds taken).
+        """
+        start = time.perf_counter()
+        # Loading creates millions of small objects that all survive; the cyclic
+        # GC would rescan them again and again, so it is paused until done.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            seq, state = self.load_snapshot()
+            if state is not None and load_state is not None:
+                load_state(state)
+            count = 0
+            for _, rec in self.replay(after_seq=seq):
+                apply(rec)
+                count += 1
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        return count, time.perf_counter() - start
@@ -0,0 +1,174 @@
+"""
+Non-blocking structured logging for the agents' hot paths.
+
+Loggers from get_logger() hand their records to a bounded queue; a background
+QueueListener thread formats them and writes them out, so the MQTT thread never
+blocks on stdout. Messages take ``%s`` arguments, which are only formatted when
+the level is enabled (e.g. whole DataFrames at DEBUG), and structured fields go
+in ``extra``:
+
+    logger = log.get_logger("DataCollectionAgent")
+    logger.info("Received MQTT data", extra={"topic": topic, "bytes": 512})
+    logger.debug("Payload: %s", data)
+
+Per-message events can additionally be sampled with sampler("mqtt.message").
+
+Configuration (environment):
+
+- ``LOG_LEVEL``: DEBUG, INFO (default), WARNING, ...
+- ``LOG_FORMAT``: ``text`` (default, ``[Agent] message key=value``) or ``json`` (one object per line).
+- ``LOG_SAMPLE``: per-event sample rates, e.g. ``mqtt.message=0.01,prediction=0.1`` (default 1).
+- ``LOG_QUEUE_SIZE``: records buffered before new ones are dropped (default 10000).
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+
+from utils import metrics
+
+ROOT = "home_energy"
+
+DROPPED = metrics.counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+QUEUE_SIZE = metrics.gauge("log_queue_size", "Log records waiting for the background writer")
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "agent"}
+
+_lock = threading.Lock()
+_listener = None
+
+
+def _fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS}
+
+
+class TextFormatter(logging.Formatter):
+    """``2025-01-01 12:00:00,000 INFO [DataCollectionAgent] Received MQTT data topic=energy_data bytes=512``"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(agent)s] %(message)s")
+
+    def format(self, record):
+        record.agent = record.name.rpartition(".")[2]
+        text = super().format(record)
+        fields = _fields(record)
+        if fields:
+            text += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return text
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, the extra fields and the exception."""
+
+    def format(self, record):
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name.rpartition(".")[2],
+            "message": record.getMessage(),
+            **_fields(record),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full."""
+
+    def prepare(self, record):
+        # QueueHandler.prepare() formats the message on the calling thread and drops
+        # exc_info; the listener formats instead, so only a shallow copy is queued
+        return copy.copy(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc()
+
+
+def setup(level=None, fmt=None, stream=None, queue_size=None):
+    """
+    Route the agents' loggers through a queue to a background writer. Called by
+    get_logger() with the environment settings; calling it again reconfigures.
+    :param level: Log level name or number (default LOG_LEVEL or INFO).
+    :param fmt: "text" or "json" (default LOG_FORMAT or text).
+    :param stream: Output stream (default sys.stdout).
+    :param queue_size: Capacity of the record queue (default LOG_QUEUE_SIZE or 10000).
+    :return: The QueueListener (stop() flushes the queue).
+    """
+    global _listener
+    level = level or os.environ.get("LOG_LEVEL", "INFO")
+    fmt = fmt or os.environ.get("LOG_FORMAT", "text")
+    queue_size = queue_size or int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+    writer = logging.StreamHandler(stream or sys.stdout)
+    writer.setFormatter(JSONFormatter() if fmt == "json" else TextFormatter())
+    records = queue.Queue(queue_size)
+    QUEUE_SIZE.set_function(records.qsize)
+
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+        root = logging.getLogger(ROOT)
+        root.handlers = [DroppingQueueHandler(records)]
+        root.setLevel(level.upper() if isinstance(level, str) else level)
+        # The agents' records are written here only, not again by the root logger
+        root.propagate = False
+        _listener = logging.handlers.QueueListener(records, writer)
+        _listener.start()
+    return _listener
+
+
+def shutdown():
+    """Write out the queued records and stop the background writer."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+atexit.register(shutdown)
+
+
+def get_logger(name):
+    """
+    :param name: Agent name, shown as ``[name]`` in the text format.
+    :return: A logging.Logger writing through the background queue.
+    """
+    if _listener is None:
+        setup()
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+def _sample_rates(spec):
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        event, _, rate = item.partition("=")
+        rates[event.strip()] = float(rate)
+    return rates
+
+
+class Sampler:
+    """Callable that returns True for a ``rate`` share of calls, to sample per-message log events."""
+    __slots__ = ("rate",)
+
+    def __init__(self, rate=1.0):
+        self.rate = rate
+
+    def __call__(self):
+        return self.rate >= 1.0 or (self.rate > 0 and random.random() < self.rate)
+
+
+def sampler(event, default=1.0):
+    """:return: Sampler for ``event`` with the rate set in LOG_SAMPLE, else ``default``."""
+    return Sampler(_sample_rates(os.environ.get("LOG_SAMPLE", "")).get(event, default))
@@ -0,0 +1,251 @@
+import bisect
+import math
+import threading
+import time
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Default latency buckets in seconds (1 ms .. 30 s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Buckets for payload sizes in bytes (64 B .. 1 MB)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class _Metric:
+    """
+    Base class of the metric types. A metric with ``labelnames`` keeps one child
+    per combination of label values (``labels(...)``); without labels the metric
+    is its own single child. Updates take one lock, so metrics can be left on in
+    hot paths.
+    """
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.children = {}
+        self.function = None
+        if not self.labelnames:
+            self._init_child()
+
+    def _init_child(self):
+        raise NotImplementedError
+
+    def _new(self):
+        child = object.__new__(type(self))
+        child.lock = self.lock
+        child._init_child()
+        return child
+
+    def labels(self, *values):
+        """:return: The child for these label values (positional, in ``labelnames`` order)."""
+        key = tuple(str(v) for v in values)
+        child = self.children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self.lock:
+                child = self.children.setdefault(key, self._new())
+        return child
+
+    def set_function(self, func):
+        """Report func() at collection time instead of a stored value (unlabelled metrics only)."""
+        self.function = func
+
+    def _series(self):
+        if not self.labelnames:
+            return [((), self)]
+        return sorted(self.children.items())
+
+    def collect(self):
+        """:return: Dict with name, type, help and samples [[sample name, labels dict, value]]."""
+        samples = []
+        for values, child in self._series():
+            labels = dict(zip(self.labelnames, values))
+            samples.extend(child._samples(self.name, labels))
+        return {"name": self.name, "type": self.kind, "help": self.documentation, "samples": samples}
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. messages received."""
+    kind = "counter"
+
+    def _init_child(self):
+        self.value = 0.0
+        self.function = None
+
+    def inc(self, amount=1.0):
+        with self.lock:
+            self.value += amount
+
+    def _samples(self, name, labels):
+        value = self.function() if self.function is not None else self.value
+        return [[name, labels, value]]
+
+
+class Gauge(Counter):
+    """Value that goes up and down, e.g. queue length."""
+    kind = "gauge"
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+
+    def dec(self, amount=1.0):
+        self.inc(-amount)
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values in cumulative buckets (Prometheus histogram).
+    Observing costs a binary search over the bucket bounds and one locked update.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new(self):
+        # Children share the lock and bucket bounds of their parent
+        child = object.__new__(type(self))
+        child.lock = self.lock
+        child.buckets = self.buckets
+        child._init_child()
+        return child
+
+    def _init_child(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def time(self):
+        """Context manager observing the seconds spent in its block."""
+        return _Timer(self)
+
+    def _samples(self, name, labels):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            samples.append([name + "_bucket", dict(labels, le=_format_value(bound)), cumulative])
+        samples.append([name + "_sum", labels, total])
+        samples.append([name + "_count", labels, cumulative])
+        return samples
+
+
+class Registry:
+    """Named metrics of one process, rendered together for a /metrics endpoint."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def get_or_create(self, cls, name, documentation, labelnames=(), **kwargs):
+        """
+        Return the metric registered under ``name``, creating it on first use, so
+        modules can declare their metrics at import time without coordination.
+        """
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif type(metric) is not cls or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} already registered as a different {metric.kind}")
+        return metric
+
+    def collect(self):
+        """:return: List of metric families (JSON-serialisable, see _Metric.collect)."""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return [m.collect() for m in metrics]
+
+    def render(self):
+        return render_text(self.collect())
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_text(families):
+    """Render metric families in the Prometheus text exposition format."""
+    lines = []
+    for fam in families:
+        lines.append(f"# HELP {fam['name']} {fam['help']}")
+        lines.append(f"# TYPE {fam['name']} {fam['type']}")
+        for name, labels, value in fam["samples"]:
+            if labels:
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+            else:
+                lines.append(f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def merge_families(parts, label, values):
+    """
+    Merge the families collected in several processes, adding ``label`` to every sample.
+    :param parts: List of Registry.collect() results.
+    :param values: Label value for each part (e.g. the worker index).
+    """
+    merged = {}
+    for families, value in zip(parts, values):
+        for fam in families:
+            target = merged.setdefault(fam["name"], dict(fam, samples=[]))
+            target["samples"].extend([name, dict(labels, **{label: str(value)}), v]
+                                     for name, labels, v in fam["samples"])
+    return list(merged.values())
+
+
+# Process-wide registry: run.py hosts every agent in one process, so each
+# /metrics endpoint reports all of them
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.get_or_create(Counter, name, documentation, labelnames)
+
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.get_or_create(Gauge, name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
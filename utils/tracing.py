@@ -0,0 +1,370 @@
+"""
+Opt-in tracing and profiling of the ingest-to-forecast pipeline.
+
+A trace starts for an MQTT message in DataCollectionAgent.on_message and
+collects the spans opened further down the same call chain (listener,
+json_to_dataframe, predict_7days and its stages, dataframe_to_json). Sampled
+traces are appended to a JSONL file, one line per message, and their span
+durations are also reported as the ``pipeline_span_seconds`` histogram.
+
+Profiling runs a sampled share of the traced messages under cProfile and
+dumps the accumulated statistics to a pstats file (``python -m pstats``,
+snakeviz).
+
+Everything is controlled without code changes:
+
+- ``PIPELINE_TRACE_SAMPLE``: share of messages traced (0..1, default 0 = off).
+- ``PIPELINE_TRACE_OUTPUT``: trace file (default ./static/pipeline_traces.jsonl).
+- ``PIPELINE_PROFILE``: 1 to profile from the start (default 0).
+- ``PIPELINE_PROFILE_SAMPLE``: share of messages profiled while profiling (default 0.1).
+- ``PIPELINE_PROFILE_OUTPUT``: pstats file (default ./static/pipeline.prof).
+- ``kill -USR1 <pid>`` toggles tracing, ``kill -USR2 <pid>`` toggles profiling
+  (the statistics are dumped when it is switched off), once
+  install_signal_handlers() ran in the main thread (run.py does). The handlers
+  only flip flags; the message and the dump follow within a second, outside
+  the signal handler.
+
+While both are off, trace(), span() and stages() return a shared no-op object.
+"""
+import contextvars
+import cProfile
+import itertools
+import json
+import os
+import random
+import signal
+import threading
+import time
+
+from utils import metrics
+
+SPAN_SECONDS = metrics.histogram("pipeline_span_seconds", "Duration of traced pipeline spans", ["span"])
+
+_current = contextvars.ContextVar("pipeline_trace", default=None)
+# Innermost open span; a context variable so that concurrent listeners (asyncio
+# tasks, executor threads) each nest their spans correctly
+_open_span = contextvars.ContextVar("pipeline_span", default=None)
+
+
+class _Noop:
+    """Returned while tracing is off or outside a trace: every operation does nothing."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def lap(self, stage):
+        pass
+
+    def skip(self):
+        pass
+
+    def close(self):
+        pass
+
+
+NOOP = _Noop()
+
+
+class _Span:
+    __slots__ = ("trace", "name", "attrs", "parent", "start", "token")
+
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.parent = _open_span.get()
+        self.token = _open_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.trace.add(self.name, self.start, end - self.start, self.parent, self.attrs)
+        _open_span.reset(self.token)
+        return False
+
+
+class _Stages:
+    """
+    Lap timer for the stages of a loop (e.g. one forecast hour): lap(stage) adds the
+    time since the previous lap to that stage; close() records one span per stage
+    with its total duration and count, under the span that was open at creation.
+    """
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+        self.parent = _open_span.get()
+        self.totals = {}
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        total = self.totals.get(stage)
+        if total is None:
+            total = self.totals[stage] = [0.0, 0, self.last]
+        total[0] += now - self.last
+        total[1] += 1
+        self.last = now
+
+    def skip(self):
+        """Do not count the time since the previous lap."""
+        self.last = time.perf_counter()
+
+    def close(self):
+        for stage, (seconds, count, first) in self.totals.items():
+            self.trace.add(f"{self.name}.{stage}", first, seconds, self.parent, {"count": count})
+        self.totals = {}
+
+
+class _Trace:
+    __slots__ = ("tracer", "trace_id", "root", "spans", "record", "profiler", "token")
+
+    def __init__(self, tracer, trace_id, name, attrs, record, profiler):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.spans = []
+        self.record = record
+        self.profiler = profiler
+        self.root = _Span(self, name, attrs)
+
+    def add(self, name, start, seconds, parent, attrs):
+        if self.record:
+            self.spans.append((name, start, seconds, parent.name if parent is not None else None, attrs))
+
+    def set(self, **attrs):
+        self.root.set(**attrs)
+
+    def __enter__(self):
+        self.token = _current.set(self)
+        if self.profiler is not None:
+            self.profiler.enable()
+        self.root.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self.root.__exit__(*exc)
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.tracer._profiled(self.profiler)
+        _current.reset(self.token)
+        if self.record:
+            self.tracer._write(self)
+        return False
+
+
+class Tracer:
+    """Samples traces and profiles; see the module docstring for the configuration."""
+
+    def __init__(self, sample_rate=0.0, output="./static/pipeline_traces.jsonl", profile=False,
+                 profile_sample_rate=0.1, profile_output="./static/pipeline.prof", profile_dump_every=50):
+        """
+        :param sample_rate: Share of traces recorded (0 disables tracing).
+        :param output: JSONL file the recorded traces are appended to.
+        :param profile: Whether profiling is on.
+        :param profile_sample_rate: Share of traces run under cProfile while profiling is on.
+        :param profile_output: pstats file the accumulated profile is dumped to.
+        :param profile_dump_every: Dump the profile after this many profiled traces.
+        """
+        self.sample_rate = sample_rate
+        self.output = output
+        self.profile = profile
+        self.profile_sample_rate = profile_sample_rate
+        self.profile_output = profile_output
+        self.profile_dump_every = profile_dump_every
+        # 开启追踪时使用的采样率 (SIGUSR1 切换)
+        self.toggle_rate = sample_rate or 1.0
+        self.trace_ids = itertools.count(1)
+        # Reentrant so that a dump running on the thread that already holds it cannot deadlock
+        self.lock = threading.RLock()
+        self.profile_lock = threading.Lock()
+        self.stats = None
+        self.pending_profiles = 0
+        # Set by the signal handlers; apply_toggles() reports them and dumps the profile
+        self.toggled = False
+        self.watcher = None
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        return cls(
+            sample_rate=float(environ.get("PIPELINE_TRACE_SAMPLE", "0")),
+            output=environ.get("PIPELINE_TRACE_OUTPUT", "./static/pipeline_traces.jsonl"),
+            profile=environ.get("PIPELINE_PROFILE", "0") == "1",
+            profile_sample_rate=float(environ.get("PIPELINE_PROFILE_SAMPLE", "0.1")),
+            profile_output=environ.get("PIPELINE_PROFILE_OUTPUT", "./static/pipeline.prof"),
+        )
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0 or self.profile
+
+    def trace(self, name, **attrs):
+        """Start a trace (a root span) unless this call is not sampled."""
+        if self.toggled:
+            self.apply_toggles()
+        if not (self.sample_rate > 0 or self.profile) or _current.get() is not None:
+            return NOOP
+        record = self.sample_rate > 0 and random.random() < self.sample_rate
+        profiler = None
+        # cProfile 只能同时运行一个: 正在分析其他消息时跳过
+        if self.profile and random.random() < self.profile_sample_rate and self.profile_lock.acquire(False):
+            profiler = cProfile.Profile()
+        if not record and profiler is None:
+            return NOOP
+        return _Trace(self, next(self.trace_ids), name, attrs, record, profiler)
+
+    def _write(self, trace):
+        root = trace.root
+        t0 = root.start
+        spans = [{
+            "name": name,
+            "parent": parent,
+            "start_ms": round((start - t0) * 1000.0, 3),
+            "duration_ms": round(seconds * 1000.0, 3),
+            **attrs,
+        } for name, start, seconds, parent, attrs in trace.spans]
+        for name, _, seconds, _, _ in trace.spans:
+            SPAN_SECONDS.labels(name).observe(seconds)
+        line = json.dumps({
+            "trace_id": trace.trace_id,
+            "pid": os.getpid(),
+            "time": time.time(),
+            "name": root.name,
+            # 根 span 最后结束, 是列表的最后一项
+            "duration_ms": spans[-1]["duration_ms"],
+            "spans": spans,
+        }, default=str)
+        with self.lock:
+            with open(self.output, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def _profiled(self, profiler):
+        try:
+            with self.lock:
+                if self.stats is None:
+                    import pstats
+                    self.stats = pstats.Stats(profiler)
+                else:
+                    self.stats.add(profiler)
+                self.pending_profiles += 1
+                dump = self.pending_profiles >= self.profile_dump_every
+        finally:
+            self.profile_lock.release()
+        if dump:
+            self.dump_profile()
+
+    def dump_profile(self):
+        """Write the accumulated profile to ``profile_output``. :return: The path, or None if empty."""
+        with self.lock:
+            if self.stats is None:
+                return None
+            self.stats.dump_stats(self.profile_output)
+            self.pending_profiles = 0
+        print(f"[Tracing] Profile written to {self.profile_output}")
+        return self.profile_output
+
+    def toggle_tracing(self):
+        if self.sample_rate > 0:
+            self.toggle_rate, self.sample_rate = self.sample_rate, 0.0
+        else:
+            self.sample_rate = self.toggle_rate
+        print(f"[Tracing] Tracing {'on, sample rate ' + str(self.sample_rate) if self.sample_rate else 'off'}")
+
+    def toggle_profiling(self):
+        self.profile = not self.profile
+        print(f"[Tracing] Profiling {'on' if self.profile else 'off'}")
+        if not self.profile:
+            self.dump_profile()
+
+    def signal_tracing(self):
+        """toggle_tracing() for signal handlers: no locks or I/O, apply_toggles() reports it."""
+        if self.sample_rate > 0:
+            self.toggle_rate, self.sample_rate = self.sample_rate, 0.0
+        else:
+            self.sample_rate = self.toggle_rate
+        self.toggled = True
+
+    def signal_profiling(self):
+        """
+        toggle_profiling() for signal handlers. The handler may interrupt a thread in the
+        middle of dump_profile() or print(), so it only flips flags; apply_toggles() does the rest.
+        """
+        self.profile = not self.profile
+        self.toggled = True
+
+    def apply_toggles(self):
+        """Report toggles made by the signal handlers and dump the profile if it was switched off."""
+        if not self.toggled:
+            return
+        self.toggled = False
+        print(f"[Tracing] Tracing {'on, sample rate ' + str(self.sample_rate) if self.sample_rate else 'off'}, "
+              f"profiling {'on' if self.profile else 'off'}")
+        if not self.profile:
+            self.dump_profile()
+
+
+TRACER = Tracer.from_env()
+
+
+def trace(name, **attrs):
+    """Start a trace for one unit of work, e.g. ``with tracing.trace("mqtt.message", topic=t):``."""
+    return TRACER.trace(name, **attrs)
+
+
+def span(name, **attrs):
+    """Time a block inside the current trace; a no-op outside of one."""
+    current = _current.get()
+    if current is None or not current.record:
+        return NOOP
+    return _Span(current, name, attrs)
+
+
+def stages(name):
+    """
+    Time the stages of a loop inside the current trace:
+
+        stage = tracing.stages("predict_7days")
+        for row in rows:
+            stage.skip()
+            ...
+            stage.lap("scale")
+        stage.close()
+    """
+    current = _current.get()
+    if current is None or not current.record:
+        return NOOP
+    return _Stages(current, name)
+
+
+def install_signal_handlers(tracer=None):
+    """
+    SIGUSR1 toggles tracing, SIGUSR2 toggles profiling. Must be called from the main thread.
+    A watcher thread applies the toggles, so the dump also happens while no message arrives.
+    """
+    tracer = tracer or TRACER
+    if not hasattr(signal, "SIGUSR1"):
+        return
+    signal.signal(signal.SIGUSR1, lambda *_: tracer.signal_tracing())
+    signal.signal(signal.SIGUSR2, lambda *_: tracer.signal_profiling())
+    if tracer.watcher is None:
+        def watch():
+            while True:
+                time.sleep(1.0)
+                tracer.apply_toggles()
+
+        tracer.watcher = threading.Thread(target=watch, name="tracing-signals", daemon=True)
+        tracer.watcher.start()